@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import glob
 import pickle
 import numpy as np
@@ -12,6 +13,11 @@ EVENT_DATA_DIR = os.path.join(DATA_DIR, 'Event Data')
 METADATA_DIR = os.path.join(DATA_DIR, 'Metadata')
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
 
+# Event file streaming is shared with the humming backend (stand-alone module there)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+                             'backend_humming', 'api', 'services'))
+from json_stream import iter_json_array, with_next
+
 def load_json(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
@@ -47,9 +53,10 @@ def process_match(file_path, fingerprints, test_mode=False):
         return
 
     print(f"Processing {filename}...")
-    events = load_json(file_path)
+    # Streamed: one event (+ the next one, for the pass end) in memory at a time
+    events = iter_json_array(file_path)
     
-    for i, event in enumerate(events):
+    for event, next_event in with_next(events):
         # We only care about Passes
         pos_evt = event.get('possessionEvents')
         if not pos_evt: continue
@@ -85,8 +92,7 @@ def process_match(file_path, fingerprints, test_mode=False):
         pass_end_x = ball_x # Default to start if no next event
         pass_end_y = ball_y
         
-        if i + 1 < len(events):
-            next_event = events[i+1]
+        if next_event is not None:
             next_ball = next_event.get('ball')
             if next_ball and next_ball[0].get('visibility'):
                  pass_end_x = next_ball[0]['x'] * norm_factor
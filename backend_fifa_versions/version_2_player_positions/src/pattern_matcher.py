@@ -1,7 +1,12 @@
 import numpy as np
 import pickle
 import os
-from scipy.spatial.distance import cdist
+import sys
+
+# Batched Chamfer distance is shared with the humming backend (stand-alone module there)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+                             'backend_humming', 'api', 'services'))
+from chamfer import pad_point_sets, batch_chamfer_distance
 
 class FingerprintDatabase:
     def __init__(self, db_path=None):
@@ -13,6 +18,7 @@ class FingerprintDatabase:
             self.db_path = db_path
             
         self.database = []
+        self.packed = None
         self.load_database()
         
     def load_database(self):
@@ -24,74 +30,61 @@ class FingerprintDatabase:
         else:
             print(f"WARNING: Database not found at {self.db_path}")
             self.database = []
+        self.packed = self._pack(self.database)
 
-    def _chamfer_distance(self, set_a, set_b):
+    def _pack(self, database):
         """
-        Computes Chamfer distance between two point sets (N, 2) and (M, 2).
-        d(A, B) = mean(min_dist(a, B)) + mean(min_dist(b, A))
+        Player constellations of every play as padded arrays (see backend_humming/api/services/chamfer.py),
+        so a query is one batched Chamfer computation instead of a loop.
         """
-        if len(set_a) == 0 or len(set_b) == 0:
-            return float('inf')
-            
-        # Pairwise distances
-        dists = cdist(set_a, set_b, metric='euclidean')
-        
-        # Min distance for each point in A to B
-        min_a_to_b = np.min(dists, axis=1)
-        
-        # Min distance for each point in B to A
-        min_b_to_a = np.min(dists, axis=0)
-        
-        return np.mean(min_a_to_b) + np.mean(min_b_to_a)
+        if not database:
+            return None
+        teammates, tm_counts = pad_point_sets([np.reshape(e['teammates_rel'], (-1, 2)) for e in database])
+        opponents, op_counts = pad_point_sets([np.reshape(e['opponents_rel'], (-1, 2)) for e in database])
+        # (game_id, event_id) -> indices, to skip the query itself
+        plays = {}
+        for i, entry in enumerate(database):
+            plays.setdefault((entry['game_id'], entry['event_id']), []).append(i)
+        return {'teammates': teammates, 'tm_counts': tm_counts,
+                'opponents': opponents, 'op_counts': op_counts, 'plays': plays}
 
-    def find_nearest_neighbors(self, query_play, top_k=5):
+    def find_nearest_neighbors(self, query_play, top_k=5, batch_size=4096):
         """
         Finds similar plays to the query (a dictionary with 'teammates_rel' and 'opponents_rel').
         query_play should be one of the entries from the database (or similar structure).
+        Distance: Chamfer(teammates) + Chamfer(opponents), all plays at once.
         """
         if not self.database:
             return []
+        packed = self.packed
             
         q_teammates = np.array(query_play['teammates_rel'])
         q_opponents = np.array(query_play['opponents_rel'])
         
-        results = []
+        # Shape only (player positions relative to the ball), no absolute field position
+        total_dist = np.empty(len(self.database))
+        for start in range(0, len(self.database), batch_size):
+            batch = slice(start, start + batch_size)
+            dist_team = batch_chamfer_distance(q_teammates, packed['teammates'][batch], packed['tm_counts'][batch])
+            dist_opp = batch_chamfer_distance(q_opponents, packed['opponents'][batch], packed['op_counts'][batch])
+            total_dist[batch] = dist_team + dist_opp
         
-        # Filter: Optionally filter by other attributes (e.g. similar field zone)
-        # to speed up. For now, brute force all.
+        # Skip self
+        candidates = np.ones(len(self.database), dtype=bool)
+        candidates[packed['plays'].get((query_play['game_id'], query_play['event_id']), [])] = False
         
-        for entry in self.database:
-            # Skip self
-            if entry['game_id'] == query_play['game_id'] and entry['event_id'] == query_play['event_id']:
-                continue
-                
-            d_teammates = np.array(entry['teammates_rel'])
-            d_opponents = np.array(entry['opponents_rel'])
-            
-            # Simple heuristic: Skip if player counts are vastly different?
-            # Chamfer handles different sizes, but results might be weird if 10 vs 2.
-            # Let's just compare.
-            
-            dist_team = self._chamfer_distance(q_teammates, d_teammates)
-            dist_opp = self._chamfer_distance(q_opponents, d_opponents)
-            
-            total_dist = dist_team + dist_opp
-            
-            # Bonus: Penalize if ball position is very different?
-            # The prompt asked for "positions of the players", but usually context matters.
-            # We normalized ball to 0,0 relative, but maybe absolute zone matters?
-            # Let's add a small penalty for absolute field position difference if they want "similar play in same area".
-            # If they want "similar shape anywhere", we ignore absolute ball pos.
-            # User said "checking the similar play... similar pass", usually implies shape.
-            # Let's stick to shape (player relative positions).
-            
+        # Stable: equal distances keep database order
+        order = np.flatnonzero(candidates)
+        order = order[np.argsort(total_dist[order], kind='stable')][:top_k]
+        
+        results = []
+        for i in order:
+            entry = self.database[i]
             results.append({
                 'match': entry['game_id'], # We might need to resolve this to Team names later
                 'event_id': entry['event_id'],
                 'timestamp': entry['timestamp'],
-                'distance': total_dist,
+                'distance': float(total_dist[i]),
                 'data': entry # Return full data to visualize easily
             })
-            
-        results.sort(key=lambda x: x['distance'])
-        return results[:top_k]
+        return results
@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
 
 def create_app():
@@ -8,10 +8,18 @@ def create_app():
     CORS(app, resources={r"/*": {"origins": "*"}}) 
     
     # Register Blueprints
-    from api.routes.songs import songs_bp
+    from api.routes.songs import songs_bp, MAX_UPLOAD_BYTES
     from api.routes.fifa import fifa_bp
     
     app.register_blueprint(songs_bp, url_prefix='/api/v1/songs')
     app.register_blueprint(fifa_bp, url_prefix='/api/v1/pass_sequences')
     
+    # Larger requests are refused while werkzeug parses them, before the upload
+    # is spooled to memory or disk (1MB on top of the upload for the form fields)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024
+    
+    @app.errorhandler(413)
+    def request_too_large(e):
+        return jsonify({"status": "failed", "error": f"Request is larger than {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+    
     return app
\ No newline at end of file
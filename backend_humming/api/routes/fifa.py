@@ -1,4 +1,6 @@
 import os
+import re
+import math
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 from api.services.pattern_matcher_v3 import FingerprintDatabaseV3
@@ -14,8 +16,82 @@ if not os.path.exists(DATA_DIR):
     # Fallback to local 'data' if deployed isolation
     DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
 
+# Every pass-length level is loaded at startup and stays resident; requests never
+# swap levels. FIFA_DB_BUDGET_MB caps the resident size (least recently used levels are dropped).
+FIFA_DB_BUDGET_MB = os.environ.get('FIFA_DB_BUDGET_MB')
+
+# Candidates re-ranked with the player term when /detect asks for use_index
+INDEX_CANDIDATES = 200
+
 print(f"Loading database from {DATA_DIR}...")
-db = FingerprintDatabaseV3(base_data_dir=DATA_DIR)
+db = FingerprintDatabaseV3(
+    base_data_dir=DATA_DIR,
+    memory_budget=int(FIFA_DB_BUDGET_MB) * 1024 * 1024 if FIFA_DB_BUDGET_MB else None
+)
+
+def pass_count_from_path(seq_path):
+    """N of a fingerprints_{N}pass / fingerprints_{N}pass.pkl path (last number in the name as a fallback), None if none."""
+    filename = os.path.basename(seq_path.rstrip('/\\'))
+    match = re.search(r'(\d+)pass(\.pkl)?$', filename)
+    if match:
+        return int(match.group(1))
+    digits = re.findall(r'\d+', filename)
+    return int(digits[-1]) if digits else None
+
+def check_pass_count(n_passes):
+    """None if db serves n_passes-pass sequences, else the error response to return."""
+    if isinstance(n_passes, bool) or not isinstance(n_passes, int) or n_passes < 1:
+        return jsonify({"status": "failed", "error": "The number of passes must be a positive integer"}), 400
+    if n_passes > db.max_length:
+        return jsonify({
+            "status": "failed",
+            "error": f"No {n_passes}-pass sequences (the longest chain has {db.max_length} passes)"
+        }), 404
+    return None
+
+def parse_search_params(data):
+    """
+    (max_candidates, zone_radius, None) of a /detect body (None when absent),
+    or (None, None, error response) when either is malformed.
+    """
+    max_candidates = data.get('max_candidates')
+    if max_candidates is not None:
+        if isinstance(max_candidates, str) and re.fullmatch(r'\s*\d+\s*', max_candidates):
+            max_candidates = int(max_candidates)
+        elif isinstance(max_candidates, float) and max_candidates.is_integer():
+            max_candidates = int(max_candidates)
+        if isinstance(max_candidates, bool) or not isinstance(max_candidates, int) or max_candidates < 1:
+            return None, None, (jsonify({"status": "failed", "error": "max_candidates must be a positive integer"}), 400)
+
+    zone_radius = data.get('zone_radius')
+    if zone_radius is not None:
+        try:
+            zone_radius = None if isinstance(zone_radius, bool) else float(zone_radius)
+        except (TypeError, ValueError):
+            zone_radius = None
+        if zone_radius is None or not math.isfinite(zone_radius) or zone_radius <= 0:
+            return None, None, (jsonify({"status": "failed", "error": "zone_radius must be a positive finite number"}), 400)
+
+    return max_candidates, zone_radius, None
+
+def sequence_path_exists(seq_path, n_passes):
+    """
+    Levels come from the shared passes/ table next to fingerprints_{N}pass.pkl
+    or, from older data_processor_v3 runs, that pickle / its converted fingerprints_{N}pass/.
+    Without the file itself, only the served fingerprints_{N}pass(.pkl) names of
+    the database directory are accepted.
+    """
+    if os.path.exists(seq_path):
+        return True
+    parent = os.path.dirname(seq_path.rstrip('/\\'))
+    if not (os.path.isdir(parent) and os.path.samefile(parent, db.data_dir)):
+        return False
+    filename = os.path.basename(seq_path.rstrip('/\\'))
+    if not re.fullmatch(rf'fingerprints_{n_passes}pass(\.pkl)?', filename) or not 1 <= n_passes <= db.max_length:
+        return False
+    if os.path.isdir(os.path.join(parent, 'passes')):
+        return True
+    return filename.endswith('.pkl') and os.path.isdir(seq_path[:-len('.pkl')])
 
 def seconds_to_mm_ss(seconds):
     """Converts seconds (float/int) to MM:SS string."""
@@ -39,41 +115,30 @@ def detect_pass_sequences():
             
         seq_path = data['sequence_path']
         
-        # Try to infer n_passes from filename if not in body
-        import re
-        n_passes_req = data.get('number_of_passes')
-        
-        if n_passes_req:
-             n_passes = int(n_passes_req)
-        else:
-             # Infer from filename
-             filename = os.path.basename(seq_path)
-             match = re.search(r'(\d+)pass\.pkl$', filename)
-             if match:
-                 n_passes = int(match.group(1))
-             else:
-                 # Last resort 
-                 digits = re.findall(r'\d+', filename)
-                 if digits:
-                     n_passes = int(digits[-1])
-                 else:
-                     n_passes = 1 # Fallback default
+        # number_of_passes, or inferred from the filename
+        n_passes = data.get('number_of_passes')
+        if n_passes is None:
+            n_passes = pass_count_from_path(seq_path) or 1
+        elif isinstance(n_passes, str) and n_passes.strip().isdigit():
+            n_passes = int(n_passes)
+        error = check_pass_count(n_passes)
+        if error is not None:
+            return error
         play_idx = data.get('current_play_index', 0)
         match_id_req = data.get('match_id')
 
         # Check file
-        if not os.path.exists(seq_path):
+        if not sequence_path_exists(seq_path, n_passes):
              return jsonify({
                  "status": "failed",
                  "error": f"File not found: {seq_path}"
              }), 404
              
-        # Ensure correct DB level is loaded
-        if db.current_length != n_passes:
-            db.load_level(n_passes)
+        # Resident level for this number of passes (shared, read-only)
+        level = db.get_level(n_passes)
             
         # Filter plays for this match
-        # We assume db.database holds all plays for the current level (n_passes)
+        # level.database holds all plays for this level (n_passes)
         if not match_id_req:
              # Fallback or error if match_id is mandatory? 
              # For backward compatibility maybe try to infer, but user explicitly said "request body has the match id"
@@ -82,30 +147,34 @@ def detect_pass_sequences():
              # Let's enforce match_id for correctness as per user intent.
              return jsonify({"status": "failed", "error": "Missing match_id in request"}), 400
 
-        current_match_plays = [
-            p for p in db.database
-            if str(p['game_id']) == str(match_id_req)
-        ]
-        
-        # Sort by timestamp to ensure consistent indexing
-        current_match_plays.sort(key=lambda x: x['timestamp'])
+        # Per-match index, built when the level was loaded (plays already in time order)
+        n_match_plays = level.match_count(match_id_req)
 
-        if not current_match_plays:
+        if n_match_plays == 0:
              return jsonify({
                 "status": "failed",
                 "error": f"No sequences found for match {match_id_req}"
             }), 404
 
-        if 0 <= play_idx < len(current_match_plays):
-            query_sequence = current_match_plays[play_idx]
-        else:
+        query_sequence = level.match_play(match_id_req, play_idx)
+        if query_sequence is None:
              return jsonify({
                 "status": "failed",
-                "error": f"Index {play_idx} out of bounds (Size: {len(current_match_plays)})"
+                "error": f"Index {play_idx} out of bounds (Size: {n_match_plays})"
              }), 400
             
-        # Search
-        results = db.find_nearest_neighbors(query_sequence, top_k=10)
+        # Search: exact by default; optional candidate budget (approximate), taken
+        # from the level's KD-tree with use_index, and start zone
+        max_candidates, zone_radius, error = parse_search_params(data)
+        if error is not None:
+            return error
+        use_index = bool(data.get('use_index', False))
+        if use_index and max_candidates is None:
+            max_candidates = INDEX_CANDIDATES
+        results = db.find_nearest_neighbors(
+            query_sequence, top_k=10, length=n_passes,
+            max_candidates=max_candidates, zone_radius=zone_radius, use_index=use_index
+        )
         
         if not results:
              return jsonify({
@@ -169,37 +238,25 @@ def get_sequence_count():
         seq_path = data['sequence_path']
         match_id = data.get('match_id')
 
-        if not os.path.exists(seq_path):
-             return jsonify({"status": "failed", "error": f"File not found: {seq_path}"}), 404
-             
         if not match_id:
             return jsonify({"status": "failed", "error": "Missing match_id"}), 400
             
-        # Infer length from filename (e.g. fingerprints_3pass.pkl)
-        # Assuming format ends with "{number}pass.pkl"
-        filename = os.path.basename(seq_path)
-        import re
-        match = re.search(r'(\d+)pass\.pkl$', filename)
-        if match:
-             length = int(match.group(1))
-        else:
-             # Fallback: maybe we assume default 1? or try to load?
-             # Let's try to extract digits from filename if strict regex fails
-             digits = re.findall(r'\d+', filename)
-             if digits:
-                 length = int(digits[-1]) # Take the last number likely to be the pass count
-             else:
-                 return jsonify({"status": "failed", "error": "Could not determine pass length from filename"}), 400
+        # Infer length from filename (e.g. fingerprints_3pass or fingerprints_3pass.pkl)
+        length = pass_count_from_path(seq_path)
+        if length is None:
+            return jsonify({"status": "failed", "error": "Could not determine pass length from filename"}), 400
+        error = check_pass_count(length)
+        if error is not None:
+            return error
+        
+        if not sequence_path_exists(seq_path, length):
+             return jsonify({"status": "failed", "error": f"File not found: {seq_path}"}), 404
              
-        # Load DB level
-        if db.current_length != length:
-            db.load_level(length)
+        # Resident level for this number of passes
+        level = db.get_level(length)
             
-        # Count
-        count = 0
-        for entry in db.database:
-            if str(entry['game_id']) == str(match_id):
-                count += 1
+        # Count (per-match index)
+        count = level.match_count(match_id)
                 
         return jsonify({
             "status": "success",
@@ -1,29 +1,144 @@
 import os
-from flask import Blueprint, request, jsonify
-from werkzeug.utils import secure_filename
+import time
+from flask import Blueprint, request, jsonify, current_app
 from api.services.audio_processor import AudioProcessor
+from api.services.feature_index import FeatureIndex
+from api.services.pcm_cache import PCMCache
+from api.services.song_search import SongSearchEngine
+from api.services.multires_search import MultiResolutionSearch
+from api.services.scoring_pool import ScoringPool
+from api.services.sliding_distance import rank_references
+from api.services.upload_decoder import decode_upload, UploadTooLarge, UploadDecodeError
 
 songs_bp = Blueprint('songs', __name__)
 
 # Initialize the processor
-processor = AudioProcessor()
+# V0_KEY_SEARCH=approximate switches the default path to best-first key search
+# (faster, scores can be lower than exhaustive, see AudioProcessor)
+processor = AudioProcessor(key_search=os.environ.get('V0_KEY_SEARCH', 'exhaustive'))
 
 # --- Configuration ---
 # Update this line to include 'webm'
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'ogg', 'webm'}
 
+# Stretch band (min, max ratio of matched song frames to hum frames) for banded DTW.
+# Same limits as the V3 length penalty.
+STRETCH_BAND = (0.5, 2.0)
+
+# Uploads are decoded in memory up to UPLOAD_MEMORY_LIMIT bytes, larger ones are
+# spilled to a uniquely named file in data/temp; anything above MAX_UPLOAD_BYTES is rejected
+# (requests above it are refused before werkzeug spools them, see create_app)
+UPLOAD_MEMORY_LIMIT = 8 * 1024 * 1024
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+# Seconds an ffmpeg decode of an upload may take
+FFMPEG_TIMEOUT = 30
+
 # Define absolute paths for robustness
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'data', 'temp')
 SONGS_DB_FOLDER = os.path.join(BASE_DIR, 'data', 'songs')
+INDEX_FOLDER = os.path.join(BASE_DIR, 'data', 'index')
+PCM_FOLDER = os.path.join(INDEX_FOLDER, 'pcm')
 
 # Ensure directories exist (Create them if they don't)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(SONGS_DB_FOLDER, exist_ok=True)
 
+# Reference songs are decoded once (shared by all versions), and their features are
+# extracted once per (song, version), both reused across requests
+pcm_cache = PCMCache(SONGS_DB_FOLDER, PCM_FOLDER)
+feature_index = FeatureIndex(SONGS_DB_FOLDER, INDEX_FOLDER, pcm_cache=pcm_cache)
+
+# SCORING_WORKERS > 1 fans song comparisons out over that many warm processes
+# (opt-in; by default scoring stays in the request process).
+SCORING_WORKERS = int(os.environ.get('SCORING_WORKERS', 1))
+scoring_pool = ScoringPool(SCORING_WORKERS) if SCORING_WORKERS > 1 else None
+
+# search=hash looks songs up in the feature index's melody hash index of the version
+MELODY_CANDIDATES = 50 # Songs re-ranked with DTW after the hash lookup
+MASS_CANDIDATES = 50 # Songs re-ranked with DTW after the sliding distance pre-ranking (search=mass)
+
+# search=cascade/hash/mass/multires are approximate. They shortlist this many songs by
+# the best subsequence cost per hum frame, min_j D[-1, j] / N (what their bounds hold for),
+# and re-score only those with score_features, the D[-1, -1] / path_length of
+# search=exhaustive. The two costs do not rank songs the same way (D[-1, -1] is the
+# path forced to end on the song's last frame), so the returned songs and their order
+# can differ from search=exhaustive. cascade re-scores whole songs, so each returned
+# similarity equals the exhaustive one for that song; hash/mass/multires re-score the
+# song segment / window they located.
+RESCORE_CANDIDATES = 20
+
+# search=multires: PAA factors (coarsest first) and refinement radius in frames of each level,
+# overridable per request with 'levels' (e.g. "16,4") and 'radius'
+MULTIRES_LEVELS = (16, 4)
+MULTIRES_RADIUS = 4
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def melody_candidates(version, processor, query_features, reference_songs):
+    """
+    Hash lookup: [(song_file, song segment around the estimated match)] for the
+    best voted songs, or [] when the hum is too short to hash / nothing matched.
+    """
+    # Kept up to date by feature_index.store / prune: only songs never indexed for this
+    # version are extracted here, changed songs are re-hashed once their features are
+    # looked up again (e.g. when they come up as candidates below)
+    index = feature_index.melody_index(version)
+    indexed = set(index.songs())
+    for song_file in reference_songs:
+        if song_file not in indexed:
+            feature_index.get_features(version, processor, song_file)
+
+    # Re-rank on a song segment that can hold the hum at up to 2x slower tempo
+    hum_len = len(query_features)
+    candidates = []
+    for song_file, start, votes in index.query(query_features, max_candidates=MELODY_CANDIDATES):
+        features = feature_index.get_features(version, processor, song_file)
+        lo = max(0, start - hum_len // 2)
+        candidates.append((song_file, features[lo:start + 2 * hum_len + hum_len // 2]))
+    return candidates
+
+def mass_candidates(version, processor, query_features, reference_songs):
+    """
+    Sliding z-normalized distance pre-ranking over a tempo bank of the hum:
+    [(song_file, song segment around the closest window)] for the closest songs.
+    """
+    if len(query_features) < 10:
+        return []
+    references = [(song_file, feature_index.get_features(version, processor, song_file))
+                  for song_file in reference_songs]
+    features = dict(references)
+
+    # Re-rank on the closest window plus half a hum of context on each side
+    margin = len(query_features) // 2
+    candidates = []
+    for song_file, distance, start, length in rank_references(query_features, references,
+                                                              max_candidates=MASS_CANDIDATES):
+        lo = max(0, start - margin)
+        candidates.append((song_file, features[song_file][lo:start + length + margin]))
+    return candidates
+
+def parse_multires_params(form):
+    """(levels, radius) of a search=multires request, (None, None) if either is malformed."""
+    try:
+        levels = form.get('levels')
+        levels = tuple(int(f) for f in levels.split(',')) if levels else MULTIRES_LEVELS
+        radius = int(form.get('radius', MULTIRES_RADIUS))
+    except ValueError:
+        return None, None
+    if not levels or any(f < 1 for f in levels) or radius < 0:
+        return None, None
+    return levels, radius
+
+def format_result(song_file, similarity):
+    return {
+        "song_name": song_file,
+        "artist": "Unknown", 
+        "similarity_index": similarity,
+        "file_url": f"/static/songs/{song_file}" 
+    }
+
 from api.services.audio_processor_v1 import AudioProcessorV1
 from api.services.audio_processor_v2 import AudioProcessorV2
 from api.services.audio_processor_v3 import AudioProcessorV3
@@ -31,8 +146,10 @@ from api.services.audio_processor_v3 import AudioProcessorV3
 @songs_bp.route('/detect', methods=['POST'])
 def detect_song():
     """
-    Receives an audio file (key: 'audio_data') and 'version' parameter.
-    Saves file, compares using selected algorithm.
+    Receives an audio file (key: 'audio_data'), a 'version' parameter and
+    optional 'search' ('exhaustive', 'cascade', 'hash', 'mass' or 'multires'), 'banded' and 'debug' parameters.
+    Decodes the upload, compares using selected algorithm.
+    In debug mode the response also carries per-song scoring times (search=exhaustive).
     """
     # 1. specific check for the file part
     if 'audio_data' not in request.files:
@@ -44,78 +161,160 @@ def detect_song():
         return jsonify({"status": "failed", "error": "No selected file"}), 400
         
     if file and allowed_file(file.filename):
-        # Secure the filename and save to temp folder
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        extension = file.filename.rsplit('.', 1)[1].lower()
         
         try:
             # CHECK VERSION
             version = request.form.get('version', 'v0') # Default too v0
             
+            if version not in ('v1', 'v2', 'v3'):
+                version = 'v0'
+
+            # 'exhaustive' (default) scores every song, 'cascade' prunes with lower bounds
+            # on the best-end cost (approximate, see RESCORE_CANDIDATES),
+            # 'hash' only re-ranks the songs a melody hash lookup returns (v1/v2/v3),
+            # 'mass' the songs closest under a sliding z-normalized distance (v1/v2/v3),
+            # 'multires' locates matches on downsampled features and refines only around them
+            search_mode = request.form.get('search', 'exhaustive')
+            if search_mode == 'multires':
+                levels, radius = parse_multires_params(request.form)
+                if levels is None:
+                    return jsonify({"status": "failed",
+                                    "error": "'levels' must be comma-separated positive integers "
+                                             "and 'radius' an integer >= 0"}), 400
+
+            # banded=true constrains the V1/V2/V3 DTW to STRETCH_BAND (O(hum) memory)
+            band = STRETCH_BAND if request.form.get('banded', 'false').lower() == 'true' else None
+
+            debug = current_app.debug or request.form.get('debug', 'false').lower() == 'true'
+
             if version == 'v1':
-                current_processor = AudioProcessorV1()
+                current_processor = AudioProcessorV1(band=band)
                 print("DEBUG: Using AudioProcessorV1 (Pitch Contour)")
             elif version == 'v2':
-                current_processor = AudioProcessorV2()
+                current_processor = AudioProcessorV2(band=band)
                 print("DEBUG: Using AudioProcessorV2 (Fast Spectrogram Pitch)")
             elif version == 'v3':
-                current_processor = AudioProcessorV3()
+                current_processor = AudioProcessorV3(band=band)
                 print("DEBUG: Using AudioProcessorV3 (Smart Fast Pitch - HPSS)")
             else:
                 current_processor = processor # Default loaded instance
                 print("DEBUG: Using AudioProcessor (Chroma CENS)")
 
+            # Reference features are indexed per version (and feature revision, for
+            # processors whose extraction changed since older indexes were built)
+            revision = getattr(current_processor, 'feature_revision', None)
+            index_version = f'{version}.{revision}' if revision else version
+
             # 2. Load the user's 'humming'
-            user_signal = current_processor.load_audio(filepath)
+            # (decoded straight from the request stream, see upload_decoder.py)
+            user_signal = decode_upload(file.stream, extension, current_processor, UPLOAD_FOLDER,
+                                        memory_limit=UPLOAD_MEMORY_LIMIT, max_bytes=MAX_UPLOAD_BYTES,
+                                        ffmpeg_timeout=FFMPEG_TIMEOUT)
             
             results = []
+            timings = {} # song_file -> seconds spent scoring it (debug mode)
             
             # 3. Check if we have any reference songs to compare against
             print(f"DEBUG: Searching for songs in: {SONGS_DB_FOLDER}")
             reference_songs = [f for f in os.listdir(SONGS_DB_FOLDER) if allowed_file(f)]
             
             if not reference_songs:
-                os.remove(filepath)
                 return jsonify({
                     "status": "success", 
                     "message": "No reference songs found in data/songs/. Please add .wav files to test.",
                     "results": []
                 }), 200
 
+            # Forget songs that were removed from the folder since the last request
+            feature_index.prune(reference_songs)
+            pcm_cache.prune(reference_songs)
+
             # 4. Loop through database songs and compare
-            for song_file in reference_songs:
-                song_path = os.path.join(SONGS_DB_FOLDER, song_file)
-                
-                # Load reference song
-                db_signal = current_processor.load_audio(song_path)
-                
-                # Calculate Similarity
-                similarity = current_processor.compare_audio(user_signal, db_signal)
-                
-                results.append({
-                    "song_name": song_file,
-                    "artist": "Unknown", 
-                    "similarity_index": similarity,
-                    "file_url": f"/static/songs/{song_file}" 
-                })
-            
-            # 5. Sort results: Highest similarity first
-            results.sort(key=lambda x: x['similarity_index'], reverse=True)
+            # The hum is analysed once; every song is scored against these features
+            query_features = current_processor.extract_features(user_signal)
+            if search_mode in ('cascade', 'hash', 'mass', 'multires'):
+                references = []
+                if search_mode == 'hash' and version != 'v0':
+                    references = melody_candidates(index_version, current_processor, query_features, reference_songs)
+                    print(f"DEBUG: Melody hash lookup returned {len(references)} candidates")
+                elif search_mode == 'mass' and version != 'v0':
+                    references = mass_candidates(index_version, current_processor, query_features, reference_songs)
+                    print(f"DEBUG: Sliding distance pre-ranking returned {len(references)} candidates")
+                if not references:
+                    references = [
+                        (song_file, feature_index.get_features(index_version, current_processor, song_file))
+                        for song_file in reference_songs
+                    ]
+                if search_mode == 'multires':
+                    # Coarse-to-fine: full resolution DTW only inside windows around coarse matches
+                    engine = MultiResolutionSearch(current_processor, top_k=RESCORE_CANDIDATES,
+                                                   levels=levels, radius=radius)
+                else:
+                    # Lower-bound cascade: exact DTW only for songs that can still reach the shortlist
+                    engine = SongSearchEngine(current_processor, top_k=RESCORE_CANDIDATES)
+                features = dict(references)
+                for song_file, _ in engine.search(query_features, references):
+                    # Shortlisted songs get the exhaustive score (multires: on the window it matched)
+                    db_features = features[song_file]
+                    if search_mode == 'multires':
+                        lo, hi = engine.last_windows[song_file]
+                        db_features = db_features[..., lo:hi]
+                    similarity = current_processor.score_features(query_features, db_features)
+                    results.append(format_result(song_file, similarity))
+                print(f"DEBUG: {search_mode} search stats: {engine.last_stats}")
+                timings = None # Songs are pruned / searched together, no per-song times
+            elif scoring_pool is not None:
+                # Index new/changed songs in parallel, then score every song on the pool
+                locations = {song_file: feature_index.locate(index_version, song_file) for song_file in reference_songs}
+                stale = [song_file for song_file, location in locations.items() if location is None]
+                # Taken before the workers read the songs, so a song edited meanwhile stays stale
+                snapshots = {song_file: feature_index.snapshot(song_file) for song_file in stale}
+                pcm_paths, pcm_dir = {}, None
+                if current_processor.sample_rate == pcm_cache.sample_rate:
+                    pcm_paths = {song_file: pcm_cache.path(song_file) for song_file in stale}
+                    pcm_dir = pcm_cache.index_dir
+                for song_file, features, new_pcm_path in scoring_pool.extract(
+                        current_processor, SONGS_DB_FOLDER, stale, pcm_paths, pcm_dir):
+                    if new_pcm_path is not None:
+                        pcm_cache.adopt(song_file, new_pcm_path, snapshots[song_file])
+                    locations[song_file] = feature_index.store(index_version, song_file, features, snapshots[song_file])
+
+                references = [(song_file,) + locations[song_file] for song_file in reference_songs]
+                for song_file, similarity, seconds in scoring_pool.score(current_processor, query_features, references):
+                    results.append(format_result(song_file, similarity))
+                    timings[song_file] = round(seconds, 4)
+            else:
+                for song_file in reference_songs:
+                    start = time.time()
+                    # Reference features come from the index (decoded + extracted only once)
+                    db_features = feature_index.get_features(index_version, current_processor, song_file)
+                    
+                    # Calculate Similarity
+                    similarity = current_processor.score_features(query_features, db_features)
+                    
+                    results.append(format_result(song_file, similarity))
+                    timings[song_file] = round(time.time() - start, 4)
             
-            # Cleanup: Remove the temp user file
-            os.remove(filepath)
+            # 5. Sort results: Highest similarity first, ties by song name (the pool
+            # yields in completion order, so the order must not depend on it)
+            results.sort(key=lambda x: (-x['similarity_index'], x['song_name']))
             
-            return jsonify({
+            response = {
                 "status": "success",
                 "matched_songs_found": len(results),
                 "results": results[:10]  # Return top 10
-            }), 200
+            }
+            if debug and timings is not None:
+                response["timings"] = timings
+            
+            return jsonify(response), 200
             
+        except UploadTooLarge as e:
+            return jsonify({"status": "failed", "error": str(e)}), 413
+        except UploadDecodeError as e:
+            return jsonify({"status": "failed", "error": str(e)}), 400
         except Exception as e:
-            # Cleanup on error
-            if os.path.exists(filepath):
-                os.remove(filepath)
             print(f"ERROR: {e}")
             import traceback
             traceback.print_exc()
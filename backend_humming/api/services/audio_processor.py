@@ -1,10 +1,21 @@
 import librosa
 import numpy as np
 from scipy import signal as scipy_signal
+from api.services.dtw_utils import subsequence_dtw_cost, subsequence_dtw_score
 
 class AudioProcessor:
-    def __init__(self, sample_rate=22050):
+    def __init__(self, sample_rate=22050, key_search='exhaustive', max_cost_cells=2 ** 24):
         self.sample_rate = sample_rate
+        # Key invariance strategy:
+        # 'exhaustive'  -> DTW against all 12 keys (original scoring)
+        # 'approximate' -> best-first over keys on the best subsequence cost per hum
+        #                  frame, dropping keys that can no longer beat the best one;
+        #                  only the winning key is scored like 'exhaustive'. That cost
+        #                  is not the D[-1, -1] / path_length the score is built on, so
+        #                  the key (and similarity) can differ: never above 'exhaustive'
+        self.key_search = key_search
+        # Max number of cost-matrix cells built by one batched product (~128MB of float64)
+        self.max_cost_cells = max_cost_cells
 
     def load_audio(self, file_path):
         """Loads audio and converts to mono."""
@@ -59,36 +70,130 @@ class AudioProcessor:
         
         return chroma_cens
 
-    def compare_audio(self, user_signal, db_signal):
+    def extract_features(self, signal):
+        """Features of a reference (what the feature index stores) or of the hum (see score_features)."""
+        return self.extract_chroma_features(signal)
+
+    def shifted_cost_matrices(self, user_chroma, db_chroma, shifts):
         """
-        Compares signals using DTW on Chroma CENS features.
+        Cosine cost matrices of the key-shifted user chroma against db_chroma,
+        for all requested shifts in one batched product.
+        Rolling the pitch-class axis is a circulant permutation, so every shift
+        is just a re-indexing of the unit-normalized user chroma and the whole
+        batch is a single (S, N, 12) x (12, M) matmul.
+        Returns an array of shape (len(shifts), N, M).
         """
-        # Extract features
-        user_chroma = self.extract_chroma_features(user_signal)
-        db_chroma = self.extract_chroma_features(db_signal)
+        # Zero columns give NaN here, exactly like cdist(metric='cosine')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            user_unit = user_chroma / np.linalg.norm(user_chroma, axis=0, keepdims=True)
+            db_unit = db_chroma / np.linalg.norm(db_chroma, axis=0, keepdims=True)
         
-        min_cost = float('inf')
+        # np.roll(x, s, axis=0)[c] == x[(c - s) % 12]
+        shifts = np.asarray(shifts)
+        roll_index = (np.arange(12)[None, :] - shifts[:, None]) % 12
+        user_rolled = user_unit[roll_index] # (S, 12, N)
+        
+        similarity = np.matmul(user_rolled.transpose(0, 2, 1), db_unit) # (S, N, M)
+        return np.clip(1.0 - similarity, 0.0, 2.0)
 
-        # --- KEY INVARIANCE ---
-        # Try all 12 musical keys to find the best match
-        for shift in range(12):
-            # Roll the chroma vector for key invariance
-            user_shifted = np.roll(user_chroma, shift, axis=0)
-            
-            # --- DTW ---
-            # CENS features are already normalized and smoothed.
-            # 'cosine' distance is still effective, or 'euclidean'.
-            # Librosa docs suggest euclidean for CENS often, but cosine is good for orientation.
-            # Let's stick with cosine for now as it handles amplitude differences well.
-            D, wp = librosa.sequence.dtw(X=user_shifted, Y=db_chroma, metric='cosine', subseq=True)
+    def _shift_batches(self, n_frames, m_frames):
+        """Splits the 12 shifts into batches that respect max_cost_cells."""
+        batch_size = int(np.clip(self.max_cost_cells // max(1, n_frames * m_frames), 1, 12))
+        return [list(range(start, min(12, start + batch_size))) for start in range(0, 12, batch_size)]
+
+    def _path_cost(self, C):
+        """D[-1, -1] / path_length of a subsequence DTW on C (the original score)."""
+        # librosa transposes the cost itself when the hum is longer than
+        # the song, but only when it builds C from X/Y
+        if C.shape[0] > C.shape[1]:
+            C = C.T
+        
+        # --- DTW ---
+        # CENS features are already normalized and smoothed.
+        # 'cosine' distance handles amplitude differences well.
+        # Same D[-1, -1] and path length as librosa.sequence.dtw(C=C, subseq=True),
+        # from two rows of the accumulated cost (no matrix, no backtracking)
+        cost, path_length, _, _ = subsequence_dtw_score(C)
+        
+        # Normalize cost
+        return cost / path_length
+
+    def _exhaustive_key_cost(self, user_chroma, db_chroma):
+        """Original scoring: min over all 12 keys of D[-1, -1] / path_length."""
+        min_cost = float('inf')
+        n_frames, m_frames = user_chroma.shape[1], db_chroma.shape[1]
+        
+        for shifts in self._shift_batches(n_frames, m_frames):
+            costs = self.shifted_cost_matrices(user_chroma, db_chroma, shifts)
             
-            # Normalize cost
-            path_length = wp.shape[0]
-            current_cost = D[-1, -1] / path_length
+            for C in costs:
+                current_cost = self._path_cost(C)
+                
+                if current_cost < min_cost:
+                    min_cost = current_cost
+        
+        return min_cost
+
+    def _early_abandon_key(self, user_chroma, db_chroma, abandon_above=float('inf')):
+        """
+        (best subsequence cost per hum frame over all 12 keys, its key shift).
+        Keys are tried in order of a cheap lower bound (every hum frame is matched
+        at least once, so the sum of row minima bounds the alignment cost) and
+        dropped as soon as that bound, or the partial DTW, reaches the best cost.
+        Returns (inf, None) if no key can get below abandon_above.
+        """
+        best_cost, best_shift = float('inf'), None
+        n_frames, m_frames = user_chroma.shape[1], db_chroma.shape[1]
+        
+        for shifts in self._shift_batches(n_frames, m_frames):
+            costs = self.shifted_cost_matrices(user_chroma, db_chroma, shifts)
+            bounds = costs.min(axis=2).sum(axis=1) / n_frames
             
-            if current_cost < min_cost:
-                min_cost = current_cost
+            for i in np.argsort(bounds, kind='stable'):
+                if bounds[i] >= best_cost or bounds[i] > abandon_above:
+                    break # Sorted, so no remaining key in this batch can win
+                
+                limit = min(best_cost, abandon_above)
+                cost = subsequence_dtw_cost(costs[i], abandon_above=limit * n_frames) / n_frames
+                if cost < best_cost:
+                    best_cost, best_shift = cost, shifts[i]
+        
+        return best_cost, best_shift
+
+    def _early_abandon_key_cost(self, user_chroma, db_chroma, abandon_above=float('inf')):
+        """
+        Best subsequence cost per hum frame over all 12 keys: min_j D[-1, j] / N,
+        not the D[-1, -1] / path_length of the original score (a different scale).
+        Returns inf if no key can get below abandon_above.
+        """
+        return self._early_abandon_key(user_chroma, db_chroma, abandon_above)[0]
+
+    # --- Search engine interface (see song_search.py) ---
+
+    def search_bounds(self, user_chroma, db_chroma):
+        """
+        Lower bounds on search_cost, cheapest first.
+        LB_Kim style envelope: CENS is non-negative, so for unit vectors
+        cos(q, y_m) <= q . max_m(y_m), whatever frame the hum is matched to.
+        (The row-minimum bound is applied per key inside search_cost.)
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            user_unit = user_chroma / np.linalg.norm(user_chroma, axis=0, keepdims=True)
+            db_unit = db_chroma / np.linalg.norm(db_chroma, axis=0, keepdims=True)
+        envelope = db_unit.max(axis=1)
+        
+        # Shifting the hum by s == reading the envelope at (c + s) % 12
+        roll_index = (np.arange(12)[None, :] + np.arange(12)[:, None]) % 12
+        upper_similarity = envelope[roll_index] @ user_unit # (12 keys, N)
+        per_key = np.clip(1.0 - upper_similarity, 0.0, 2.0).sum(axis=1)
+        yield float(np.min(per_key)) / user_chroma.shape[1]
 
+    def search_cost(self, user_chroma, db_chroma, abandon_above=float('inf')):
+        """Key-invariant best subsequence cost per hum frame (inf if above abandon_above)."""
+        return self._early_abandon_key_cost(user_chroma, db_chroma, abandon_above)
+
+    def cost_to_similarity(self, cost):
+        """Maps a DTW cost to the 0-100 similarity index."""
         # --- CONVERT COST TO SIMILARITY ---
         # Relaxed Scoring for Real-World Usage
         # Previous settings (sigma=0.21, gamma=4) were too harsh ("The Wall").
@@ -98,6 +203,38 @@ class AudioProcessor:
         sigma = 0.30 
         gamma = 2    
         
-        similarity = 100 * np.exp(- (min_cost / sigma) ** gamma)
+        similarity = 100 * np.exp(- (cost / sigma) ** gamma)
+        
+        return round(float(similarity), 2)
+
+    def compare_audio(self, user_signal, db_signal):
+        """
+        Compares signals using DTW on Chroma CENS features.
+        """
+        return self.compare_with_reference(user_signal, self.extract_features(db_signal))
+
+    def compare_with_reference(self, user_signal, db_chroma):
+        """
+        Same as compare_audio, but against precomputed reference chroma.
+        """
+        return self.score_features(self.extract_features(user_signal), db_chroma)
+
+    def score_features(self, user_chroma, db_chroma):
+        """
+        Similarity of query features (extract_features of the hum, computed
+        once per request) to reference features.
+        """
         
-        return round(float(similarity), 2)
\ No newline at end of file
+        # --- KEY INVARIANCE ---
+        # Try all 12 musical keys to find the best match
+        if self.key_search == 'approximate':
+            # The key is picked on the per-hum-frame cost, then scored like the
+            # exhaustive search so both give similarities on the same scale
+            _, shift = self._early_abandon_key(user_chroma, db_chroma)
+            if shift is None:
+                return self.cost_to_similarity(float('inf'))
+            min_cost = self._path_cost(self.shifted_cost_matrices(user_chroma, db_chroma, [shift])[0])
+        else:
+            min_cost = self._exhaustive_key_cost(user_chroma, db_chroma)
+
+        return self.cost_to_similarity(min_cost)
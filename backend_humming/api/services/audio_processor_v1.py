@@ -1,10 +1,16 @@
 import librosa
 import numpy as np
 from scipy.spatial.distance import euclidean
+from api.services.dtw_utils import (subsequence_dtw_cost, contour_cost_matrix, banded_subsequence_dtw,
+                                    contour_subsequence_dtw_score,
+                                    contour_envelope_bound, contour_nearest_value_bound)
 
 class AudioProcessorV1:
-    def __init__(self, sample_rate=22050):
+    def __init__(self, sample_rate=22050, band=None):
         self.sample_rate = sample_rate
+        # Optional (min_ratio, max_ratio) stretch band for the DTW, e.g. (0.5, 2.0).
+        # None keeps the unconstrained hum x song DTW.
+        self.band = band
 
     def load_audio(self, file_path):
         """Loads audio and converts to mono."""
@@ -52,13 +58,27 @@ class AudioProcessorV1:
         
         return normalized_pitch
 
+    def extract_features(self, signal):
+        """Features of a reference (what the feature index stores) or of the hum (see score_features)."""
+        return self.extract_pitch_features(signal)
+
     def compare_audio(self, user_signal, db_signal):
         """
         Compares signals using DTW on Pitch Contours.
         """
-        # Extract features
-        user_pitch = self.extract_pitch_features(user_signal)
-        db_pitch = self.extract_pitch_features(db_signal)
+        return self.compare_with_reference(user_signal, self.extract_features(db_signal))
+
+    def compare_with_reference(self, user_signal, db_pitch):
+        """
+        Same as compare_audio, but against a precomputed reference contour.
+        """
+        return self.score_features(self.extract_features(user_signal), db_pitch)
+
+    def score_features(self, user_pitch, db_pitch):
+        """
+        Similarity of query features (extract_features of the hum, computed
+        once per request) to reference features.
+        """
         
         # Handle cases where no pitch was found
         if len(user_pitch) < 10 or len(db_pitch) < 10:
@@ -66,20 +86,43 @@ class AudioProcessorV1:
             
         # --- DTW ---
         # Compare 1D arrays using Euclidean distance
-        # We need to reshape for librosa.sequence.dtw if using it, 
-        # but librosa dtw takes (d, n) and (d, m). 
-        # Here we have 1D arrays (n,) and (m,). Reshape to (1, n).
-        
-        user_pitch_2d = user_pitch.reshape(1, -1)
-        db_pitch_2d = db_pitch.reshape(1, -1)
         
-        # Subsequence DTW allows the hum to match a part of the song
-        D, wp = librosa.sequence.dtw(X=user_pitch_2d, Y=db_pitch_2d, metric='euclidean', subseq=True)
-        
-        # Normalize cost
-        path_length = wp.shape[0]
-        min_cost = D[-1, -1] / path_length
+        if self.band is not None:
+            # Banded: same D[-1, -1] / path_length as below, over the paths inside the
+            # band; memory is O(hum length), the full matrix is never built
+            cost, path_length, _, _ = banded_subsequence_dtw(user_pitch, db_pitch, self.band)
+            if not np.isfinite(cost):
+                return 0.0
+            min_cost = cost / path_length
+        else:
+            # Subsequence DTW allows the hum to match a part of the song
+            # (librosa's D[-1, -1] and path length, kept in two rows)
+            cost, path_length, _, _ = contour_subsequence_dtw_score(user_pitch, db_pitch)
+            
+            # Normalize cost
+            min_cost = cost / path_length
         
+        return self.cost_to_similarity(min_cost)
+
+    # --- Search engine interface (see song_search.py) ---
+
+    def search_bounds(self, user_pitch, db_pitch):
+        """Lower bounds on search_cost, cheapest first (LB_Kim, then LB_Keogh)."""
+        if len(user_pitch) < 10 or len(db_pitch) < 10:
+            return
+        yield contour_envelope_bound(user_pitch, db_pitch)
+        yield contour_nearest_value_bound(user_pitch, db_pitch)
+
+    def search_cost(self, user_pitch, db_pitch, abandon_above=float('inf')):
+        """Best subsequence DTW cost per hum frame (inf if above abandon_above)."""
+        if len(user_pitch) < 10 or len(db_pitch) < 10:
+            return float('inf')
+        C = contour_cost_matrix(user_pitch, db_pitch)
+        n_frames = len(user_pitch)
+        return subsequence_dtw_cost(C, abandon_above=abandon_above * n_frames) / n_frames
+
+    def cost_to_similarity(self, cost):
+        """Maps a DTW cost to the 0-100 similarity index."""
         # --- CONVERT COST TO SIMILARITY ---
         # Cost is in semitones (average error).
         # 0.5 semitones off is amazing.
@@ -91,6 +134,6 @@ class AudioProcessorV1:
         # If cost = 3 (semitones), similarity = 0
         
         threshold = 4.0 # Tolerance in semitones
-        similarity = max(0, (1 - (min_cost / threshold)) * 100)
+        similarity = max(0, (1 - (cost / threshold)) * 100)
         
         return round(float(similarity), 2)
@@ -1,10 +1,16 @@
 import librosa
 import numpy as np
 from scipy.spatial.distance import euclidean
+from api.services.dtw_utils import (subsequence_dtw_cost, contour_cost_matrix, banded_subsequence_dtw,
+                                    contour_subsequence_dtw_score,
+                                    contour_envelope_bound, contour_nearest_value_bound)
 
 class AudioProcessorV2:
-    def __init__(self, sample_rate=22050):
+    def __init__(self, sample_rate=22050, band=None):
         self.sample_rate = sample_rate
+        # Optional (min_ratio, max_ratio) stretch band for the DTW, e.g. (0.5, 2.0).
+        # None keeps the unconstrained hum x song DTW.
+        self.band = band
 
     def load_audio(self, file_path):
         """Loads audio and converts to mono."""
@@ -14,6 +20,15 @@ class AudioProcessorV2:
         except Exception as e:
             raise ValueError(f"Error loading audio file: {e}")
 
+    @staticmethod
+    def dominant_pitch(pitches, magnitudes):
+        """
+        Pitch of the strongest bin in every frame.
+        axis=0 is frequency bins, axis=1 is time frames.
+        """
+        index = magnitudes.argmax(axis=0)
+        return pitches[index, np.arange(magnitudes.shape[1])]
+
     def extract_pitch_contour(self, signal):
         """
         Extracts dominant pitch using librosa.piptrack (Fast STFT based).
@@ -23,22 +38,12 @@ class AudioProcessorV2:
         pitches, magnitudes = librosa.piptrack(y=signal, sr=self.sample_rate)
         
         # 2. Extract Dominant Pitch
-        # For each time bin, find the index of the max magnitude
-        pitch_contour = []
+        pitch = self.dominant_pitch(pitches, magnitudes)
         
-        # We can do this efficiently with numpy argmax
-        # axis=0 is frequency bins, axis=1 is time frames
-        for t in range(magnitudes.shape[1]):
-            index = magnitudes[:, t].argmax()
-            pitch = pitches[index, t]
-            
-            # 3. Filter Silence / No Pitch
-            # If pitch is 0 or magnitude is very low, treat as silence
-            # (piptrack can return 0 if no peak found)
-            if pitch > 0:
-                 pitch_contour.append(pitch)
-        
-        pitch_contour = np.array(pitch_contour)
+        # 3. Filter Silence / No Pitch
+        # If pitch is 0 or magnitude is very low, treat as silence
+        # (piptrack can return 0 if no peak found)
+        pitch_contour = pitch[pitch > 0]
         
         if len(pitch_contour) == 0:
             return np.array([])
@@ -54,32 +59,71 @@ class AudioProcessorV2:
         
         return normalized_pitch
 
+    def extract_features(self, signal):
+        """Features of a reference (what the feature index stores) or of the hum (see score_features)."""
+        return self.extract_pitch_contour(signal)
+
     def compare_audio(self, user_signal, db_signal):
         """
         Compares signals using DTW on Fast Pitch Contours.
         """
-        # Extract features
-        user_pitch = self.extract_pitch_contour(user_signal)
-        db_pitch = self.extract_pitch_contour(db_signal)
+        return self.compare_with_reference(user_signal, self.extract_features(db_signal))
+
+    def compare_with_reference(self, user_signal, db_pitch):
+        """
+        Same as compare_audio, but against a precomputed reference contour.
+        """
+        return self.score_features(self.extract_features(user_signal), db_pitch)
+
+    def score_features(self, user_pitch, db_pitch):
+        """
+        Similarity of query features (extract_features of the hum, computed
+        once per request) to reference features.
+        """
         
         # Handle cases where no pitch was found
         if len(user_pitch) < 10 or len(db_pitch) < 10:
             return 0.0
             
         # --- DTW ---
-        user_pitch_2d = user_pitch.reshape(1, -1)
-        db_pitch_2d = db_pitch.reshape(1, -1)
-        
-        # Subsequence DTW
-        D, wp = librosa.sequence.dtw(X=user_pitch_2d, Y=db_pitch_2d, metric='euclidean', subseq=True)
-        
-        # Normalize cost
-        path_length = wp.shape[0]
-        min_cost = D[-1, -1] / path_length
+        if self.band is not None:
+            # Banded: same D[-1, -1] / path_length as below, over the paths inside the
+            # band; memory is O(hum length), the full matrix is never built
+            cost, path_length, _, _ = banded_subsequence_dtw(user_pitch, db_pitch, self.band)
+            if not np.isfinite(cost):
+                return 0.0
+            min_cost = cost / path_length
+        else:
+            # Subsequence DTW (librosa's D[-1, -1] and path length, kept in two rows)
+            cost, path_length, _, _ = contour_subsequence_dtw_score(user_pitch, db_pitch)
+            
+            # Normalize cost
+            min_cost = cost / path_length
         
+        return self.cost_to_similarity(min_cost)
+
+    # --- Search engine interface (see song_search.py) ---
+
+    def search_bounds(self, user_pitch, db_pitch):
+        """Lower bounds on search_cost, cheapest first (LB_Kim, then LB_Keogh)."""
+        if len(user_pitch) < 10 or len(db_pitch) < 10:
+            return
+        yield contour_envelope_bound(user_pitch, db_pitch)
+        yield contour_nearest_value_bound(user_pitch, db_pitch)
+
+    def search_cost(self, user_pitch, db_pitch, abandon_above=float('inf')):
+        """Best subsequence DTW cost per hum frame (inf if above abandon_above)."""
+        if len(user_pitch) < 10 or len(db_pitch) < 10:
+            return float('inf')
+        C = contour_cost_matrix(user_pitch, db_pitch)
+        n_frames = len(user_pitch)
+        return subsequence_dtw_cost(C, abandon_above=abandon_above * n_frames) / n_frames
+
+    def cost_to_similarity(self, cost):
+        """Maps a DTW cost to the 0-100 similarity index."""
         # --- CONVERT COST TO SIMILARITY ---
         # Same logic as V1: Cost in semitones
         threshold = 4.0 
-        similarity = max(0, (1 - (min_cost / threshold)) * 100)
+        similarity = max(0, (1 - (cost / threshold)) * 100)
         
         return round(float(similarity), 2)
@@ -2,10 +2,21 @@ import librosa
 import numpy as np
 from scipy.signal import medfilt
 from scipy.spatial.distance import euclidean
+from api.services.dtw_utils import (subsequence_dtw_cost, contour_cost_matrix, banded_subsequence_dtw,
+                                    subsequence_dtw_score, contour_subsequence_dtw_score,
+                                    contour_envelope_bound, contour_nearest_value_bound)
+from api.services.harmonic_pitch import harmonic_piptrack
 
 class AudioProcessorV3:
-    def __init__(self, sample_rate=22050):
+    # Changes whenever extract_features does, so the reference features indexed
+    # by an older pipeline (hpss round trip through the time domain) are not reused
+    feature_revision = 'stft'
+
+    def __init__(self, sample_rate=22050, band=None):
         self.sample_rate = sample_rate
+        # Optional (min_ratio, max_ratio) stretch band for the DTW, e.g. (0.5, 2.0).
+        # None keeps the unconstrained hum x song DTW.
+        self.band = band
 
     def load_audio(self, file_path):
         """Loads audio and converts to mono."""
@@ -15,45 +26,47 @@ class AudioProcessorV3:
         except Exception as e:
             raise ValueError(f"Error loading audio file: {e}")
 
+    @staticmethod
+    def dominant_pitch(pitches, magnitudes, threshold_ratio=0.10):
+        """
+        Pitch of the strongest bin in every frame, 0 where the frame has no
+        pitch or its peak is below threshold_ratio of the global max magnitude.
+        """
+        frames = np.arange(magnitudes.shape[1])
+        index = magnitudes.argmax(axis=0)
+        pitch = pitches[index, frames]
+        mag = magnitudes[index, frames]
+        
+        mag_threshold = np.max(magnitudes) * threshold_ratio  # Must be > 10% of max loudness to count
+        
+        # Pad with 0 for silence (will trim later)
+        voiced = (pitch > 0) & (mag > mag_threshold)
+        return np.where(voiced, pitch, 0).astype(np.float64)
+
     def extract_pitch_contour(self, signal):
         """
         Extracts dominant pitch with refined accuracy steps:
-        1. HPSS (Vocal Isolation)
-        2. pip_track constrained to Vocal Range (80-1000Hz)
+        1. HPSS (Vocal Isolation), as a mask on the STFT magnitude
+        2. pip_track on the masked magnitude, constrained to Vocal Range (80-1000Hz)
         3. Global Thresholding
         4. Silence Trimming
         5. Z-Score Normalization
         """
         # 1. Vocal Isolation (HPSS)
-        # Separate harmonic (vocals) from percussive (drums)
-        y_harmonic, _ = librosa.effects.hpss(signal)
+        # Separate harmonic (vocals) from percussive (drums) on the spectrogram:
+        # one STFT, no round trip through a harmonic signal (see harmonic_pitch.py)
         
         # 2. Fast Tracking with Human Vocal Range Constraints
         # fmin=80Hz (~Low E2), fmax=1000Hz (~High C6) covers reasonable humming range
-        pitches, magnitudes = librosa.piptrack(
-            y=y_harmonic, 
+        pitches, magnitudes = harmonic_piptrack(
+            signal,
             sr=self.sample_rate,
             fmin=80,
             fmax=1000
         )
         
         # 3. Smart Thresholding (Global)
-        pitch_contour = []
-        global_max_mag = np.max(magnitudes)
-        mag_threshold = global_max_mag * 0.10  # Must be > 10% of max loudness to count
-        
-        for t in range(magnitudes.shape[1]):
-            index = magnitudes[:, t].argmax()
-            pitch = pitches[index, t]
-            mag = magnitudes[index, t]
-            
-            if pitch > 0 and mag > mag_threshold:
-                 pitch_contour.append(pitch)
-            else:
-                 # Pad with 0 for silence (will trim later)
-                 pitch_contour.append(0)
-        
-        pitch_contour = np.array(pitch_contour)
+        pitch_contour = self.dominant_pitch(pitches, magnitudes)
         
         # 4. Smoothing
         if len(pitch_contour) > 5:
@@ -86,46 +99,74 @@ class AudioProcessorV3:
         
         return normalized_pitch
 
+    def extract_features(self, signal):
+        """Features of a reference (what the feature index stores) or of the hum (see score_features)."""
+        return self.extract_pitch_contour(signal)
+
     def compare_audio(self, user_signal, db_signal):
         """
         Compares signals using DTW on Refined Pitch Contours.
         Includes penalty for extreme length variation.
         """
-        # Extract features
-        user_pitch = self.extract_pitch_contour(user_signal)
-        db_pitch = self.extract_pitch_contour(db_signal)
+        return self.compare_with_reference(user_signal, self.extract_features(db_signal))
+
+    def compare_with_reference(self, user_signal, db_pitch):
+        """
+        Same as compare_audio, but against a precomputed reference contour.
+        """
+        return self.score_features(self.extract_features(user_signal), db_pitch)
+
+    def score_features(self, user_pitch, db_pitch):
+        """
+        Similarity of query features (extract_features of the hum, computed
+        once per request) to reference features.
+        """
         
         # Handle cases where no pitch was found
         if len(user_pitch) < 10 or len(db_pitch) < 10:
             return 0.0
             
         # --- DTW ---
-        user_pitch_2d = user_pitch.reshape(1, -1)
-        db_pitch_2d = db_pitch.reshape(1, -1)
-        
-        # Subsequence DTW
-        D, wp = librosa.sequence.dtw(X=user_pitch_2d, Y=db_pitch_2d, metric='euclidean', subseq=True)
+        if self.band is not None:
+            # Banded: same D[-1, -1] / path_length and matched span as below, over the
+            # paths inside the band; memory is O(hum length), the matrix is never built.
+            # The band already keeps the stretch ratio inside self.band.
+            cost, path_length, start, end = banded_subsequence_dtw(user_pitch, db_pitch, self.band)
+            if not np.isfinite(cost):
+                return 0.0
+            match_cost = cost / path_length
+            matched_segment_len = end - start
+            return self.cost_to_similarity(match_cost + self.length_penalty(len(user_pitch), matched_segment_len))
+        
+        # Subsequence DTW: librosa's D[-1, -1], path length and matched song span,
+        # kept in two rows (no cost matrix, no backtracking)
+        cost, path_length, start, end = contour_subsequence_dtw_score(user_pitch, db_pitch)
         
         # Raw Match Cost
-        path_length = wp.shape[0]
-        match_cost = D[-1, -1] / path_length
+        match_cost = cost / path_length
         
         # --- PENALTY LOGIC ---
         # Did we match a tiny fragment?
         # User hum length (N) vs Matched Subsequence Length (M)
-        # wp[:, 0] are indices in User (X)
-        # wp[:, 1] are indices in DB (Y)
+        # start/end are the song (Y) frames where the path starts and ends
         
         # In subsequence DTW, the user query (X) is usually fully consumed (or mostly).
-        # The subsequence in Y is from min(wp_y) to max(wp_y).
+        # The subsequence in Y is from start to end.
         
         # Length of hum
         hum_len = len(user_pitch)
         
         # Length of matched segment in song
-        y_indices = wp[:, 1]
-        matched_segment_len = np.max(y_indices) - np.min(y_indices)
+        matched_segment_len = end - start
         
+        length_penalty = self.length_penalty(hum_len, matched_segment_len)
+            
+        final_cost = match_cost + length_penalty
+        
+        return self.cost_to_similarity(final_cost)
+
+    def length_penalty(self, hum_len, matched_segment_len):
+        """Flat cost penalty for matches that are stretched/compressed too much."""
         # Ratio: How stretched/compressed is the match?
         # Ideal ratio is 1.0 (Hum duration == Match duration)
         # If hum is 5s and match is 0.5s, ratio is 0.1 -> Bad
@@ -138,9 +179,42 @@ class AudioProcessorV3:
         length_penalty = 0.0
         if ratio < 0.5 or ratio > 2.0:
             length_penalty = 0.5 # Add flat cost penalty
-            
-        final_cost = match_cost + length_penalty
         
+        return length_penalty
+
+    # --- Search engine interface (see song_search.py) ---
+
+    def search_bounds(self, user_pitch, db_pitch):
+        """Lower bounds on search_cost, cheapest first (LB_Kim, then LB_Keogh)."""
+        if len(user_pitch) < 10 or len(db_pitch) < 10:
+            return
+        # The length penalty is never negative, so bounds on the match cost alone are valid
+        yield contour_envelope_bound(user_pitch, db_pitch)
+        yield contour_nearest_value_bound(user_pitch, db_pitch)
+
+    def search_cost(self, user_pitch, db_pitch, abandon_above=float('inf')):
+        """
+        Best subsequence DTW cost per hum frame plus the length penalty of
+        that match (inf if above abandon_above).
+        """
+        if len(user_pitch) < 10 or len(db_pitch) < 10:
+            return float('inf')
+        C = contour_cost_matrix(user_pitch, db_pitch)
+        n_frames = len(user_pitch)
+        
+        match_cost = subsequence_dtw_cost(C, abandon_above=abandon_above * n_frames) / n_frames
+        if not np.isfinite(match_cost):
+            return match_cost
+        
+        # Survivor: measure the matched segment of the best path (as librosa backtracks it;
+        # librosa flips the path of a hum longer than the song, which then spans the hum)
+        _, _, start, end = subsequence_dtw_score(C)
+        matched_segment_len = end - start if C.shape[0] <= C.shape[1] else n_frames - 1
+        
+        return match_cost + self.length_penalty(n_frames, matched_segment_len)
+
+    def cost_to_similarity(self, cost):
+        """Maps a DTW cost (penalty included) to the 0-100 similarity index."""
         # --- CONVERT COST TO SIMILARITY ---
         # Z-Normalized distances are roughly in reasonable range (0.0 to 2.0 usually)
         # Threshold needs to be tighter for Z-score than raw semitones
@@ -148,6 +222,6 @@ class AudioProcessorV3:
         
         threshold = 2.0 
         
-        similarity = max(0, (1 - (final_cost / threshold)) * 100)
+        similarity = max(0, (1 - (cost / threshold)) * 100)
         
         return round(float(similarity), 2)
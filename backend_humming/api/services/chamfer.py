@@ -0,0 +1,39 @@
+import numpy as np
+
+# Chamfer distance between one player constellation and many others at once.
+# A per-entry scipy cdist call on 10-11 points is mostly call overhead; here
+# the sets are zero-padded to a common size and masked by their counts.
+# Stand-alone (no api.* imports): the version_2 matcher in backend_fifa_versions
+# imports it from this directory as well.
+
+def pad_point_sets(point_sets):
+    """List of (n_i, 2) point sets -> (N, P, 2) zero-padded array + (N,) counts."""
+    counts = np.array([len(points) for points in point_sets], dtype=np.int64)
+    padded = np.zeros((len(point_sets), max(1, counts.max(initial=0)), 2))
+    for i, points in enumerate(point_sets):
+        if counts[i]:
+            padded[i, :counts[i]] = points
+    return padded, counts
+
+def batch_chamfer_distance(query_set, points, counts):
+    """
+    Chamfer distance mean(min_dist(q, E)) + mean(min_dist(e, Q)) between
+    query_set (Q, 2) and every padded set points (B, P, 2) with counts (B,).
+    Returns (B,), inf where either set is empty (like the per-entry version).
+    """
+    query_set = np.asarray(query_set, dtype=np.float64).reshape(-1, 2)
+    if len(query_set) == 0:
+        return np.full(len(points), np.inf)
+    # sqrt(dx^2 + dy^2) in the same order as cdist, (B, Q, P)
+    dx = query_set[None, :, 0, None] - points[:, None, :, 0]
+    dy = query_set[None, :, 1, None] - points[:, None, :, 1]
+    dists = np.sqrt(dx * dx + dy * dy)
+    valid = np.arange(points.shape[1])[None, :] < counts[:, None]  # (B, P)
+    dists = np.where(valid[:, None, :], dists, np.inf)
+
+    q_to_e = np.mean(np.min(dists, axis=2), axis=1)
+    e_to_q = np.min(dists, axis=1)  # (B, P), inf on padding
+    with np.errstate(invalid='ignore', divide='ignore'):
+        e_to_q = np.where(valid, e_to_q, 0).sum(axis=1) / counts
+
+    return np.where(counts > 0, q_to_e + e_to_q, np.inf)
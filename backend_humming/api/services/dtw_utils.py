@@ -0,0 +1,320 @@
+import numpy as np
+from numba import jit
+
+# Small DTW helpers shared by the audio processors.
+# librosa.sequence.dtw always fills (and keeps) the full accumulated cost matrix
+# and backtracks a path; these kernels only keep what ranking needs.
+
+@jit(nopython=True, cache=True)
+def _subseq_dtw_min_cost(C, abandon_above):
+    """
+    Subsequence DTW over cost matrix C (query rows, reference columns) with the
+    same steps as librosa ((1,1), (0,1), (1,0)), keeping only two rows.
+    Returns min_j D[-1, j], or inf as soon as a whole row is > abandon_above
+    (costs are non-negative, so the final row can only be larger).
+    """
+    n_rows, n_cols = C.shape
+    prev = np.empty(n_cols)
+    cur = np.empty(n_cols)
+
+    row_min = np.inf
+    for m in range(n_cols):
+        prev[m] = C[0, m]
+        if prev[m] < row_min:
+            row_min = prev[m]
+    if row_min > abandon_above:
+        return np.inf
+
+    for n in range(1, n_rows):
+        cur[0] = prev[0] + C[n, 0]
+        row_min = cur[0]
+        for m in range(1, n_cols):
+            best = prev[m - 1]
+            if cur[m - 1] < best:
+                best = cur[m - 1]
+            if prev[m] < best:
+                best = prev[m]
+            cur[m] = best + C[n, m]
+            if cur[m] < row_min:
+                row_min = cur[m]
+        if row_min > abandon_above:
+            return np.inf
+        prev, cur = cur, prev
+
+    return np.min(prev)
+
+def subsequence_dtw_cost(C, abandon_above=np.inf):
+    """
+    Accumulated cost of the best subsequence alignment of all rows of C
+    against any contiguous run of its columns.
+    Returns inf if the alignment provably costs more than abandon_above.
+    """
+    C = np.ascontiguousarray(C, dtype=np.float64)
+    if np.any(np.isnan(C)):
+        raise ValueError("DTW cost matrix C has NaN values.")
+    return _subseq_dtw_min_cost(C, float(abandon_above))
+
+# --- Ranking-only subsequence DTW (same scores as librosa, no matrix, no backtracking) ---
+# librosa.sequence.dtw(subseq=True) scores the processors with D[-1, -1] / len(wp),
+# where wp is backtracked from argmin D[-1, :]. Every cell here carries the length
+# and start column of the path librosa would backtrack through it, so both numbers
+# come out of a single pass over two rows.
+
+@jit(nopython=True, cache=True)
+def _first_row(c, cur, cur_len, cur_start):
+    """Row 0: a path may start at any column (librosa's D[0, :] = C[0, :])."""
+    for m in range(c.shape[0]):
+        cur[m] = c[m]
+        # librosa still relaxes row 0 horizontally, which only matters for the
+        # tiny negative costs cosine distances can round to
+        if m > 0 and cur[m - 1] + c[m] < cur[m]:
+            cur[m] = cur[m - 1] + c[m]
+        # ... but its backtracking stops on row 0, so paths always start here
+        cur_len[m] = 1
+        cur_start[m] = m
+
+@jit(nopython=True, cache=True)
+def _next_row(c, prev, prev_len, prev_start, cur, cur_len, cur_start):
+    """Row n from row n - 1, with librosa's step order ((1,1), (0,1), (1,0)) and strict '<' on the sums."""
+    for m in range(c.shape[0]):
+        best = np.inf
+        length = 0
+        start = 0
+        if m > 0:
+            cost = prev[m - 1] + c[m]
+            if cost < best:
+                best = cost
+                length = prev_len[m - 1]
+                start = prev_start[m - 1]
+            cost = cur[m - 1] + c[m]
+            if cost < best:
+                best = cost
+                length = cur_len[m - 1]
+                start = cur_start[m - 1]
+        cost = prev[m] + c[m]
+        if cost < best:
+            best = cost
+            length = prev_len[m]
+            start = prev_start[m]
+        cur[m] = best
+        cur_len[m] = length + 1
+        cur_start[m] = start
+
+@jit(nopython=True, cache=True)
+def _subseq_dtw_last_row(C):
+    """Last row of the accumulated cost, with the path length and start column of every cell."""
+    n_rows, n_cols = C.shape
+    prev, cur = np.empty(n_cols), np.empty(n_cols)
+    prev_len, cur_len = np.empty(n_cols, dtype=np.int64), np.empty(n_cols, dtype=np.int64)
+    prev_start, cur_start = np.empty(n_cols, dtype=np.int64), np.empty(n_cols, dtype=np.int64)
+
+    _first_row(C[0], prev, prev_len, prev_start)
+    for n in range(1, n_rows):
+        _next_row(C[n], prev, prev_len, prev_start, cur, cur_len, cur_start)
+        prev, cur = cur, prev
+        prev_len, cur_len = cur_len, prev_len
+        prev_start, cur_start = cur_start, prev_start
+    return prev, prev_len, prev_start
+
+@jit(nopython=True, cache=True)
+def _subseq_dtw_score(C):
+    last, lengths, starts = _subseq_dtw_last_row(C)
+    end = np.argmin(last)
+    return last[C.shape[1] - 1], lengths[end], starts[end], end
+
+@jit(nopython=True, cache=True)
+def _contour_subseq_dtw_score(rows, cols):
+    n_rows, n_cols = rows.shape[0], cols.shape[0]
+    prev, cur = np.empty(n_cols), np.empty(n_cols)
+    prev_len, cur_len = np.empty(n_cols, dtype=np.int64), np.empty(n_cols, dtype=np.int64)
+    prev_start, cur_start = np.empty(n_cols, dtype=np.int64), np.empty(n_cols, dtype=np.int64)
+    c = np.empty(n_cols)
+
+    for n in range(n_rows):
+        # One row of the euclidean cost matrix, computed on the fly
+        for m in range(n_cols):
+            c[m] = abs(rows[n] - cols[m])
+        if n == 0:
+            _first_row(c, prev, prev_len, prev_start)
+            continue
+        _next_row(c, prev, prev_len, prev_start, cur, cur_len, cur_start)
+        prev, cur = cur, prev
+        prev_len, cur_len = cur_len, prev_len
+        prev_start, cur_start = cur_start, prev_start
+
+    end = np.argmin(prev)
+    return prev[n_cols - 1], prev_len[end], prev_start[end], end
+
+def subsequence_dtw_score(C):
+    """
+    What the processors read from librosa.sequence.dtw(C=C, subseq=True), in O(M) memory:
+    (D[-1, -1], path length, start column, end column), where the path is the one
+    librosa backtracks from end = argmin D[-1, :].
+    """
+    C = np.ascontiguousarray(C, dtype=np.float64)
+    if np.any(np.isnan(C)):
+        raise ValueError("DTW cost matrix C has NaN values.")
+    cost, length, start, end = _subseq_dtw_score(C)
+    return float(cost), int(length), int(start), int(end)
+
+def subsequence_dtw_matches(C):
+    """
+    Matching function of subsequence DTW over C: (D[-1, :], start column of the
+    best path ending at every column), e.g. to find several matching regions.
+    """
+    C = np.ascontiguousarray(C, dtype=np.float64)
+    if np.any(np.isnan(C)):
+        raise ValueError("DTW cost matrix C has NaN values.")
+    last, _, starts = _subseq_dtw_last_row(C)
+    return last, starts
+
+def contour_subsequence_dtw_score(query, reference):
+    """
+    Same for 1-D contours, as librosa.sequence.dtw(X=query, Y=reference, metric='euclidean',
+    subseq=True) computes it: when the query is longer, the reference is matched inside it
+    (C transposed), and the path then spans the whole reference.
+    start/end are reference frames, so end - start is the matched segment length.
+    """
+    query = np.ascontiguousarray(query, dtype=np.float64)
+    reference = np.ascontiguousarray(reference, dtype=np.float64)
+    if np.any(np.isnan(query)) or np.any(np.isnan(reference)):
+        raise ValueError("DTW cost matrix C has NaN values.")
+    if len(query) > len(reference):
+        cost, length, _, _ = _contour_subseq_dtw_score(reference, query)
+        return float(cost), int(length), 0, len(reference) - 1
+    cost, length, start, end = _contour_subseq_dtw_score(query, reference)
+    return float(cost), int(length), int(start), int(end)
+
+def contour_cost_matrix(query, reference):
+    """Absolute pitch difference between every query and reference frame (1-D euclidean)."""
+    return np.abs(query[:, None] - reference[None, :])
+
+# --- Lower bounds on subsequence DTW cost per query frame (1-D contours) ---
+# Every query frame is matched to at least one reference frame and costs are
+# non-negative, so any per-frame lower bound summed over the query is valid.
+
+def contour_envelope_bound(query, reference):
+    """LB_Kim style: distance of each query frame to the reference's [min, max] range."""
+    lo, hi = np.min(reference), np.max(reference)
+    below = np.maximum(lo - query, 0)
+    above = np.maximum(query - hi, 0)
+    return float(np.sum(below + above)) / len(query)
+
+def contour_nearest_value_bound(query, reference):
+    """LB_Keogh style (unconstrained window): distance of each query frame to its nearest reference value."""
+    values = np.sort(reference)
+    if len(values) == 1:
+        return float(np.sum(np.abs(query - values[0]))) / len(query)
+    pos = np.clip(np.searchsorted(values, query), 1, len(values) - 1)
+    nearest = np.minimum(np.abs(query - values[pos - 1]), np.abs(query - values[pos]))
+    return float(np.sum(nearest)) / len(query)
+
+@jit(nopython=True, cache=True)
+def _banded_subseq_dtw(query, reference, below, above):
+    """
+    Column-streaming subsequence DTW between two 1-D contours (SPRING style).
+    Only the current and previous song column are kept (O(len(query)) memory),
+    and every cell carries the start column and length of its path so that a
+    Sakoe-Chiba band anchored at the path start can be enforced:
+        -below <= (m - start) - n <= above
+    Same steps and tie-breaking as librosa ((1,1), (0,1), (1,0)).
+    Returns (D[-1, -1], path_length, start, end), the last three of the
+    path ending at the best end column (what subsequence_dtw_score reports).
+    """
+    n_rows = query.shape[0]
+    n_cols = reference.shape[0]
+
+    D_prev = np.full(n_rows, np.inf)
+    D_cur = np.full(n_rows, np.inf)
+    L_prev = np.zeros(n_rows, dtype=np.int64)
+    L_cur = np.zeros(n_rows, dtype=np.int64)
+    S_prev = np.zeros(n_rows, dtype=np.int64)
+    S_cur = np.zeros(n_rows, dtype=np.int64)
+
+    best_cost = np.inf
+    best_len = 0
+    best_start = 0
+    best_end = 0
+
+    for m in range(n_cols):
+        y = reference[m]
+
+        # A path may start at any song frame
+        D_cur[0] = abs(query[0] - y)
+        L_cur[0] = 1
+        S_cur[0] = m
+
+        for n in range(1, n_rows):
+            best = np.inf
+            length = 0
+            start = 0
+
+            if m > 0:
+                # Diagonal (n-1, m-1)
+                offset = (m - S_prev[n - 1]) - n
+                if D_prev[n - 1] < best and -below <= offset <= above:
+                    best = D_prev[n - 1]
+                    length = L_prev[n - 1]
+                    start = S_prev[n - 1]
+                # Horizontal (n, m-1)
+                offset = (m - S_prev[n]) - n
+                if D_prev[n] < best and -below <= offset <= above:
+                    best = D_prev[n]
+                    length = L_prev[n]
+                    start = S_prev[n]
+            # Vertical (n-1, m)
+            offset = (m - S_cur[n - 1]) - n
+            if D_cur[n - 1] < best and -below <= offset <= above:
+                best = D_cur[n - 1]
+                length = L_cur[n - 1]
+                start = S_cur[n - 1]
+
+            D_cur[n] = best + abs(query[n] - y)
+            L_cur[n] = length + 1
+            S_cur[n] = start
+
+        if D_cur[n_rows - 1] < best_cost:
+            best_cost = D_cur[n_rows - 1]
+            best_len = L_cur[n_rows - 1]
+            best_start = S_cur[n_rows - 1]
+            best_end = m
+
+        D_prev, D_cur = D_cur, D_prev
+        L_prev, L_cur = L_cur, L_prev
+        S_prev, S_cur = S_cur, S_prev
+
+    # D_prev now holds the last song column
+    return D_prev[n_rows - 1], best_len, best_start, best_end
+
+def _band_offsets(n_rows, n_cols, min_ratio, max_ratio):
+    """(below, above) limits of (m - start) - n for a column / row stretch ratio in [min_ratio, max_ratio]."""
+    # Clipped to what a path can reach, so an open band (e.g. (0, 1e9) or inf) is exact
+    below = min(int(np.ceil((1.0 - min_ratio) * n_rows)), n_rows)
+    above = int(np.ceil((max_ratio - 1.0) * n_rows)) if max_ratio < n_cols + 1 else n_cols
+    return below, above
+
+def banded_subsequence_dtw(query, reference, band=(0.5, 2.0)):
+    """
+    Subsequence DTW of a 1-D query contour against a 1-D reference contour,
+    restricted to matches whose stretch ratio (matched song frames / hum frames)
+    stays within band = (min_ratio, max_ratio) along the whole path.
+    Never materializes the N x M cost matrix.
+    Returns what contour_subsequence_dtw_score does over the paths in the band:
+    (D[-1, -1], path length, start column, end column), the path being the one
+    ending at the best end column, so an open band gives the unbanded score.
+    D[-1, -1] is inf if no path in the band ends on the last song frame.
+    """
+    query = np.ascontiguousarray(query, dtype=np.float64)
+    reference = np.ascontiguousarray(reference, dtype=np.float64)
+    min_ratio, max_ratio = band
+    if len(query) > len(reference):
+        # Like the unbanded score, the song is then matched inside the hum (whole song
+        # on the rows), so the band holds for hum frames / song frames instead
+        inv_min = 1.0 / max_ratio
+        inv_max = 1.0 / min_ratio if min_ratio > 0 else np.inf
+        below, above = _band_offsets(len(reference), len(query), inv_min, inv_max)
+        cost, length, _, _ = _banded_subseq_dtw(reference, query, below, above)
+        return float(cost), int(length), 0, len(reference) - 1
+    below, above = _band_offsets(len(query), len(reference), min_ratio, max_ratio)
+    cost, length, start, end = _banded_subseq_dtw(query, reference, below, above)
+    return float(cost), int(length), int(start), int(end)
@@ -0,0 +1,140 @@
+import os
+import threading
+import numpy as np
+from api.services.npy_store import NpyStore
+from api.services.melody_index import MelodyIndex
+
+class FeatureIndex:
+    """
+    Persistent on-disk index of reference-song features.
+
+    Features are keyed by song file and processor version (v0/v1/v2/v3, with
+    the processor's feature revision when it has one, e.g. v3.stft),
+    stored as .npy files under index_dir/<version>/ and described by a
+    manifest.json (see npy_store.py). An entry is only recomputed when the song file's
+    size/mtime/hash no longer match the manifest.
+
+    With a pcm_cache (see pcm_cache.py), missing features are extracted from
+    the cached decoded audio instead of decoding the song again.
+
+    A version's melody hash index (see melody_index), once requested, is
+    stored under index_dir/<version>.melody/ and kept in step with the
+    features by store and prune.
+    """
+    def __init__(self, songs_dir, index_dir, pcm_cache=None):
+        self.songs_dir = songs_dir
+        self.index_dir = index_dir
+        self.pcm_cache = pcm_cache
+
+        self._store = NpyStore(songs_dir, index_dir)
+        self._lock = threading.Lock()
+        # (version, song_file) -> features, so warm requests never touch the disk
+        self._memory = {}
+        # version -> MelodyIndex over the songs indexed for that version
+        self._melody = {}
+
+    def snapshot(self, song_file):
+        """Size/mtime/sha1 of song_file now; take it before extracting features from it."""
+        return self._store.snapshot(song_file)
+
+    def get_features(self, version, processor, song_file):
+        """
+        Returns the reference features of song_file for the given processor
+        version, extracting and persisting them on first use.
+        """
+        key = (version, song_file)
+
+        location = self.locate(version, song_file)
+        if location is not None:
+            with self._lock:
+                features = self._memory.get(key)
+                if features is None:
+                    features = np.load(location[0])
+                    self._memory[key] = features
+            return features
+
+        # Miss or stale: decode + extract outside the lock (this is the slow part)
+        print(f"DEBUG: Indexing {song_file} ({version})")
+        snapshot = self.snapshot(song_file)
+        db_signal = self._load_signal(processor, song_file)
+        features = processor.extract_features(db_signal)
+        self.store(version, song_file, features, snapshot)
+        return features
+
+    def _load_signal(self, processor, song_file):
+        if self.pcm_cache is not None and processor.sample_rate == self.pcm_cache.sample_rate:
+            return self.pcm_cache.load(song_file)
+        return processor.load_audio(os.path.join(self.songs_dir, song_file))
+
+    def locate(self, version, song_file):
+        """
+        (feature file path, song sha1) of an up-to-date entry, or None when
+        song_file still has to be (re)indexed for this version.
+        """
+        location = self._store.locate(version, song_file)
+        if location is None:
+            with self._lock:
+                self._memory.pop((version, song_file), None)
+        return location
+
+    def store(self, version, song_file, features, snapshot, keep_in_memory=True):
+        """
+        Persists features extracted elsewhere (e.g. in a worker process) from
+        song_file as it was at snapshot. Returns the new (feature file path, song sha1).
+        """
+        location = self._store.save(version, song_file, features, snapshot)
+        with self._lock:
+            if keep_in_memory:
+                self._memory[(version, song_file)] = features
+            else:
+                self._memory.pop((version, song_file), None)
+            melody = self._melody.get(version)
+        if melody is not None:
+            hashes = melody.hashes(features)
+            self._store.save(self._melody_key(version), song_file, hashes, snapshot)
+            melody.add_hashes(song_file, hashes, snapshot['sha1'])
+        return location
+
+    def prune(self, song_files):
+        """Drops index entries for songs that are no longer in the songs folder."""
+        removed = self._store.prune(song_files)
+        with self._lock:
+            for version, song_file in removed:
+                self._memory.pop((version, song_file), None)
+                if version in self._melody:
+                    self._melody[version].remove(song_file)
+
+    @staticmethod
+    def _melody_key(version):
+        return f'{version}.melody'
+
+    def melody_index(self, version):
+        """
+        MelodyIndex over every song indexed for version. Loaded from the hashes
+        stored next to the features (songs indexed without them are hashed
+        once), then updated by store / prune, so lookups never re-check the
+        songs folder.
+        """
+        with self._lock:
+            melody = self._melody.get(version)
+            if melody is None:
+                melody = self._load_melody_index(version)
+                self._melody[version] = melody
+            return melody
+
+    def _load_melody_index(self, version):
+        melody = MelodyIndex()
+        melody_key = self._melody_key(version)
+        hashed = self._store.entries(melody_key)
+        for song_file, snapshot in self._store.entries(version).items():
+            hash_path = self._store.path(melody_key, song_file)
+            if song_file in hashed and hashed[song_file]['sha1'] == snapshot['sha1'] and os.path.exists(hash_path):
+                hashes = np.load(hash_path)
+            else:
+                feature_path = self._store.path(version, song_file)
+                if not os.path.exists(feature_path):
+                    continue
+                hashes = melody.hashes(np.load(feature_path))
+                self._store.save(melody_key, song_file, hashes, snapshot)
+            melody.add_hashes(song_file, hashes, snapshot['sha1'])
+        return melody
@@ -0,0 +1,74 @@
+import numpy as np
+import librosa
+from numba import jit
+
+# Harmonic pitch tracking on a single STFT.
+# librosa.effects.hpss computes an STFT, median-filters it, inverts the harmonic
+# part back to audio, and piptrack then computes a second STFT of that audio.
+# Here the harmonic/percussive soft mask is applied to the magnitude of the one
+# STFT and piptrack peak-picks the masked magnitude directly. The two median
+# filters (the bulk of hpss) use a sorted sliding window instead of scipy's
+# per-pixel selection, with the same 'reflect' edges, so they give the same values.
+
+@jit(nopython=True, cache=True)
+def _reflect(i, n):
+    """scipy.ndimage 'reflect' mode index (d c b a | a b c d | d c b a)."""
+    i = i % (2 * n)
+    return i if i < n else 2 * n - 1 - i
+
+@jit(nopython=True, cache=True)
+def _sliding_median_rows(X, width):
+    """Median of every `width` (odd) window along the rows of X."""
+    n_rows, n_cols = X.shape
+    half = width // 2
+    out = np.empty_like(X)
+    window = np.empty(width, dtype=X.dtype)
+
+    for r in range(n_rows):
+        row = X[r]
+        for k in range(width):
+            window[k] = row[_reflect(k - half, n_cols)]
+        window.sort()
+        out[r, 0] = window[half]
+
+        for c in range(1, n_cols):
+            outgoing = row[_reflect(c - half - 1, n_cols)]
+            incoming = row[_reflect(c + half, n_cols)]
+            # Drop the outgoing value, then insert the incoming one, keeping window sorted
+            k = np.searchsorted(window, outgoing)
+            while k < width - 1:
+                window[k] = window[k + 1]
+                k += 1
+            k = width - 1
+            while k > 0 and window[k - 1] > incoming:
+                window[k] = window[k - 1]
+                k -= 1
+            window[k] = incoming
+            out[r, c] = window[half]
+    return out
+
+def median_filter_axis(S, width, axis):
+    """scipy.ndimage.median_filter of the 2-D S with a `width` window along axis (mode='reflect')."""
+    if width % 2 == 0:
+        raise ValueError("median filter width must be odd")
+    if axis == 0:
+        return np.ascontiguousarray(_sliding_median_rows(np.ascontiguousarray(S.T), width).T)
+    return _sliding_median_rows(np.ascontiguousarray(S), width)
+
+def harmonic_magnitude(S, kernel_size=31, power=2.0):
+    """
+    Harmonic part of the magnitude spectrogram S (frequency x time), with the
+    soft mask of librosa.decompose.hpss (margin 1): time-median vs frequency-median.
+    """
+    harm = median_filter_axis(S, kernel_size, axis=1)
+    perc = median_filter_axis(S, kernel_size, axis=0)
+    return S * librosa.util.softmask(harm, perc, power=power, split_zeros=True)
+
+def harmonic_piptrack(signal, sr, fmin, fmax, n_fft=2048, hop_length=512):
+    """
+    piptrack (pitches, magnitudes) of the harmonic part of signal, from one STFT
+    (the framing of librosa.effects.hpss followed by piptrack on its output).
+    """
+    S = np.abs(librosa.stft(signal, n_fft=n_fft, hop_length=hop_length))
+    return librosa.piptrack(S=harmonic_magnitude(S), sr=sr, n_fft=n_fft, hop_length=hop_length,
+                            fmin=fmin, fmax=fmax)
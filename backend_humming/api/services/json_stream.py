@@ -0,0 +1,75 @@
+import json
+
+# Streaming reader for the FIFA event files (one JSON array of events per match),
+# shared by the version_2 / version_3 data processors in backend_fifa_versions.
+# Stand-alone (no api.* imports) so the processors can import it from this directory.
+
+# Characters a JSON number can go on with: a number decoded up to one of these
+# (or up to the end of the buffer) may be cut by the chunk boundary
+_NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+def iter_json_array(filepath, chunk_size=1 << 16):
+    """
+    Yields the elements of a file holding one JSON array, one at a time:
+    only the current element and a read buffer are in memory, not the match.
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        buf, pos = '', 0
+
+        def peek():
+            # Next non-whitespace character ('' at end of file), reading on as needed
+            nonlocal buf, pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                buf, pos = f.read(chunk_size), 0
+                if not buf:
+                    return ''
+
+        if peek() != '[':
+            raise ValueError(f"{filepath}: expected a JSON array")
+        pos += 1
+        if peek() == ']':
+            return
+        while True:
+            peek()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    end = None
+                # Only accept an element followed by a character that cannot continue it:
+                # "1" of "1.5" or "-1.5" of "-1.5e10" decode fine when the chunk ends there
+                if end is not None and end < len(buf) and buf[end] not in _NUMBER_CHARS:
+                    break
+                more = f.read(chunk_size)
+                if not more:
+                    if end is None:
+                        raise ValueError(f"{filepath}: truncated JSON array")
+                    break
+                buf, pos = buf[pos:] + more, 0
+            pos = end
+            yield item
+
+            separator = peek()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError(f"{filepath}: expected ',' or ']' in JSON array")
+            pos += 1
+
+_NO_ITEM = object()
+
+def with_next(items):
+    """(item, next item or None) pairs: a lookahead of one over a stream."""
+    items = iter(items)
+    current = next(items, _NO_ITEM)
+    if current is _NO_ITEM:
+        return
+    for upcoming in items:
+        yield current, upcoming
+        current = upcoming
+    yield current, None
@@ -0,0 +1,171 @@
+import threading
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+class MelodyIndex:
+    """
+    Inverted index of quantized melody shapes, used to pick a few candidate
+    (song, offset) pairs before DTW re-ranking.
+
+    Every reference pitch contour is cut into overlapping windows. A window is
+    reduced to a few segment means (PAA) and scaled by its own spread, so key,
+    vocal range and small timing offsets drop out. The interval sequence
+    between the segments (up / flat / down) becomes one integer hash key. A hum
+    is hashed the same way at a few tempos. Every key it shares with a song
+    votes for where in that song the hum would start, and the songs with the
+    most votes are the candidates.
+    """
+    def __init__(self, window=48, hop=2, segments=7, levels=(-0.3, 0.3), min_spread=0.1,
+                 pair_gap=24, scales=(0.8, 0.9, 1.0, 1.12, 1.25), max_postings=5000):
+        self.window = window          # Song frames per hashed window
+        self.hop = hop                # Song frames between windows
+        self.segments = segments      # PAA segments per window (segments - 1 intervals)
+        self.levels = np.asarray(levels)  # Interval bucket edges, in units of the window's spread
+        self.min_spread = min_spread  # Spread floor (contour z units) so held notes stay flat
+        self.pair_gap = pair_gap      # Each key combines the windows at t and t + pair_gap (0: single window)
+        self.scales = scales          # Hum tempo / song tempo ratios tried at query time
+        self.max_postings = max_postings  # Keys more common than this are not selective, skip them
+
+        self._lock = threading.Lock()
+        self._songs = {}              # song -> (token, keys, starts)
+        self._table = None            # (names, sorted keys, song ids, starts), rebuilt lazily
+
+        # Flat windows (every interval in the middle bucket) say nothing about the melody
+        self._base = len(self.levels) + 1
+        flat_symbol = np.searchsorted(self.levels, 0.0, side='right')
+        self._flat_key = int(flat_symbol * np.sum(self._base ** np.arange(segments - 1)))
+
+    def _hash_windows(self, contour, window, hop, pair_gap=None):
+        """
+        Hash key and start frame of every `hop`-th window of `window` frames.
+        With pair_gap, a key combines the windows starting at t and t + pair_gap.
+        """
+        contour = np.asarray(contour, dtype=np.float64)
+        pair_gap = self.pair_gap if pair_gap is None else pair_gap
+        if len(contour) < window + pair_gap:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # Whole-contour z-score, so min_spread means the same for every version's contour
+        std = np.std(contour)
+        contour = (contour - np.mean(contour)) / (std if std > 0 else 1.0)
+        views = sliding_window_view(contour, window)
+
+        # PAA: mean of each of the `segments` slices of every window (via cumulative sums)
+        edges = np.linspace(0, window, self.segments + 1).round().astype(int)
+        cumsum = np.concatenate([np.zeros((len(views), 1)), np.cumsum(views, axis=1)], axis=1)
+        paa = (cumsum[:, edges[1:]] - cumsum[:, edges[:-1]]) / np.diff(edges)
+
+        # Scale by the window's own spread (hum and song are normalized over different spans)
+        spread = np.maximum(paa.std(axis=1, keepdims=True), self.min_spread)
+        symbols = np.digitize(np.diff(paa, axis=1) / spread, self.levels)
+        keys = (symbols @ (self._base ** np.arange(self.segments - 1))).astype(np.int64)
+        flat = keys == self._flat_key
+
+        if pair_gap > 0:
+            n_keys = self._base ** (self.segments - 1)
+            keys = keys[:-pair_gap] * n_keys + keys[pair_gap:]
+            flat = flat[:-pair_gap] & flat[pair_gap:]
+
+        starts = np.arange(len(keys), dtype=np.int64)
+        informative = ~flat
+        informative[np.arange(len(keys)) % hop != 0] = False
+        return keys[informative], starts[informative]
+
+    def hashes(self, contour):
+        """(2, n) array of the hash keys and start frames add() indexes for a reference contour."""
+        keys, starts = self._hash_windows(contour, self.window, self.hop, self.pair_gap)
+        return np.stack([keys, starts])
+
+    def add(self, song, contour, token=None):
+        """(Re)indexes a reference contour. token identifies the indexed version (e.g. file sha1)."""
+        self.add_hashes(song, self.hashes(contour), token)
+
+    def add_hashes(self, song, hashes, token=None):
+        """(Re)indexes a song from precomputed hashes (e.g. persisted next to its features)."""
+        with self._lock:
+            self._songs[song] = (token, hashes[0], hashes[1])
+            self._table = None
+
+    def remove(self, song):
+        with self._lock:
+            if self._songs.pop(song, None) is not None:
+                self._table = None
+
+    def token(self, song):
+        """Token the song was indexed with, None if it is not indexed."""
+        entry = self._songs.get(song)
+        return entry[0] if entry is not None else None
+
+    def songs(self):
+        return list(self._songs)
+
+    def _build_table(self):
+        names = list(self._songs)
+        keys = [self._songs[name][1] for name in names]
+        starts = [self._songs[name][2] for name in names]
+        ids = [np.full(len(k), i, dtype=np.int64) for i, k in enumerate(keys)]
+
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+        starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+        order = np.argsort(keys, kind='stable')
+        self._table = (names, keys[order], ids[order], starts[order])
+
+    def query(self, contour, max_candidates=50):
+        """
+        Returns [(song, start, votes)] for at most max_candidates songs, most
+        votes first. start is the estimated song frame where the hum begins.
+        """
+        with self._lock:
+            if self._table is None:
+                self._build_table()
+            names, keys, ids, starts = self._table
+        if len(keys) == 0:
+            return []
+
+        # Votes go to (song, start bin); two grids half a bin apart so a match
+        # near a bin edge is not split in two. Scored per tempo, best tempo wins.
+        bin_size = max(1, self.window // 2)
+        n_bins = (int(starts.max()) + 2 * len(contour)) // bin_size + 4
+        best_votes = np.zeros(len(names), dtype=np.int64)
+        best_start = np.zeros(len(names), dtype=np.int64)
+
+        for scale in self.scales:
+            # A song window of `window` frames lasts window * scale frames in the hum
+            q_window = int(round(self.window * scale))
+            q_keys, q_starts = self._hash_windows(contour, q_window, hop=1, pair_gap=int(round(self.pair_gap * scale)))
+
+            lo = np.searchsorted(keys, q_keys, side='left')
+            hi = np.searchsorted(keys, q_keys, side='right')
+            counts = hi - lo
+            counts[counts > self.max_postings] = 0
+            total = int(np.sum(counts))
+            if total == 0:
+                continue
+
+            # Expand every [lo, hi) posting range into table rows
+            which = np.repeat(np.arange(len(q_keys)), counts)
+            rows = np.repeat(lo, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+            song_ids = ids[rows]
+            hum_start = starts[rows] - np.round(q_starts[which] / scale).astype(np.int64)
+
+            for shift in (0, bin_size // 2):
+                bins = np.floor_divide(hum_start + shift + 2 * len(contour), bin_size)
+                codes, votes = np.unique(song_ids * n_bins + bins, return_counts=True)
+
+                # Keep each song's best bin so far (ascending votes: the last write per song is its max)
+                order = np.argsort(votes, kind='stable')
+                codes, votes = codes[order], votes[order]
+                better = votes > best_votes[codes // n_bins]
+                codes, votes = codes[better], votes[better]
+                best_votes[codes // n_bins] = votes
+                best_start[codes // n_bins] = (codes % n_bins) * bin_size - shift - 2 * len(contour)
+
+        ranked = np.lexsort((np.arange(len(names)), -best_votes))
+        results = []
+        for song_id in ranked[:max_candidates]:
+            if best_votes[song_id] == 0:
+                break
+            results.append((names[song_id], max(0, int(best_start[song_id])), int(best_votes[song_id])))
+        return results
@@ -0,0 +1,129 @@
+import heapq
+import numpy as np
+from api.services.dtw_utils import subsequence_dtw_matches, contour_cost_matrix
+
+def paa(features, factor):
+    """Piecewise aggregate approximation: mean of every `factor` frames (last axis is time)."""
+    n_frames = features.shape[-1]
+    edges = np.arange(0, n_frames, factor)
+    counts = np.diff(np.append(edges, n_frames))
+    return np.add.reduceat(features, edges, axis=-1) / counts
+
+class MultiResolutionSearch:
+    """
+    Top-k reference song search, coarse to fine.
+
+    Hum and song are averaged down by each factor of `levels` in turn (coarsest
+    first). At every level a subsequence DTW over the current song windows gives
+    a matching function, and the best `regions` non-overlapping matches become the
+    next windows, widened by `radius` frames of that level. Only these windows are
+    scored at full resolution, with processor.search_cost. A 10k frame song is then
+    matched at full resolution on a few hum-sized windows instead of end to end;
+    the price is that a match the coarse levels miss is not found.
+
+    Works with the same processors as SongSearchEngine (search_cost on 1-D
+    contours or on (12, N) chroma, whose coarse levels try every key).
+    """
+    def __init__(self, processor, top_k=10, levels=(16, 4), radius=4, regions=3):
+        self.processor = processor
+        self.top_k = top_k
+        self.levels = levels    # PAA factors, coarsest first
+        self.radius = radius    # Frames (of the level a region was found at) added on both sides
+        self.regions = regions  # Windows kept per song at every level
+        self.last_stats = {}
+        self.last_windows = {} # key -> full resolution (lo, hi) window of its best match, for the last results
+
+    def _cost_matrices(self, query, reference):
+        if query.ndim == 2:
+            # Chroma: every key shift; zero frames (NaN cosine) count as orthogonal
+            costs = self.processor.shifted_cost_matrices(query, reference, np.arange(12))
+            return np.nan_to_num(costs, nan=1.0)
+        return [contour_cost_matrix(query, reference)]
+
+    def _matches(self, query, reference):
+        """(cost, start, end) of the best non-overlapping subsequence matches, best first."""
+        best_cost, best_start = None, None
+        for C in self._cost_matrices(query, reference):
+            cost, start = subsequence_dtw_matches(C)
+            if best_cost is None:
+                best_cost, best_start = cost, start
+            else:
+                better = cost < best_cost
+                best_cost = np.where(better, cost, best_cost)
+                best_start = np.where(better, start, best_start)
+
+        found = []
+        for end in np.argsort(best_cost, kind='stable'):
+            start = best_start[end]
+            if any(start <= e and s <= end for _, s, e in found):
+                continue
+            found.append((float(best_cost[end]), int(start), int(end)))
+            if len(found) == self.regions:
+                break
+        return found
+
+    def windows(self, query, reference):
+        """Full resolution (lo, hi) song windows left after the coarse levels."""
+        n_frames = reference.shape[-1]
+        windows = [(0, n_frames)]
+        for factor in self.levels:
+            coarse_query = paa(query, factor)
+            if coarse_query.shape[-1] < 2:
+                continue # Hum too short for this level
+            found = []
+            for lo, hi in windows:
+                if hi - lo < 2 * factor:
+                    found.append((0.0, lo, hi))
+                    continue
+                for cost, start, end in self._matches(coarse_query, paa(reference[..., lo:hi], factor)):
+                    found.append((cost, max(0, lo + (start - self.radius) * factor),
+                                  min(n_frames, lo + (end + 1 + self.radius) * factor)))
+            found.sort(key=lambda f: f[0])
+
+            # Best regions, overlapping ones merged
+            windows = []
+            for _, lo, hi in sorted(found[:self.regions], key=lambda f: f[1]):
+                if windows and lo <= windows[-1][1]:
+                    windows[-1] = (windows[-1][0], max(windows[-1][1], hi))
+                else:
+                    windows.append((lo, hi))
+        return windows
+
+    def search(self, query, references):
+        """
+        query: query features (processor.extract_features of the hum)
+        references: list of (key, reference features)
+        Returns [(key, cost)] sorted by cost (best first), at most top_k entries.
+        """
+        stats = {'candidates': len(references), 'frames': 0, 'refined_frames': 0}
+
+        # Max-heap (negated) of the current top-k as (cost, index)
+        top = []
+
+        def threshold():
+            return -top[0][0] if len(top) == self.top_k else float('inf')
+
+        best_windows = {}
+        for idx, (key, features) in enumerate(references):
+            cost = float('inf')
+            for lo, hi in self.windows(query, features):
+                window_cost = self.processor.search_cost(query, features[..., lo:hi],
+                                                         abandon_above=min(cost, threshold()))
+                if window_cost < cost:
+                    cost = window_cost
+                    best_windows[idx] = (lo, hi)
+                stats['refined_frames'] += hi - lo
+            stats['frames'] += features.shape[-1]
+            if np.isinf(cost):
+                continue
+
+            entry = (-cost, -idx)
+            if len(top) < self.top_k:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+        self.last_stats = stats
+        ranked = sorted((-neg_cost, -neg_idx) for neg_cost, neg_idx in top)
+        self.last_windows = {references[idx][0]: best_windows[idx] for _, idx in ranked}
+        return [(references[idx][0], cost) for cost, idx in ranked]
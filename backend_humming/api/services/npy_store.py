@@ -0,0 +1,145 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+class NpyStore:
+    """
+    Arrays derived from the files of a source folder (features, decoded audio),
+    stored as .npy files under root/<key>/ and described by root/manifest.json.
+
+    An entry records the size/mtime/sha1 of its source file as it was when the
+    array was derived from it (see snapshot), and stays valid while the file
+    still matches.
+    """
+    def __init__(self, source_dir, root):
+        self.source_dir = source_dir
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Ignoring unreadable manifest {self.manifest_path} ({e}), rebuilding.")
+            return {}
+
+    def _save_manifest(self):
+        # Write-then-rename so a crash never leaves a truncated manifest behind
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def file_hash(path, chunk_size=1 << 20):
+        """SHA-1 of the file contents."""
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def path(self, key, name):
+        """.npy path of the entry (whether or not it exists yet)."""
+        # Song names are arbitrary unicode, so name the file by a digest
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self.root, key, f'{digest}.npy')
+
+    def snapshot(self, name):
+        """
+        Size/mtime/sha1 of the source file as it is now. Taken before deriving
+        an array from it, so a file that changes meanwhile is re-derived on the
+        next lookup instead of being recorded as up to date.
+        """
+        source_path = os.path.join(self.source_dir, name)
+        stat = os.stat(source_path)
+        return {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha1': self.file_hash(source_path),
+        }
+
+    def _is_fresh(self, entry, source_path, stat):
+        """
+        Cheap check first (size + mtime). If those moved, fall back to the
+        content hash so a plain 'touch' or copy does not force re-extraction.
+        """
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        if entry['size'] != stat.st_size:
+            return False
+        if self.file_hash(source_path) == entry['sha1']:
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._save_manifest()
+            return True
+        return False
+
+    def locate(self, key, name):
+        """
+        (.npy path, source sha1) of an up-to-date entry, or None when the
+        array still has to be (re)derived from the source file.
+        """
+        source_path = os.path.join(self.source_dir, name)
+        stat = os.stat(source_path)
+
+        with self._lock:
+            entry = self._manifest.get(key, {}).get(name)
+            if entry is None or not self._is_fresh(entry, source_path, stat):
+                return None
+            npy_path = self.path(key, name)
+            if not os.path.exists(npy_path):
+                return None
+            return npy_path, entry['sha1']
+
+    def save(self, key, name, array, snapshot):
+        """Stores an array derived from the source file as it was at snapshot. Returns (.npy path, sha1)."""
+        npy_path = self.path(key, name)
+        os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+        with self._lock:
+            np.save(npy_path, array)
+            self._record(key, name, snapshot)
+        return npy_path, snapshot['sha1']
+
+    def adopt(self, key, name, src_path, snapshot):
+        """Moves a .npy written elsewhere (e.g. a worker process) into the store. Returns (.npy path, sha1)."""
+        npy_path = self.path(key, name)
+        os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+        with self._lock:
+            os.replace(src_path, npy_path)
+            self._record(key, name, snapshot)
+        return npy_path, snapshot['sha1']
+
+    def _record(self, key, name, snapshot):
+        self._manifest.setdefault(key, {})[name] = dict(snapshot)
+        self._save_manifest()
+
+    def entries(self, key):
+        """{name: snapshot} of every recorded entry under key (freshness is not checked)."""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._manifest.get(key, {}).items()}
+
+    def prune(self, names):
+        """Drops the entries of source files not in names. Returns the dropped (key, name) pairs."""
+        keep = set(names)
+        removed = []
+        with self._lock:
+            for key, entries in self._manifest.items():
+                for name in [n for n in entries if n not in keep]:
+                    npy_path = self.path(key, name)
+                    if os.path.exists(npy_path):
+                        os.remove(npy_path)
+                    del entries[name]
+                    removed.append((key, name))
+            if removed:
+                self._save_manifest()
+        return removed
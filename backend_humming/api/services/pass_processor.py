@@ -0,0 +1,390 @@
+import json
+import os
+import glob
+import hashlib
+import pickle
+import numpy as np
+from tqdm import tqdm
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from json_stream import iter_json_array, with_next
+from pass_table import TABLE_COLUMNS, chains_to_table, merge_tables, save_table, table_to_chains
+
+# --- Pass table builder ---
+# The data_processor_v3 scripts of backend_fifa_versions/version_3_* only point
+# main() at their data folders; the processing lives here, once.
+# Stand-alone (no api.* imports): imported as a top-level module with this
+# directory on sys.path, like json_stream and pass_table.
+LEVELS = range(1, 11)
+
+def load_json(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def process_match_refined(file_path, game_meta_entry, chains):
+    game_id = str(game_meta_entry['id']) # wait, ID is key
+    home_id = game_meta_entry['home']
+    away_id = game_meta_entry['away']
+
+    # Streamed: one event (+ the next one, for the pass end) in memory at a time
+    events = iter_json_array(file_path)
+
+    # 1. Parse all valid Passes into a structured list
+    pass_list = []
+
+    for event, next_event in with_next(events):
+        pos_evt = event.get('possessionEvents')
+        if not pos_evt or pos_evt.get('possessionEventType') != 'PA':
+            continue
+
+        # Get coordinates
+        stadium_meta = event.get('stadiumMetadata')
+        attack_dir_val = stadium_meta.get('teamAttackingDirection') if stadium_meta else 'R'
+        norm_factor = 1.0 if attack_dir_val == 'R' else -1.0
+
+        ball = event.get('ball')
+        if not ball: continue
+
+        bx = ball[0]['x'] * norm_factor
+        by = ball[0]['y'] * norm_factor
+
+        # End coordinates (look ahead in raw events)
+        ex, ey = bx, by
+        if next_event is not None:
+            next_ball = next_event.get('ball')
+            if next_ball:
+                ex = next_ball[0]['x'] * norm_factor
+                ey = next_ball[0]['y'] * norm_factor
+
+        # Players (Relative to Ball Start)
+        teammates = []
+        opponents = []
+        attack_team = event['gameEvents']['teamId']
+
+        # Quick extract
+        for p in event.get('homePlayers', []):
+            px, py = p['x'] * norm_factor, p['y'] * norm_factor
+            if str(home_id) == str(attack_team): teammates.append((px - bx, py - by))
+            else: opponents.append((px - bx, py - by))
+
+        for p in event.get('awayPlayers', []):
+            px, py = p['x'] * norm_factor, p['y'] * norm_factor
+            if str(away_id) == str(attack_team): teammates.append((px - bx, py - by))
+            else: opponents.append((px - bx, py - by))
+
+        pass_entry = {
+            'game_id': str(game_id), # Ensure string
+            'event_id': event['gameEventId'],
+            'timestamp': event['eventTime'],
+            'team_id': attack_team,
+            'start_x': bx, 'start_y': by,
+            'end_x': ex, 'end_y': ey,
+            'vector': (ex - bx, ey - by),
+            'teammates': teammates,
+            'opponents': opponents
+        }
+        pass_list.append(pass_entry)
+
+    # 2. Build Chains
+    # A chain is consecutive passes by same team
+    # We iterate pass_list. If team changes, break chain.
+    # Note: pass_list only has 'PA' events. So this skips intercepted passes automatically?
+    # Cons: If Team A passes, then Team A Dribbles, then Team A passes... is it a chain?
+    # User said "consecutive passes". P1->P2.
+    # We will assume contiguous in pass_list + Same Team = Chain.
+
+    current_chain = []
+
+    for p in pass_list:
+        if not current_chain:
+            current_chain.append(p)
+            continue
+
+        last = current_chain[-1]
+
+        # Check Team
+        if p['team_id'] == last['team_id']:
+            # Check Time Gap? (e.g. < 5 seconds between end of last and start of current?)
+            # Let's be lenient.
+            current_chain.append(p)
+        else:
+            # Process Chain
+            chains.append(current_chain)
+            current_chain = [p]
+
+    if current_chain:
+        chains.append(current_chain)
+
+def save_chain_to_dbs(chain, dbs):
+    # Retrieve chains of length 1 to 10 (only the lengths dbs has a list for)
+    L = len(chain)
+
+    for length in LEVELS:
+        if length > L: break
+        if length not in dbs: continue
+
+        # Sliding window
+        for i in range(L - length + 1):
+            seq = chain[i : i+length]
+
+            # Create Entry
+            # Features:
+            # - Start X,Y (of first pass)
+            # - List of Vectors
+            # - Players (of first pass only, or all? Usually first pass sets the scene)
+
+            first = seq[0]
+            vectors = [s['vector'] for s in seq]
+
+            entry = {
+                'game_id': first['game_id'],
+                'event_id': first['event_id'], # ID of first pass
+                'timestamp': first['timestamp'],
+                'length': length,
+                'start_x': first['start_x'],
+                'start_y': first['start_y'],
+                'vectors': vectors, # List of (dx, dy)
+                'teammates': first['teammates'], # Snapshot at start
+                'opponents': first['opponents']
+            }
+            dbs[length].append(entry)
+
+def process_match_file(file_path, game_meta_entry):
+    """One match, run in the worker processes: (pass table, None) or (None, error)."""
+    try:
+        chains = []
+        process_match_refined(file_path, game_meta_entry, chains)
+        return chains_to_table(chains), None
+    except Exception as e:
+        return None, str(e)
+
+class MatchCache:
+    """
+    Pass table of every processed match (matches/<event file>.npz) plus a
+    manifest.json of the event file (size, mtime, sha1) and metadata entry it
+    was built from, so --incremental runs only process new or changed matches.
+    outputs.json records which matches each output (passes/, every
+    fingerprints_{N}pass.pkl) was last written from, so unchanged outputs are
+    not rewritten.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.outputs_path = os.path.join(cache_dir, 'outputs.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest = self._load_json(self.manifest_path)
+        self.outputs = self._load_json(self.outputs_path)
+
+    @staticmethod
+    def _load_json(path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            return load_json(path)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Ignoring unreadable {path} ({e}), rebuilding.")
+            return {}
+
+    @staticmethod
+    def _save_json(path, data):
+        # Write-then-rename so a crash never leaves a truncated file behind
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def save(self):
+        self._save_json(self.manifest_path, self.manifest)
+        self._save_json(self.outputs_path, self.outputs)
+
+    @staticmethod
+    def file_hash(path, chunk_size=1 << 20):
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _table_path(self, file_path):
+        return os.path.join(self.cache_dir, os.path.basename(file_path) + '.npz')
+
+    def is_fresh(self, file_path, game_meta_entry):
+        """
+        Same metadata and same event file: size + mtime first, the sha1 only
+        when the mtime moved (a copy or 'touch' does not force reprocessing).
+        """
+        entry = self.manifest.get(os.path.basename(file_path))
+        if entry is None or entry['meta'] != game_meta_entry or not os.path.exists(self._table_path(file_path)):
+            return False
+        stat = os.stat(file_path)
+        if entry['size'] != stat.st_size:
+            return False
+        if entry['mtime_ns'] != stat.st_mtime_ns:
+            if self.file_hash(file_path) != entry['sha1']:
+                return False
+            entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def load(self, file_path):
+        with np.load(self._table_path(file_path), allow_pickle=False) as data:
+            return {name: data[name] for name in TABLE_COLUMNS}
+
+    @staticmethod
+    def _longest_chain(table):
+        return int(np.diff(table['chain_offsets']).max(initial=0))
+
+    def store(self, file_path, game_meta_entry, table):
+        stat = os.stat(file_path)
+        tmp_path = self._table_path(file_path) + '.tmp.npz'
+        np.savez(tmp_path, **table)
+        os.replace(tmp_path, self._table_path(file_path))
+        self.manifest[os.path.basename(file_path)] = {
+            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'sha1': self.file_hash(file_path), 'meta': game_meta_entry,
+            'longest_chain': self._longest_chain(table),
+        }
+
+    def longest_chain(self, file_path):
+        """Passes in the longest chain of the match: the highest level it has sequences in."""
+        entry = self.manifest[os.path.basename(file_path)]
+        if 'longest_chain' not in entry:
+            # Manifests written before it was recorded
+            entry['longest_chain'] = self._longest_chain(self.load(file_path))
+        return entry['longest_chain']
+
+    def sources_digest(self, file_paths):
+        """Digest of the matches (event file sha1 + metadata) an output is built from, in order."""
+        sources = [(os.path.basename(f), self.manifest[os.path.basename(f)]['sha1'],
+                    self.manifest[os.path.basename(f)]['meta']) for f in file_paths]
+        return hashlib.sha1(json.dumps(sources, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def prune(self, file_paths):
+        """Forgets matches whose event file is gone."""
+        keep = {os.path.basename(f) for f in file_paths}
+        for name in [name for name in self.manifest if name not in keep]:
+            del self.manifest[name]
+            table_path = os.path.join(self.cache_dir, name + '.npz')
+            if os.path.exists(table_path):
+                os.remove(table_path)
+
+def load_game_meta(metadata_dir):
+    game_meta = {}
+    for mf in glob.glob(os.path.join(metadata_dir, '*.json')):
+        try:
+            m = load_json(mf)[0]
+            game_meta[str(m['id'])] = {'id': m['id'], 'home': m['homeTeam']['id'], 'away': m['awayTeam']['id']}
+        except: pass
+    return game_meta
+
+def main(event_data_dir, metadata_dir, output_dir):
+    parser = argparse.ArgumentParser(description='Builds the pass table (and fingerprints_{N}pass databases).')
+    parser.add_argument('--pickle', dest='pickle', action='store_true', default=None,
+                        help='Write the fingerprints_{N}pass.pkl files (default, except with --incremental)')
+    parser.add_argument('--no-pickle', dest='pickle', action='store_false',
+                        help='Skip the fingerprints_{N}pass.pkl files (the version_3 apps still load them; '
+                             'the humming backend only needs the pass table)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Matches processed in parallel (1 = in this process)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process new or changed matches, reuse the others from data/matches, '
+                             'and only rewrite the outputs those matches are part of')
+    args = parser.parse_args()
+    if args.pickle is None:
+        # The pickles hold every sequence of every match again: an incremental
+        # run that rewrote them would cost as much I/O as a full one
+        args.pickle = not args.incremental
+
+    if not os.path.exists(output_dir): os.makedirs(output_dir)
+
+    # Load Meta
+    game_meta = load_game_meta(metadata_dir)
+
+    # Sorted, so the output does not depend on directory order or on the number of workers
+    files = sorted(f for f in glob.glob(os.path.join(event_data_dir, '*.json'))
+                   if os.path.basename(f).split('.')[0] in game_meta)
+    metas = {f: game_meta[os.path.basename(f).split('.')[0]] for f in files}
+
+    # Per-match tables, kept in data/matches for the next --incremental run
+    cache = MatchCache(os.path.join(output_dir, 'matches'))
+    cache.prune(files)
+    if args.incremental:
+        todo = [f for f in files if not cache.is_fresh(f, metas[f])]
+        print(f"{len(files) - len(todo)} matches unchanged, {len(todo)} to process.")
+    else:
+        todo = files
+
+    print(f"Processing matches ({args.workers} workers)...")
+    if args.workers > 1 and len(todo) > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers)
+        results = executor.map(process_match_file, todo, [metas[f] for f in todo])
+    else:
+        executor = None
+        results = map(process_match_file, todo, [metas[f] for f in todo])
+    failed = set()
+    try:
+        for f, (match_table, error) in zip(todo, tqdm(results, total=len(todo))):
+            if error is not None:
+                print(f"Error {f}: {error}")
+                failed.add(f)
+                cache.manifest.pop(os.path.basename(f), None)
+                continue
+            cache.store(f, metas[f], match_table)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        cache.save()
+
+    # Merged in file order, so incremental and full runs write the same outputs
+    built = [f for f in files if f not in failed]
+    tables = {}
+    def load_tables(file_paths):
+        for f in file_paths:
+            if f not in tables:
+                tables[f] = cache.load(f)
+        return [tables[f] for f in file_paths]
+
+    # An output only changes when one of its matches did: passes/ holds every
+    # match, level N only the matches with a chain of N or more passes
+    table_dir = os.path.join(output_dir, 'passes')
+    digest = cache.sources_digest(built)
+    if not args.incremental or cache.outputs.get('passes') != digest or not os.path.isdir(table_dir):
+        print("Saving pass table...")
+        table = merge_tables(load_tables(built))
+        save_table(table_dir, table)
+        cache.outputs['passes'] = digest
+        cache.save()
+        print(f"Saved {len(table['event_ids'])} passes in {len(table['chain_offsets']) - 1} chains.")
+    else:
+        print("Pass table up to date.")
+
+    level_files = {i: [f for f in built if cache.longest_chain(f) >= i] for i in LEVELS}
+    level_digests = {i: cache.sources_digest(level_files[i]) for i in LEVELS}
+    level_names = {i: f'fingerprints_{i}pass.pkl' for i in LEVELS}
+    stale = [i for i in LEVELS if cache.outputs.get(level_names[i]) != level_digests[i]
+             or not os.path.exists(os.path.join(output_dir, level_names[i]))]
+
+    if args.pickle:
+        levels = stale if args.incremental else list(LEVELS)
+        if levels:
+            # Only the matches that have sequences in the lowest level written
+            dbs = {i: [] for i in levels}
+            for chain in table_to_chains(merge_tables(load_tables(level_files[levels[0]]))):
+                save_chain_to_dbs(chain, dbs)
+            for i in levels:
+                pkl_path = os.path.join(output_dir, level_names[i])
+                with open(pkl_path + '.tmp', 'wb') as f:
+                    pickle.dump(dbs[i], f)
+                os.replace(pkl_path + '.tmp', pkl_path)
+                cache.outputs[level_names[i]] = level_digests[i]
+                print(f"Saved L={i}: {len(dbs[i])} entries.")
+        unchanged = [i for i in LEVELS if i not in levels]
+        if unchanged:
+            print(f"Levels {unchanged} up to date.")
+    else:
+        outdated = [i for i in stale if os.path.exists(os.path.join(output_dir, level_names[i]))]
+        if outdated:
+            print(f"WARNING: fingerprints_{{N}}pass.pkl out of date for levels {outdated}, "
+                  f"run with --pickle to refresh them.")
+
+    cache.save()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import numpy as np
+
+# --- Pass table format ---
+# passes/ stores every pass once, the passes of a chain (consecutive passes of one
+# team, see pass_processor) next to each other; one .npy per column, opened
+# memory-mapped (no parsing):
+#   games (G,) game ids, game_codes (P,) row in games, event_ids (P,), timestamps (P,),
+#   starts (P, 2) ball start, vectors (P, 2) pass vector,
+#   teammates (T, 2) + teammate_offsets (P + 1,), opponents (O, 2) + opponent_offsets (P + 1,)
+#   (pass p owns points[offsets[p]:offsets[p + 1]]),
+#   chain_offsets (C + 1,) (chain c is passes chain_offsets[c]:chain_offsets[c + 1])
+# An N-pass sequence is N consecutive passes of one chain, so a level is only the
+# indices of its first passes (see PassLevel) and any N can be served.
+#
+# Written by the data_processor_v3 scripts in backend_fifa_versions and read by
+# pattern_matcher_v3. Stand-alone (no api.* imports) so the scripts can import it
+# from this directory.
+TABLE_COLUMNS = ('games', 'game_codes', 'event_ids', 'timestamps', 'starts', 'vectors',
+                 'teammates', 'teammate_offsets', 'opponents', 'opponent_offsets', 'chain_offsets')
+
+def _points_to_csr(point_lists):
+    """List of (x, y) lists -> (M, 2) points + (N + 1,) offsets."""
+    offsets = np.zeros(len(point_lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(points) for points in point_lists])
+    points = np.array([p for points in point_lists for p in points], dtype=np.float64).reshape(-1, 2)
+    return points, offsets
+
+def chains_to_table(chains):
+    """Chains of pass dicts (the pass_list entries of pass_processor) -> table columns."""
+    passes = [p for chain in chains for p in chain]
+    games, game_codes = np.unique(np.array([str(p['game_id']) for p in passes], dtype=str), return_inverse=True)
+    teammates, teammate_offsets = _points_to_csr([p['teammates'] for p in passes])
+    opponents, opponent_offsets = _points_to_csr([p['opponents'] for p in passes])
+    chain_offsets = np.zeros(len(chains) + 1, dtype=np.int64)
+    chain_offsets[1:] = np.cumsum([len(chain) for chain in chains])
+    return {
+        'games': games,
+        'game_codes': game_codes.astype(np.int32),
+        'event_ids': np.array([p['event_id'] for p in passes], dtype=np.int64),
+        'timestamps': np.array([p['timestamp'] for p in passes], dtype=np.float64),
+        'starts': np.array([(p['start_x'], p['start_y']) for p in passes], dtype=np.float64).reshape(-1, 2),
+        'vectors': np.array([p['vector'] for p in passes], dtype=np.float64).reshape(-1, 2),
+        'teammates': teammates, 'teammate_offsets': teammate_offsets,
+        'opponents': opponents, 'opponent_offsets': opponent_offsets,
+        'chain_offsets': chain_offsets,
+    }
+
+def table_to_chains(table):
+    """Table columns -> chains of pass dicts (inverse of chains_to_table)."""
+    chains = []
+    for c in range(len(table['chain_offsets']) - 1):
+        chain = []
+        for p in range(table['chain_offsets'][c], table['chain_offsets'][c + 1]):
+            tm = table['teammates'][table['teammate_offsets'][p]:table['teammate_offsets'][p + 1]]
+            op = table['opponents'][table['opponent_offsets'][p]:table['opponent_offsets'][p + 1]]
+            chain.append({
+                'game_id': str(table['games'][table['game_codes'][p]]),
+                'event_id': int(table['event_ids'][p]),
+                'timestamp': float(table['timestamps'][p]),
+                'start_x': float(table['starts'][p, 0]), 'start_y': float(table['starts'][p, 1]),
+                'vector': tuple(table['vectors'][p].tolist()),
+                'teammates': [tuple(pt) for pt in tm.tolist()],
+                'opponents': [tuple(pt) for pt in op.tolist()],
+            })
+        chains.append(chain)
+    return chains
+
+def entries_to_table(entries):
+    """
+    Entries of an old fingerprints_{N}pass.pkl -> table with one chain per entry.
+    Entries only keep the players of their first pass, the other passes get none.
+    """
+    chains = []
+    for e in entries:
+        first = {'game_id': e['game_id'], 'event_id': e['event_id'], 'timestamp': e['timestamp'],
+                 'start_x': e['start_x'], 'start_y': e['start_y'], 'vector': e['vectors'][0],
+                 'teammates': e['teammates'], 'opponents': e['opponents']}
+        chains.append([first] + [dict(first, vector=vector, teammates=[], opponents=[]) for vector in e['vectors'][1:]])
+    return chains_to_table(chains)
+
+def merge_tables(tables):
+    """Concatenates tables (e.g. one per match) in order: codes and offsets are re-based."""
+    if not tables:
+        return chains_to_table([])
+    games = np.unique(np.concatenate([t['games'] for t in tables]))
+    merged = {name: [] for name in TABLE_COLUMNS if name != 'games'}
+    base = {'teammate_offsets': 0, 'opponent_offsets': 0, 'chain_offsets': 0}
+    for n, t in enumerate(tables):
+        merged['game_codes'].append(np.searchsorted(games, t['games']).astype(np.int32)[t['game_codes']])
+        for name in ('event_ids', 'timestamps', 'starts', 'vectors', 'teammates', 'opponents'):
+            merged[name].append(t[name])
+        for name in base:
+            # Every table's offsets start at 0: keep that 0 only once
+            merged[name].append(t[name][(0 if n == 0 else 1):] + base[name])
+            base[name] += t[name][-1]
+    merged = {name: np.concatenate(arrays) for name, arrays in merged.items()}
+    merged['games'] = games
+    return merged
+
+def save_table(table_dir, columns):
+    """Writes a table directory; replaced in one rename so readers never see half of it."""
+    tmp_dir = table_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in TABLE_COLUMNS:
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(columns[name]), allow_pickle=False)
+    shutil.rmtree(table_dir, ignore_errors=True)
+    os.replace(tmp_dir, table_dir)
+
+def load_table(table_dir):
+    return {name: np.load(os.path.join(table_dir, f'{name}.npy'), mmap_mode='r') for name in TABLE_COLUMNS}
@@ -1,96 +1,408 @@
 import numpy as np
 import pickle
 import os
-from scipy.spatial.distance import cdist
+import threading
+from collections import OrderedDict
+from scipy.spatial import cKDTree
+from api.services.chamfer import batch_chamfer_distance
+from api.services.pass_table import entries_to_table, save_table, load_table
+
+PASS_LEVELS = range(1, 11)
+TREE_EPS = 0.5 # approximation of KD-tree queries on levels of 4+ passes
+TREE_NODE_BYTES = 72 # approximate size of one cKDTree node (not visible from Python)
+
+class LevelEntries:
+    """
+    Read-only list view of a level's entries (same dicts as the old pickles),
+    built from the columns when accessed.
+    """
+    def __init__(self, level):
+        self._level = level
+
+    def __len__(self):
+        return self._level.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._level.entry(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('entry index out of range')
+        return self._level.entry(i)
+
+    def __iter__(self):
+        return (self._level.entry(i) for i in range(len(self)))
+
+class PassLevel:
+    """
+    The length-pass sequences of a pass table: sequence i starts at pass
+    first_pass[i], its vectors are the table vectors of the next `length`
+    passes. Never mutated after loading (except for the KD-tree, built under
+    a lock on the first indexed query), so requests can share it.
+    """
+    def __init__(self, length, table, shared_table=True):
+        self.length = length
+        self.table = table
+        chain_offsets = table['chain_offsets']
+        chain_ends = np.repeat(chain_offsets[1:], np.diff(chain_offsets))
+        self.first_pass = np.flatnonzero(chain_ends - np.arange(len(chain_ends)) >= length)
+        self.size = len(self.first_pass)
+        self.database = LevelEntries(self)
+        self.match_index = self._index_matches()
+        # KD-tree over the flattened vectors (see nearest_sequences), only built for
+        # use_index queries
+        self._tree = None
+        self._tree_nbytes = 0
+        self._tree_lock = threading.Lock()
+        # Own arrays, plus the table when no other level uses it
+        self._base_nbytes = self.first_pass.nbytes + sum(a.nbytes for a in self.match_index.values())
+        if not shared_table:
+            self._base_nbytes += sum(a.nbytes for a in table.values())
+
+    @property
+    def nbytes(self):
+        """Resident size: own arrays (+ table if not shared) + the KD-tree once built."""
+        return self._base_nbytes + self._tree_nbytes
+
+    @property
+    def tree(self):
+        """KD-tree over the flattened 2 * length dimensional vectors, built on first use."""
+        if self._tree is None:
+            with self._tree_lock:
+                if self._tree is None:
+                    embeddings = self.table['vectors'][self.first_pass[:, None] + np.arange(self.length)]
+                    tree = cKDTree(embeddings.reshape(self.size, 2 * self.length).astype(np.float64))
+                    # Points (kept by the tree) + indices + nodes
+                    self._tree_nbytes = tree.data.nbytes + tree.indices.nbytes + tree.size * TREE_NODE_BYTES
+                    self._tree = tree
+        return self._tree
+
+    @classmethod
+    def from_entries(cls, length, entries):
+        return cls(length, entries_to_table(entries), shared_table=False)
+
+    def _index_matches(self):
+        """game_id (str) -> sequence indices of that match sorted by timestamp (ties in database order)."""
+        codes = self.table['game_codes'][self.first_pass]
+        order = np.lexsort((self.table['timestamps'][self.first_pass], codes)) # stable: ties keep database order
+        games = self.table['games']
+        bounds = np.searchsorted(codes[order], np.arange(len(games) + 1))
+        return {str(game): order[bounds[g]:bounds[g + 1]] for g, game in enumerate(games) if bounds[g + 1] > bounds[g]}
+
+    def entry(self, i):
+        """Sequence i as a fingerprint dict (the old pickle layout)."""
+        t = self.table
+        p = int(self.first_pass[i])
+        teammates = t['teammates'][t['teammate_offsets'][p]:t['teammate_offsets'][p + 1]]
+        opponents = t['opponents'][t['opponent_offsets'][p]:t['opponent_offsets'][p + 1]]
+        return {
+            'game_id': str(t['games'][t['game_codes'][p]]),
+            'event_id': int(t['event_ids'][p]),
+            'timestamp': float(t['timestamps'][p]),
+            'length': self.length,
+            'start_x': float(t['starts'][p, 0]),
+            'start_y': float(t['starts'][p, 1]),
+            'vectors': [tuple(v) for v in t['vectors'][p:p + self.length].tolist()],
+            'teammates': [tuple(pt) for pt in teammates.tolist()],
+            'opponents': [tuple(pt) for pt in opponents.tolist()],
+        }
+
+    def game_code(self, game_id):
+        """Row of game_id in the table's games, -1 if the table has no such game."""
+        games = self.table['games']
+        code = np.searchsorted(games, str(game_id))
+        return int(code) if code < len(games) and games[code] == str(game_id) else -1
+
+    def vector_distance(self, q_vecs, rows=None):
+        """Mean distance between q_vecs (length, 2) and the vectors of sequences `rows` (default: all)."""
+        first_pass = self.first_pass if rows is None else self.first_pass[rows]
+        vectors = self.table['vectors']
+        total = np.zeros(len(first_pass))
+        for k in range(self.length):
+            total += np.linalg.norm(vectors[first_pass + k] - q_vecs[k], axis=1)
+        return total / self.length
+
+    def nearest_sequences(self, q_vecs, k):
+        """
+        Indices of the k sequences nearest to q_vecs, with the vectors
+        flattened to 2 * length dimensions. That Euclidean distance is not
+        vector_distance (the mean of the per-pass distances) beyond 1-pass
+        levels: vector_distance <= flattened <= length * vector_distance, so
+        the set only approximates the vector_distance top k and callers re-rank
+        it with vector_distance. From 4 passes (8 dimensions) on, exact KD-tree
+        queries get slow, so neighbours are only guaranteed within
+        (1 + TREE_EPS) of the true flattened distance there.
+        """
+        eps = 0 if self.length < 4 else TREE_EPS
+        _, rows = self.tree.query(np.asarray(q_vecs, dtype=np.float64).ravel(), k=min(k, self.size), eps=eps)
+        return np.atleast_1d(rows)
+
+    def match_count(self, match_id):
+        """Number of sequences of a match in this level."""
+        indices = self.match_index.get(str(match_id))
+        return 0 if indices is None else len(indices)
+
+    def match_play(self, match_id, play_index):
+        """play_index-th sequence of a match in time order, None if out of range."""
+        indices = self.match_index.get(str(match_id))
+        if indices is None or not 0 <= play_index < len(indices):
+            return None
+        return self.entry(indices[play_index])
+
+    def padded_points(self, kind, batch):
+        """
+        'teammates' / 'opponents' of the entries in batch as a (B, P, 2)
+        zero-padded array + (B,) counts.
+        """
+        points = self.table[kind]
+        offsets = self.table[kind[:-1] + '_offsets']
+        passes = self.first_pass[batch]
+        starts = offsets[passes]
+        counts = offsets[passes + 1] - starts
+        width = max(1, counts.max(initial=0))
+        valid = np.arange(width)[None, :] < counts[:, None]
+        if len(points) == 0:
+            return np.zeros((len(batch), width, 2)), counts
+        rows = np.where(valid, starts[:, None] + np.arange(width)[None, :], 0)
+        return np.where(valid[:, :, None], points[rows], 0.0), counts
 
 class FingerprintDatabaseV3:
-    def __init__(self, base_data_dir=None):
+    """
+    All pass-length levels, loaded once and kept resident.
+
+    Levels are read at startup (preload) and served from memory afterwards.
+    With a memory_budget (bytes), the least recently used levels are dropped
+    once the budget is exceeded and re-read on their next use; at most
+    max_levels levels are resident either way. Only lengths 1..max_length
+    are served.
+    """
+    def __init__(self, base_data_dir=None, memory_budget=None, preload=True, max_levels=len(PASS_LEVELS)):
         if base_data_dir is None:
             self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             self.data_dir = os.path.join(self.base_dir, 'data', 'fifa')
         else:
             self.data_dir = base_data_dir
-            
+        
+        self.memory_budget = memory_budget
+        self.max_levels = max_levels
+        self._table = None # shared pass table (passes/), loaded with the first level
+        self._max_length = None
+        self._levels = OrderedDict() # length -> PassLevel, least recently used first
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        
+        # Default level for callers that do not pass a length (scripts, load_level)
         self.current_length = 1
-        self.database = []
-        self.load_level(1)
         
+        if preload:
+            for length in PASS_LEVELS:
+                if length > self.max_length:
+                    break
+                self.get_level(length)
+                if self.memory_budget is not None and self._resident_bytes() >= self.memory_budget:
+                    break
+        
+    @property
+    def database(self):
+        return self.get_level(self.current_length).database
+
     def load_level(self, length):
-        """Loads the database for a specific number of passes (1-10)."""
+        """Selects the default level (1 to max_length). Loaded once, then resident."""
         self.current_length = length
-        db_path = os.path.join(self.data_dir, f'fingerprints_{length}pass.pkl')
+        self.get_level(length)
+
+    @property
+    def max_length(self):
+        """
+        Longest sequence served (0 if there is no data): the longest chain of
+        the pass table or, without one, the longest old level on disk.
+        """
+        if self._max_length is None:
+            table = self._pass_table()
+            if table is not None:
+                self._max_length = int(np.diff(table['chain_offsets']).max(initial=0))
+            else:
+                on_disk = [length for length in PASS_LEVELS
+                           if os.path.exists(os.path.join(self.data_dir, f'fingerprints_{length}pass.pkl'))
+                           or os.path.isdir(os.path.join(self.data_dir, f'fingerprints_{length}pass'))]
+                self._max_length = max(on_disk, default=0)
+        return self._max_length
+
+    def _resident_bytes(self):
+        with self._lock:
+            return sum(level.nbytes for level in self._levels.values())
+
+    def _pass_table(self):
+        """The shared pass table written by data_processor_v3, None if there is none."""
+        if self._table is None:
+            table_dir = os.path.join(self.data_dir, 'passes')
+            if os.path.isdir(table_dir):
+                print(f"Loading pass table from {table_dir}...")
+                self._table = load_table(table_dir)
+                print(f"Loaded {len(self._table['event_ids'])} passes.")
+        return self._table
+
+    def _read_level(self, length):
+        table = self._pass_table()
+        if table is not None:
+            level = PassLevel(length, table)
+            print(f"L{length}: {level.size} sequences.")
+            return level
+        
+        # Older data_processor_v3 output: one pickle per level, converted once
+        # into a table of its own that later starts map
+        level_dir = os.path.join(self.data_dir, f'fingerprints_{length}pass')
+        db_path = level_dir + '.pkl'
+        pickle_is_newer = os.path.exists(db_path) and (
+            not os.path.isdir(level_dir) or os.path.getmtime(db_path) > os.path.getmtime(level_dir))
         
-        if os.path.exists(db_path):
-            print(f"Loading L{length} database from {db_path}...")
+        if pickle_is_newer:
+            print(f"Converting L{length} database from {db_path}...")
             with open(db_path, 'rb') as f:
-                self.database = pickle.load(f)
-            print(f"Loaded {len(self.database)} sequences.")
-        else:
-            print(f"WARNING: Database not found at {db_path}")
-            self.database = []
+                level_table = entries_to_table(pickle.load(f))
+            try:
+                save_table(level_dir, level_table)
+            except OSError as e:
+                print(f"WARNING: Could not write {level_dir}: {e}")
+                level = PassLevel(length, level_table, shared_table=False)
+                print(f"Loaded {level.size} sequences.")
+                return level
+        
+        if os.path.isdir(level_dir):
+            print(f"Loading L{length} database from {level_dir}...")
+            level = PassLevel(length, load_table(level_dir), shared_table=False)
+            print(f"Loaded {level.size} sequences.")
+            return level
+        
+        print(f"WARNING: Database not found at {level_dir}")
+        return PassLevel.from_entries(length, [])
 
-    def _vector_distance(self, vecs_a, vecs_b):
+    def get_level(self, length):
         """
-        Computes mean Euclidean distance between sequence of vectors.
-        vecs_a: list of (dx, dy)
-        vecs_b: list of (dx, dy)
-        Length is assumed same.
+        The PassLevel for `length` passes (1..max_length, ValueError otherwise);
+        safe to call from concurrent requests.
         """
-        arr_a = np.array(vecs_a)
-        arr_b = np.array(vecs_b)
-        dist = np.linalg.norm(arr_a - arr_b, axis=1) # Per vector distance
-        return np.mean(dist)
-
-    def _chamfer_distance(self, set_a, set_b):
-        """Standard Chamfer distance for player constellations."""
-        if len(set_a) == 0 or len(set_b) == 0: return float('inf')
-        dists = cdist(set_a, set_b, metric='euclidean')
-        return np.mean(np.min(dists, axis=1)) + np.mean(np.min(dists, axis=0))
-
-    def find_nearest_neighbors(self, query, top_k=5, w_vec=1.0, w_player=0.2):
+        if not 1 <= length <= self.max_length:
+            raise ValueError(f"No {length}-pass sequences (served: 1 to {self.max_length} passes)")
+        with self._lock:
+            level = self._levels.get(length)
+            if level is not None:
+                self._levels.move_to_end(length)
+                return level
+        
+        # One loader at a time, so concurrent misses do not read the same file twice
+        with self._load_lock:
+            with self._lock:
+                level = self._levels.get(length)
+            if level is None:
+                level = self._read_level(length)
+            
+            with self._lock:
+                self._levels[length] = level
+                self._levels.move_to_end(length)
+                while len(self._levels) > max(1, self.max_levels):
+                    evicted_length, _ = self._levels.popitem(last=False)
+                    print(f"DEBUG: Evicting L{evicted_length} database (level limit)")
+                self._enforce_budget()
+            return level
+
+    def _enforce_budget(self):
+        """Evicts least recently used levels beyond memory_budget (call with _lock held)."""
+        if self.memory_budget is None:
+            return
+        total = sum(l.nbytes for l in self._levels.values())
+        while total > self.memory_budget and len(self._levels) > 1:
+            evicted_length, evicted = self._levels.popitem(last=False)
+            total -= evicted.nbytes
+            print(f"DEBUG: Evicting L{evicted_length} database (memory budget)")
+
+    def find_nearest_neighbors(self, query, top_k=5, w_vec=1.0, w_player=0.2, batch_size=512, length=None,
+                               max_candidates=None, zone_radius=None, use_index=False):
         """
         Multi-component similarity:
         1. Vector Shape (Direction/Length) [High Importance]
         2. Player Configuration (Chamfer) [Lower Importance]
+        Searches the `length`-pass level (default: current_length).
+
+        Two stages: entries are ranked by the cheap vector distance, then
+        the Chamfer term is computed in that order only while an entry can
+        still reach the top_k (exact). With max_candidates, only that many
+        best vector matches get the Chamfer term (approximate, faster); with
+        use_index as well, they come from the level's KD-tree instead of a
+        scan of every entry (the flattened-vector nearest ones, re-ranked by
+        the vector distance; see PassLevel.nearest_sequences). zone_radius keeps entries starting within that
+        distance of the query's start_x/start_y.
         """
-        if not self.database: return []
+        if max_candidates is not None and max_candidates < 1:
+            raise ValueError("max_candidates must be at least 1")
+        level = self.get_level(length if length is not None else self.current_length)
+        if level.size == 0 or top_k <= 0: return []
         
-        q_vecs = query['vectors']
-        q_tm = np.array(query['teammates'])
-        q_op = np.array(query['opponents'])
+        q_vecs = np.asarray(query['vectors'], dtype=np.float64).reshape(-1, 2)
+        q_tm = np.asarray(query['teammates'], dtype=np.float64).reshape(-1, 2)
+        q_op = np.asarray(query['opponents'], dtype=np.float64).reshape(-1, 2)
         
-        results = []
+        # 1. Candidates: every entry, or the nearest ones from the KD-tree (+1 for the query itself)
+        if use_index and max_candidates is not None:
+            order = np.sort(level.nearest_sequences(q_vecs, max_candidates + 1))
+            # The first indexed query builds the level's tree, which counts against the budget
+            with self._lock:
+                self._enforce_budget()
+        else:
+            order = np.arange(level.size)
+        first_pass = level.first_pass[order]
         
-        for entry in self.database:
-            # Skip self
-            if entry['game_id'] == query['game_id'] and entry['timestamp'] == query['timestamp']:
-                continue
-                
-            # 1. Vector Distance (Primary)
-            # Both query and entry are sequences of same length 'current_length'
-            d_vec = self._vector_distance(q_vecs, entry['vectors'])
-            
-            # Optimization: If vector shape is too different, don't bother with expensive Chamfer?
-            # Let's keep it simple for now.
-            
-            # 2. Player Distance (Secondary)
-            # Comparing the snapshot at the START of the sequence
-            e_tm = np.array(entry['teammates'])
-            e_op = np.array(entry['opponents'])
-            
-            d_tm = self._chamfer_distance(q_tm, e_tm)
-            d_op = self._chamfer_distance(q_op, e_op)
+        # Skip self
+        keep = ((level.table['game_codes'][first_pass] != level.game_code(query['game_id']))
+                | (level.table['timestamps'][first_pass] != query['timestamp']))
+        
+        # Optional start zone
+        if zone_radius is not None:
+            offsets = level.table['starts'][first_pass] - np.array([query['start_x'], query['start_y']])
+            keep &= np.einsum('ij,ij->i', offsets, offsets) <= zone_radius ** 2
+        order = order[keep]
+        
+        # Vector Distance (Primary), ties in database order
+        # Both query and entry are sequences of same length 'current_length'
+        d_vec = level.vector_distance(q_vecs, order)
+        ranked = np.lexsort((order, d_vec))[:max_candidates]
+        order, d_vec = order[ranked], d_vec[ranked]
+        lower_bound = w_vec * d_vec # Chamfer distances are >= 0
+        
+        # 2. Player Distance (Secondary), only while it can still change the top_k
+        best_dist = np.empty(0)
+        best_idx = np.empty(0, dtype=np.int64)
+        start = 0
+        while start < len(order):
+            stop = min(start + batch_size, len(order))
+            if len(best_dist) >= top_k:
+                # Entries whose lower bound is above the current k-th best cannot get in
+                stop = start + np.searchsorted(lower_bound[start:stop], best_dist[top_k - 1], side='right')
+                if stop == start:
+                    break
+            batch = order[start:stop]
             
-            total_dist = (w_vec * d_vec) + (w_player * (d_tm + d_op))
+            d_tm = batch_chamfer_distance(q_tm, *level.padded_points('teammates', batch))
+            d_op = batch_chamfer_distance(q_op, *level.padded_points('opponents', batch))
+            total_dist = (w_vec * d_vec[start:stop]) + (w_player * (d_tm + d_op))
+            start = stop
             
+            # Keep the best top_k, ties in database order (like the stable sort over all entries)
+            best_dist = np.concatenate([best_dist, total_dist])
+            best_idx = np.concatenate([best_idx, batch])
+            keep = np.lexsort((best_idx, best_dist))[:top_k]
+            best_dist, best_idx = best_dist[keep], best_idx[keep]
+        
+        results = []
+        for dist, i in zip(best_dist, best_idx):
+            entry = level.entry(i)
             results.append({
                 'match': entry['game_id'],
                 'event_id': entry['event_id'],
                 'timestamp': entry['timestamp'],
                 'length': entry['length'],
-                'distance': total_dist,
+                'distance': float(dist),
                 'data': entry
             })
-            
-        results.sort(key=lambda x: x['distance'])
-        return results[:top_k]
+        return results
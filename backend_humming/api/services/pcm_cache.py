@@ -0,0 +1,53 @@
+import os
+import librosa
+import numpy as np
+from api.services.npy_store import NpyStore
+
+class PCMCache:
+    """
+    Decoded + resampled reference songs (mono float32 at sample_rate), shared
+    by every processor version, so switching between v0-v3 never decodes an
+    MP3 again. Stored as .npy and opened memory-mapped; invalidated like the
+    feature index (size/mtime, then sha1 of the source song).
+    """
+    def __init__(self, songs_dir, cache_dir, sample_rate=22050):
+        self.songs_dir = songs_dir
+        self.index_dir = cache_dir
+        self.sample_rate = sample_rate
+        self.key = f'{sample_rate}hz'
+        self._store = NpyStore(songs_dir, cache_dir)
+
+    def snapshot(self, song_file):
+        """Size/mtime/sha1 of song_file now; take it before decoding the song."""
+        return self._store.snapshot(song_file)
+
+    def load(self, song_file):
+        """Memory-mapped signal of song_file, decoding it on first use."""
+        location = self._store.locate(self.key, song_file)
+        if location is None:
+            print(f"DEBUG: Decoding {song_file} into the PCM cache")
+            snapshot = self.snapshot(song_file)
+            try:
+                signal, _ = librosa.load(os.path.join(self.songs_dir, song_file), sr=self.sample_rate, mono=True)
+            except Exception as e:
+                raise ValueError(f"Error loading audio file: {e}")
+            # Never kept in RAM: the memory map below is what callers get
+            location = self.store(song_file, signal.astype(np.float32), snapshot)
+        return np.load(location[0], mmap_mode='r')
+
+    def store(self, song_file, signal, snapshot):
+        """Persists a signal decoded from song_file as it was at snapshot. Returns (path, song sha1)."""
+        return self._store.save(self.key, song_file, signal, snapshot)
+
+    def path(self, song_file):
+        """Cached .npy path of song_file, None if it still has to be decoded."""
+        location = self._store.locate(self.key, song_file)
+        return location[0] if location is not None else None
+
+    def adopt(self, song_file, pcm_path, snapshot):
+        """Moves a .npy decoded elsewhere (a worker process, see scoring_pool.py) into the cache."""
+        return self._store.adopt(self.key, song_file, pcm_path, snapshot)[0]
+
+    def prune(self, song_files):
+        """Drops cached signals of songs that are no longer in the songs folder."""
+        self._store.prune(song_files)
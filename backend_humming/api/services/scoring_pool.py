@@ -0,0 +1,139 @@
+import os
+import time
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# --- Worker side ---
+# Reference features each worker has already read from the feature index:
+# feature_path -> (song sha1, features). Survives between requests, least
+# recently used songs dropped beyond WORKER_CACHE_BYTES per worker.
+WORKER_CACHE_BYTES = 256 * 1024 * 1024
+_worker_features = OrderedDict()
+_worker_bytes = 0
+
+def _warm_up(sample_rate):
+    """
+    Runs once per worker: imports librosa and runs every processor on a short
+    signal so lazy imports / numba compilation are paid before the first request.
+    """
+    from api.services.audio_processor import AudioProcessor
+    from api.services.audio_processor_v1 import AudioProcessorV1
+    from api.services.audio_processor_v2 import AudioProcessorV2
+    from api.services.audio_processor_v3 import AudioProcessorV3
+
+    signal = np.random.default_rng(0).normal(0, 0.1, sample_rate).astype(np.float32)
+    for processor in (AudioProcessor(sample_rate), AudioProcessorV1(sample_rate),
+                      AudioProcessorV2(sample_rate), AudioProcessorV3(sample_rate)):
+        processor.extract_features(signal)
+
+def _load_reference(feature_path, sha1):
+    global _worker_bytes
+    cached = _worker_features.get(feature_path)
+    if cached is not None and cached[0] == sha1:
+        _worker_features.move_to_end(feature_path)
+        return cached[1]
+    features = np.load(feature_path)
+    if cached is not None:
+        _worker_bytes -= cached[1].nbytes
+    _worker_features[feature_path] = (sha1, features)
+    _worker_features.move_to_end(feature_path)
+    _worker_bytes += features.nbytes
+    while _worker_bytes > WORKER_CACHE_BYTES and len(_worker_features) > 1:
+        _, (_, evicted) = _worker_features.popitem(last=False)
+        _worker_bytes -= evicted.nbytes
+    return features
+
+def _extract_task(processor, song_path, pcm_path, pcm_dir):
+    """
+    Extracts reference features, from the cached PCM when there is one.
+    Otherwise decodes the song and, with a pcm_dir, also leaves the decoded
+    signal there for the request process to adopt into the PCM cache.
+    """
+    if pcm_path is not None:
+        return processor.extract_features(np.load(pcm_path, mmap_mode='r')), None
+    
+    db_signal = processor.load_audio(song_path)
+    new_pcm_path = None
+    if pcm_dir is not None:
+        fd, new_pcm_path = tempfile.mkstemp(prefix='decoded_', suffix='.npy', dir=pcm_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, db_signal.astype(np.float32))
+    return processor.extract_features(db_signal), new_pcm_path
+
+def _score_task(processor, query_features, feature_path, sha1):
+    start = time.time()
+    db_features = _load_reference(feature_path, sha1)
+    similarity = processor.score_features(query_features, db_features)
+    return similarity, time.time() - start
+
+# --- Request side ---
+
+class ScoringPool:
+    """
+    Pool of warm worker processes for CPU-bound song comparisons.
+
+    The pool is started lazily on first use and kept alive between requests.
+    Workers only read feature files; the request process stays the single
+    writer of the feature index (see FeatureIndex.locate / store).
+    """
+    def __init__(self, workers, sample_rate=22050):
+        self.workers = workers
+        self.sample_rate = sample_rate
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                print(f"DEBUG: Starting scoring pool with {self.workers} workers")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up,
+                                                     initargs=(self.sample_rate,))
+            return self._executor
+
+    def _run(self, futures):
+        """Yields (key, result) as workers finish; a crashed pool is rebuilt on the next call."""
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            raise
+
+    def extract(self, processor, songs_dir, song_files, pcm_paths=None, pcm_dir=None):
+        """
+        Decodes + extracts reference features in parallel.
+        pcm_paths: song_file -> cached PCM .npy (or None) to skip decoding.
+        Yields (song_file, features, path of the newly decoded PCM or None).
+        """
+        if not song_files:
+            return
+        pcm_paths = pcm_paths or {}
+        executor = self._get_executor()
+        futures = {executor.submit(_extract_task, processor, os.path.join(songs_dir, song_file),
+                                   pcm_paths.get(song_file), pcm_dir): song_file
+                   for song_file in song_files}
+        for song_file, (features, new_pcm_path) in self._run(futures):
+            yield song_file, features, new_pcm_path
+
+    def score(self, processor, query_features, references):
+        """
+        query_features: processor.extract_features of the hum (extracted once, by the caller)
+        references: list of (song_file, feature_path, sha1) from FeatureIndex.locate
+        Yields (song_file, similarity, seconds) in completion order.
+        """
+        executor = self._get_executor()
+        futures = {executor.submit(_score_task, processor, query_features, feature_path, sha1): song_file
+                   for song_file, feature_path, sha1 in references}
+        for song_file, (similarity, seconds) in self._run(futures):
+            yield song_file, similarity, seconds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
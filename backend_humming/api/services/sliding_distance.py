@@ -0,0 +1,86 @@
+import numpy as np
+from scipy.fft import next_fast_len
+
+# Sliding z-normalized Euclidean distance (MASS) between a hum contour and every
+# offset of a reference contour, for all tempos of a small bank at once.
+# One FFT of the reference serves every scaled hum: O(M log M) per song instead
+# of the O(N * M) of a DTW, so it is cheap enough to pre-rank a large catalogue.
+
+# Matched song frames / hum frames tried by the tempo bank (like STRETCH_BAND)
+TEMPO_SCALES = (0.6, 0.7, 0.8, 0.9, 1.0, 1.15, 1.3, 1.45, 1.6)
+
+def z_normalize(x):
+    std = np.std(x)
+    return (x - np.mean(x)) / std if std > 0 else np.zeros(len(x))
+
+def tempo_bank(query, scales=TEMPO_SCALES, max_length=None):
+    """[(scale, z-normalized query resampled to round(scale * len(query)) frames)], skipping lengths < 2 or > max_length."""
+    query = np.asarray(query, dtype=np.float64)
+    bank = []
+    for scale in scales:
+        length = int(round(scale * len(query)))
+        if length < 2 or (max_length is not None and length > max_length):
+            continue
+        resampled = np.interp(np.linspace(0, len(query) - 1, length), np.arange(len(query)), query)
+        bank.append((scale, z_normalize(resampled)))
+    return bank
+
+def distance_profiles(queries, reference):
+    """
+    Distance of every z-normalized query (each no longer than reference) to every
+    window of reference, per frame: ||z(q) - z(window)|| / sqrt(len(q)), in [0, 2].
+    Returns one profile (len(reference) - len(q) + 1,) per query.
+    (Near) constant windows count as uncorrelated (distance sqrt(2)).
+    """
+    # Centered, so the cumulative sums below lose little precision on long songs
+    reference = np.asarray(reference, dtype=np.float64)
+    reference = reference - np.mean(reference)
+    flat_std = 1e-4 * np.std(reference)
+    n = len(reference)
+    n_fft = next_fast_len(n + max(len(q) for q in queries))
+    reference_fft = np.fft.rfft(reference, n_fft)
+    cumsum = np.concatenate([[0.0], np.cumsum(reference)])
+    cumsum_sq = np.concatenate([[0.0], np.cumsum(reference * reference)])
+
+    profiles = []
+    for q in queries:
+        m = len(q)
+        # Sliding dot products q . reference[i:i + m] for every i (convolution with reversed q)
+        dots = np.fft.irfft(reference_fft * np.fft.rfft(q[::-1], n_fft), n_fft)[m - 1:n]
+        # Window mean / std from cumulative sums (q is zero-mean, so only std enters)
+        mean = (cumsum[m:] - cumsum[:-m]) / m
+        var = np.maximum((cumsum_sq[m:] - cumsum_sq[:-m]) / m - mean * mean, 0.0)
+        std = np.sqrt(var)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.where(std > flat_std, dots / (m * std), 0.0)
+        profiles.append(np.sqrt(np.maximum(2.0 * (1.0 - np.clip(corr, -1.0, 1.0)), 0.0)))
+    return profiles
+
+def best_match(query, reference, scales=TEMPO_SCALES):
+    """
+    Best (distance, start, length) of the hum against reference over the tempo bank:
+    reference[start:start + length] is the closest window. distance is inf if no scale fits.
+    """
+    bank = tempo_bank(query, scales, max_length=len(reference))
+    if not bank:
+        return float('inf'), 0, 0
+    best = (float('inf'), 0, 0)
+    for (_, q), profile in zip(bank, distance_profiles([q for _, q in bank], reference)):
+        start = int(np.argmin(profile))
+        if profile[start] < best[0]:
+            best = (float(profile[start]), start, len(q))
+    return best
+
+def rank_references(query, references, scales=TEMPO_SCALES, max_candidates=None):
+    """
+    references: list of (key, reference contour)
+    Returns [(key, distance, start, length)] sorted by distance (best first),
+    songs no scale fits in left out.
+    """
+    ranked = []
+    for key, reference in references:
+        distance, start, length = best_match(query, reference, scales)
+        if np.isfinite(distance):
+            ranked.append((key, distance, start, length))
+    ranked.sort(key=lambda r: r[1])
+    return ranked[:max_candidates] if max_candidates is not None else ranked
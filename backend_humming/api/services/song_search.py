@@ -0,0 +1,90 @@
+import heapq
+import numpy as np
+
+class SongSearchEngine:
+    """
+    Top-k reference song search with a lower-bound cascade.
+
+    Every candidate is first scored with the processor's cheapest lower bound
+    (LB_Kim style envelope), candidates are visited best-bound-first, tighter
+    bounds (LB_Keogh style) are only computed while a candidate can still
+    enter the top-k, and the exact subsequence DTW is early-abandoned against
+    the current k-th best cost. The ranking is identical to scoring every
+    song exhaustively with processor.search_cost.
+
+    search_cost is the best-end cost min_j D[-1, j] / N, not the
+    D[-1, -1] / path_length that score_features reports (no useful lower
+    bound holds for that one), so as a shortlist for score_features the
+    top-k is approximate: see RESCORE_CANDIDATES in routes/songs.py.
+
+    The processor must provide:
+        search_bounds(query, reference) -> iterator of lower bounds, cheapest first
+        search_cost(query, reference, abandon_above) -> exact cost (inf if abandoned)
+    """
+    def __init__(self, processor, top_k=10):
+        self.processor = processor
+        self.top_k = top_k
+        self.last_stats = {}
+
+    def search(self, query, references, exhaustive=False):
+        """
+        query: query features (processor.extract_features of the hum)
+        references: list of (key, reference features)
+        Returns [(key, cost)] sorted by cost (best first), at most top_k entries.
+        """
+        if exhaustive:
+            return self._search_exhaustive(query, references)
+
+        stats = {'candidates': len(references), 'pruned_kim': 0, 'pruned_keogh': 0,
+                 'abandoned': 0, 'exact': 0}
+
+        # 1. Cheapest bound for every candidate
+        pending = []
+        for idx, (key, features) in enumerate(references):
+            bounds = self.processor.search_bounds(query, features)
+            first = next(bounds, 0.0)
+            pending.append((first, idx, bounds))
+        pending.sort(key=lambda p: (p[0], p[1]))
+
+        # Max-heap (negated) of the current top-k as (cost, index)
+        top = []
+
+        def threshold():
+            return -top[0][0] if len(top) == self.top_k else float('inf')
+
+        for i, (first, idx, bounds) in enumerate(pending):
+            # Sorted by the first bound: once it is out, so is everything after it
+            if first > threshold():
+                stats['pruned_kim'] += len(pending) - i
+                break
+
+            # 2. Tighter bounds, only while the candidate is still in the race
+            if any(lb > threshold() for lb in bounds):
+                stats['pruned_keogh'] += 1
+                continue
+
+            # 3. Exact DTW, abandoned once it cannot beat the k-th best
+            key, features = references[idx]
+            cost = self.processor.search_cost(query, features, abandon_above=threshold())
+            stats['exact'] += 1
+            if np.isinf(cost) and np.isfinite(threshold()):
+                stats['abandoned'] += 1
+                continue
+
+            entry = (-cost, -idx)
+            if len(top) < self.top_k:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+        self.last_stats = stats
+        ranked = sorted((-neg_cost, -neg_idx) for neg_cost, neg_idx in top)
+        return [(references[idx][0], cost) for cost, idx in ranked]
+
+    def _search_exhaustive(self, query, references):
+        """Reference ranking: exact cost for every candidate."""
+        scored = [(self.processor.search_cost(query, features), idx)
+                  for idx, (key, features) in enumerate(references)]
+        scored.sort()
+        self.last_stats = {'candidates': len(references), 'exact': len(references)}
+        return [(references[idx][0], cost) for cost, idx in scored[:self.top_k]]
@@ -0,0 +1,90 @@
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+
+# Containers libsndfile can decode straight from memory; anything else (webm)
+# goes through an ffmpeg pipe, or a spilled file when ffmpeg is not installed.
+IN_MEMORY_FORMATS = {'wav', 'ogg', 'mp3', 'flac'}
+
+class UploadTooLarge(ValueError):
+    pass
+
+class UploadDecodeError(ValueError):
+    """The upload is not audio ffmpeg can decode, or decoding it took too long."""
+    pass
+
+def _read_limited(stream, limit, chunk_size=1 << 16):
+    """Reads up to limit + 1 bytes, so the caller can tell whether the stream exceeded limit."""
+    chunks = []
+    size = 0
+    while size <= limit:
+        chunk = stream.read(min(chunk_size, limit + 1 - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b''.join(chunks)
+
+def _spill(head, stream, extension, spill_dir, max_bytes, chunk_size=1 << 16):
+    """Writes head + the rest of stream to a uniquely named file. Returns its path."""
+    fd, path = tempfile.mkstemp(prefix='upload_', suffix=f'.{extension}', dir=spill_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(head)
+            size = len(head)
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+                f.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+def _ffmpeg_decode(data, sample_rate, timeout):
+    """Decodes + resamples any container ffmpeg understands, stdin -> stdout, to mono float32."""
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+           '-f', 'f32le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1']
+    try:
+        proc = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise UploadDecodeError(f"Decoding the upload took longer than {timeout} seconds")
+    if proc.returncode != 0:
+        raise UploadDecodeError(f"Error loading audio file: {proc.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+def decode_upload(stream, extension, processor, spill_dir, memory_limit=8 << 20, max_bytes=50 << 20,
+                  ffmpeg_timeout=30):
+    """
+    Decodes an uploaded audio stream into the processor's mono signal.
+
+    Uploads up to memory_limit bytes are decoded from memory (libsndfile, or
+    an ffmpeg pipe for other containers). Larger ones, or when no in-memory
+    decoder fits, are spilled to a uniquely named file in spill_dir, which is
+    removed afterwards. Raises UploadTooLarge above max_bytes (the request
+    size itself is capped by MAX_CONTENT_LENGTH, see create_app), and
+    UploadDecodeError when ffmpeg fails or runs longer than ffmpeg_timeout seconds.
+    """
+    extension = extension.lower()
+    head = _read_limited(stream, memory_limit)
+    if len(head) > max_bytes:
+        raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+
+    if len(head) <= memory_limit:
+        if extension in IN_MEMORY_FORMATS:
+            try:
+                return processor.load_audio(io.BytesIO(head))
+            except ValueError:
+                pass # Container/codec libsndfile can't handle, try the other decoders
+        if shutil.which('ffmpeg'):
+            return _ffmpeg_decode(head, processor.sample_rate, ffmpeg_timeout)
+
+    path = _spill(head, stream, extension, spill_dir, max_bytes)
+    try:
+        return processor.load_audio(path)
+    finally:
+        os.remove(path)
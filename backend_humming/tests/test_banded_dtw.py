@@ -0,0 +1,103 @@
+import sys
+import os
+import time
+import numpy as np
+import librosa
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.dtw_utils import banded_subsequence_dtw, contour_cost_matrix, contour_subsequence_dtw_score
+from api.services.audio_processor_v1 import AudioProcessorV1
+from api.services.audio_processor_v2 import AudioProcessorV2
+from api.services.audio_processor_v3 import AudioProcessorV3
+
+def make_contours(seed=0):
+    rng = np.random.default_rng(seed)
+    song = np.cumsum(rng.normal(0, 1, 600))
+    # Hum a time-stretched (x1.3) noisy excerpt of the song
+    excerpt = song[200:330]
+    hum = np.interp(np.linspace(0, len(excerpt) - 1, 100), np.arange(len(excerpt)), excerpt)
+    hum = hum + rng.normal(0, 0.2, hum.shape)
+    return hum, song
+
+def test_wide_band_matches_librosa():
+    print("--- Banded DTW: unconstrained band vs librosa ---")
+    hum, song = make_contours()
+    C = contour_cost_matrix(hum, song)
+    D, wp = librosa.sequence.dtw(C=C, subseq=True)
+    end = int(np.argmin(D[-1]))
+
+    cost, length, start, stop = banded_subsequence_dtw(hum, song, band=(0.0, 1e9))
+    print(f"librosa cost {D[-1, -1]:.4f} end {end}, banded cost {cost:.4f} end {stop}")
+
+    # Same quantities as the unbanded score: D[-1, -1], and the path of the best end
+    assert np.isclose(cost, D[-1, -1])
+    assert stop == end
+    # The librosa path is backtracked from the same end point
+    assert wp[0, 1] == end
+    assert length == wp.shape[0]
+    assert start == np.min(wp[:, 1])
+
+def test_band_limits_stretch():
+    print("--- Banded DTW: (0.5, 2.0) band ---")
+    hum, song = make_contours(seed=1)
+    free_cost, _, _, _ = banded_subsequence_dtw(hum, song, band=(0.0, 1e9))
+    cost, length, start, end = banded_subsequence_dtw(hum, song, band=(0.5, 2.0))
+    ratio = (end - start + 1) / len(hum)
+    print(f"free cost {free_cost:.4f}, banded cost {cost:.4f}, stretch ratio {ratio:.2f}")
+
+    assert cost >= free_cost - 1e-9
+    assert 0.5 - 1.0 / len(hum) <= ratio <= 2.0 + 1.0 / len(hum)
+
+    # A song too short for the band has no valid match
+    cost, _, _, _ = banded_subsequence_dtw(hum, song[:200], band=(3.0, 4.0))
+    assert np.isinf(cost)
+
+def test_open_band_scores_like_unbanded():
+    print("--- Banded DTW: open band vs unbanded score ---")
+    hum, song = make_contours(seed=3)
+    rng = np.random.default_rng(3)
+    # The score reads D[-1, -1] (path forced onto the last song frame), so end the
+    # references shortly after the match to get similarities above 0
+    cases = [
+        ("exact excerpt", song[200:330].copy(), song[150:340]),
+        ("stretched", hum, song[180:345]),
+        ("unrelated", np.cumsum(rng.normal(0, 1, 150)), song[:400]),
+        ("hum longer than song", hum, song[250:310].copy()),
+    ]
+    for name, query, reference in cases:
+        assert banded_subsequence_dtw(query, reference, band=(0.0, 1e9)) == contour_subsequence_dtw_score(query, reference)
+
+    for cls in (AudioProcessorV1, AudioProcessorV2, AudioProcessorV3):
+        unbanded, banded = cls(), cls(band=(0.0, 1e9))
+        for name, query, reference in cases:
+            expected = unbanded.score_features(query, reference)
+            got = banded.score_features(query, reference)
+            print(f"{cls.__name__} {name}: unbanded {expected}, open band {got}")
+            assert got == expected
+
+def test_banded_processor_speed():
+    print("--- Banded DTW: processor memory/time ---")
+    ap = AudioProcessorV2(band=(0.5, 2.0))
+    hum, song = make_contours(seed=2)
+    song = np.tile(song, 20) # ~12000 frames
+
+    banded_subsequence_dtw(hum, song) # numba warm-up
+    start = time.time()
+    cost, length, _, _ = banded_subsequence_dtw(hum, song, ap.band)
+    t_banded = time.time() - start
+
+    start = time.time()
+    D, wp = librosa.sequence.dtw(X=hum.reshape(1, -1), Y=song.reshape(1, -1), metric='euclidean', subseq=True)
+    t_full = time.time() - start
+
+    print(f"Full DTW: {t_full:.4f}s ({D.nbytes / 1e6:.1f} MB), banded: {t_banded:.4f}s")
+    assert np.isfinite(cost) and length >= len(hum)
+
+if __name__ == "__main__":
+    test_wide_band_matches_librosa()
+    test_band_limits_stretch()
+    test_open_band_scores_like_unbanded()
+    test_banded_processor_speed()
@@ -0,0 +1,51 @@
+import sys
+import os
+import time
+import numpy as np
+from scipy.spatial.distance import cdist
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.chamfer import pad_point_sets, batch_chamfer_distance
+
+def chamfer_distance(set_a, set_b):
+    """Original per-entry version (scipy cdist per pair of sets)."""
+    if len(set_a) == 0 or len(set_b) == 0:
+        return float('inf')
+    dists = cdist(set_a, set_b, metric='euclidean')
+    return np.mean(np.min(dists, axis=1)) + np.mean(np.min(dists, axis=0))
+
+def test_batch_matches_per_entry():
+    print("--- Testing Batched Chamfer Distance ---")
+    rng = np.random.default_rng(0)
+    # Variable player counts, including empty constellations
+    sets = [rng.normal(0, 20, (rng.integers(0, 12), 2)) for _ in range(5000)]
+    points, counts = pad_point_sets(sets)
+    assert points.shape == (5000, 11, 2)
+
+    for q_count in (0, 1, 7, 11):
+        query = rng.normal(0, 20, (q_count, 2))
+
+        start = time.time()
+        expected = np.array([chamfer_distance(query, s) for s in sets])
+        t_loop = time.time() - start
+
+        start = time.time()
+        got = batch_chamfer_distance(query, points, counts)
+        t_batch = time.time() - start
+
+        assert np.array_equal(np.isinf(got), np.isinf(expected))
+        finite = np.isfinite(expected)
+        assert np.allclose(got[finite], expected[finite], rtol=1e-12, atol=0)
+        print(f"query of {q_count}: loop {t_loop:.3f}s, batched {t_batch * 1000:.1f}ms")
+
+    # Points given as lists of tuples (the pickled layout), and no sets at all
+    tuples = [[tuple(p) for p in s] for s in sets[:10]]
+    assert np.array_equal(pad_point_sets(tuples)[0], pad_point_sets(sets[:10])[0])
+    empty_points, empty_counts = pad_point_sets([])
+    assert batch_chamfer_distance(sets[0], empty_points, empty_counts).shape == (0,)
+
+if __name__ == "__main__":
+    test_batch_matches_per_entry()
@@ -0,0 +1,96 @@
+import sys
+import os
+import time
+import numpy as np
+import librosa
+from scipy.spatial.distance import cdist
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.dtw_utils import subsequence_dtw_score, contour_subsequence_dtw_score, contour_cost_matrix
+from api.services.audio_processor import AudioProcessor
+from api.services.audio_processor_v1 import AudioProcessorV1
+from api.services.audio_processor_v2 import AudioProcessorV2
+from api.services.audio_processor_v3 import AudioProcessorV3
+
+def legacy_contour_score(ap, user_pitch, db_pitch):
+    """Original librosa scoring of AudioProcessorV1/V2/V3.compare_with_reference (unbanded)."""
+    if len(user_pitch) < 10 or len(db_pitch) < 10:
+        return 0.0
+    D, wp = librosa.sequence.dtw(X=user_pitch.reshape(1, -1), Y=db_pitch.reshape(1, -1),
+                                 metric='euclidean', subseq=True)
+    cost = D[-1, -1] / wp.shape[0]
+    if isinstance(ap, AudioProcessorV3):
+        cost += ap.length_penalty(len(user_pitch), np.max(wp[:, 1]) - np.min(wp[:, 1]))
+    return ap.cost_to_similarity(cost)
+
+def test_kernel_matches_librosa():
+    print("--- Two-row DTW score vs librosa.sequence.dtw ---")
+    rng = np.random.default_rng(0)
+    for trial in range(200):
+        n, m = rng.integers(1, 50), rng.integers(1, 50)
+        # Rounded contours: lots of equal costs, so tie-breaking has to match too
+        query = np.round(rng.normal(0, 2, n))
+        reference = np.round(rng.normal(0, 2, m))
+        D, wp = librosa.sequence.dtw(X=query.reshape(1, -1), Y=reference.reshape(1, -1),
+                                     metric='euclidean', subseq=True)
+        cost, length, start, end = contour_subsequence_dtw_score(query, reference)
+        assert cost == D[-1, -1] and length == wp.shape[0]
+        assert end - start == np.max(wp[:, 1]) - np.min(wp[:, 1])
+
+        # Cosine cost matrix (chroma), hum on the rows as AudioProcessor passes it
+        C = cdist(rng.random((n, 12)), rng.random((m, 12)), 'cosine')
+        if n > m:
+            C = C.T
+        D, wp = librosa.sequence.dtw(C=C, subseq=True)
+        cost, length, start, end = subsequence_dtw_score(C)
+        assert cost == D[-1, -1] and length == wp.shape[0]
+        assert (start, end) == (np.min(wp[:, 1]), np.max(wp[:, 1]))
+
+def test_processors_match_legacy():
+    print("--- Processors: two-row DTW vs original librosa scoring ---")
+    rng = np.random.default_rng(1)
+    song = np.cumsum(rng.normal(0, 1, 400))
+    hums = [song[120:200] + rng.normal(0, 0.3, 80), rng.normal(0, 1, 500), song[:12]]
+    for ap in (AudioProcessorV1(), AudioProcessorV2(), AudioProcessorV3()):
+        for hum in hums:
+            assert ap.score_features(hum, song) == legacy_contour_score(ap, hum, song)
+
+    # V3 cascade survivors measure the matched segment the same way
+    ap = AudioProcessorV3()
+    for hum in hums[:2]:
+        C = contour_cost_matrix(hum, song)
+        D, wp = librosa.sequence.dtw(C=C, subseq=True)
+        expected = np.min(D[-1]) / len(hum) + ap.length_penalty(len(hum), np.max(wp[:, 1]) - np.min(wp[:, 1]))
+        assert np.isclose(ap.search_cost(hum, song), expected)
+
+    # V0: 12 keys over chroma
+    ap = AudioProcessor()
+    user_chroma, db_chroma = rng.random((12, 60)), rng.random((12, 300))
+    expected = float('inf')
+    for shift in range(12):
+        D, wp = librosa.sequence.dtw(X=np.roll(user_chroma, shift, axis=0), Y=db_chroma, metric='cosine', subseq=True)
+        expected = min(expected, D[-1, -1] / wp.shape[0])
+    assert np.isclose(ap._exhaustive_key_cost(user_chroma, db_chroma), expected)
+
+def test_two_row_speed():
+    print("--- Two-row DTW score: time ---")
+    rng = np.random.default_rng(2)
+    hum, song = rng.normal(0, 1, 300), rng.normal(0, 1, 20000)
+    contour_subsequence_dtw_score(hum, song) # numba warm-up
+
+    start = time.time()
+    contour_subsequence_dtw_score(hum, song)
+    t_rows = time.time() - start
+
+    start = time.time()
+    D, wp = librosa.sequence.dtw(X=hum.reshape(1, -1), Y=song.reshape(1, -1), metric='euclidean', subseq=True)
+    t_full = time.time() - start
+    print(f"librosa: {t_full:.4f}s ({D.nbytes / 1e6:.1f} MB), two rows: {t_rows:.4f}s")
+
+if __name__ == "__main__":
+    test_kernel_matches_librosa()
+    test_processors_match_legacy()
+    test_two_row_speed()
@@ -0,0 +1,127 @@
+import sys
+import os
+import tempfile
+import numpy as np
+import soundfile as sf
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.audio_processor_v2 import AudioProcessorV2
+from api.services.feature_index import FeatureIndex
+
+class CountingProcessor(AudioProcessorV2):
+    """V2 processor that counts how often reference features are extracted."""
+    def __init__(self):
+        super().__init__()
+        self.extract_calls = 0
+
+    def extract_features(self, signal):
+        self.extract_calls += 1
+        return super().extract_features(signal)
+
+def generate_tone(freq, duration, sr=22050):
+    t = np.linspace(0, duration, int(sr * duration), endpoint=False)
+    return 0.5 * np.sin(2 * np.pi * freq * t)
+
+def test_feature_index_reuse_and_invalidation():
+    print("--- Testing Feature Index ---")
+    sr = 22050
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_dir = os.path.join(tmp, 'songs')
+        index_dir = os.path.join(tmp, 'index')
+        os.makedirs(songs_dir)
+
+        song_path = os.path.join(songs_dir, 'melody.wav')
+        song = np.concatenate([generate_tone(f, 0.5, sr) for f in [261, 329, 392, 523]])
+        sf.write(song_path, song, sr)
+
+        ap = CountingProcessor()
+        index = FeatureIndex(songs_dir, index_dir)
+
+        first = index.get_features('v2', ap, 'melody.wav')
+        second = index.get_features('v2', ap, 'melody.wav')
+        assert ap.extract_calls == 1
+        assert np.array_equal(first, second)
+
+        # A fresh index (new process) must reuse the persisted features
+        reopened = FeatureIndex(songs_dir, index_dir)
+        third = reopened.get_features('v2', ap, 'melody.wav')
+        assert ap.extract_calls == 1
+        assert np.array_equal(first, third)
+
+        # Touching the file without changing it keeps the entry (hash still matches)
+        os.utime(song_path, ns=(0, 0))
+        reopened.get_features('v2', ap, 'melody.wav')
+        assert ap.extract_calls == 1
+
+        # Changing the content forces re-extraction
+        sf.write(song_path, song[::-1], sr)
+        reopened.get_features('v2', ap, 'melody.wav')
+        assert ap.extract_calls == 2
+
+        # Features extracted from a version of the song that has since changed are
+        # stored as stale (the snapshot is taken before extraction)
+        snapshot = reopened.snapshot('melody.wav')
+        features = ap.extract_features(ap.load_audio(song_path))
+        sf.write(song_path, song, sr)
+        reopened.store('v2', 'melody.wav', features, snapshot)
+        assert reopened.locate('v2', 'melody.wav') is None
+        reopened.get_features('v2', ap, 'melody.wav')
+        assert ap.extract_calls == 4
+
+        # Removed songs are dropped from the index
+        feature_path = reopened.locate('v2', 'melody.wav')[0]
+        reopened.prune([])
+        assert not os.path.exists(feature_path)
+        assert FeatureIndex(songs_dir, index_dir)._store.entries('v2') == {}
+        print("Feature index OK")
+
+def test_melody_index_follows_store_and_prune():
+    print("--- Testing Feature Index: melody hash index ---")
+    sr = 22050
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_dir = os.path.join(tmp, 'songs')
+        index_dir = os.path.join(tmp, 'index')
+        os.makedirs(songs_dir)
+        notes = {}
+        for name in ('a.wav', 'b.wav'):
+            notes[name] = rng.choice([261, 293, 329, 349, 392, 440, 493, 523], size=16)
+            sf.write(os.path.join(songs_dir, name), np.concatenate([generate_tone(f, 0.4, sr) for f in notes[name]]), sr)
+
+        ap = CountingProcessor()
+        index = FeatureIndex(songs_dir, index_dir)
+        index.get_features('v2', ap, 'a.wav')
+
+        # Songs indexed before the melody index was requested are hashed from the stored features
+        melody = index.melody_index('v2')
+        assert melody.songs() == ['a.wav'] and ap.extract_calls == 1
+        # Songs indexed afterwards are hashed as they are stored
+        b_features = index.get_features('v2', ap, 'b.wav')
+        assert sorted(melody.songs()) == ['a.wav', 'b.wav']
+        assert melody.token('b.wav') == index.locate('v2', 'b.wav')[1]
+
+        # A new process loads the stored hashes, nothing is extracted again
+        reopened = FeatureIndex(songs_dir, index_dir)
+        loaded = reopened.melody_index('v2')
+        assert sorted(loaded.songs()) == ['a.wav', 'b.wav'] and ap.extract_calls == 2
+        assert loaded.token('b.wav') == melody.token('b.wav')
+        hum = b_features[40:140]
+        assert loaded.query(hum)[0][0] == 'b.wav'
+
+        # A changed song is re-hashed when its features are next looked up
+        sf.write(os.path.join(songs_dir, 'b.wav'), np.concatenate([generate_tone(f, 0.4, sr) for f in notes['a.wav']]), sr)
+        reopened.get_features('v2', ap, 'b.wav')
+        assert loaded.token('b.wav') == reopened.locate('v2', 'b.wav')[1] != melody.token('b.wav')
+
+        # Removed songs leave the melody index with their features
+        reopened.prune(['a.wav'])
+        assert loaded.songs() == ['a.wav']
+        assert FeatureIndex(songs_dir, index_dir).melody_index('v2').songs() == ['a.wav']
+        print("Melody index persistence OK")
+
+if __name__ == "__main__":
+    test_feature_index_reuse_and_invalidation()
+    test_melody_index_follows_store_and_prune()
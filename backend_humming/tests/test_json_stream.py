@@ -0,0 +1,53 @@
+import sys
+import os
+import json
+import tempfile
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.json_stream import iter_json_array, with_next
+
+def read_all(text, chunk_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'events.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return list(iter_json_array(path, chunk_size=chunk_size))
+
+def test_matches_json_load():
+    print("--- JSON stream: events vs json.load ---")
+    events = [{'gameEventId': i, 'eventTime': i * 1.25, 'ball': [{'x': -i / 3, 'y': 1e-7 * i}],
+               'possessionEvents': None if i % 3 else {'possessionEventType': 'PA'}, 'name': 'é"]'}
+              for i in range(50)]
+    text = json.dumps(events, indent=1)
+    for chunk_size in (1, 2, 7, 64, 1 << 16):
+        assert read_all(text, chunk_size) == events
+    assert read_all('[]', 1) == []
+    assert read_all(' [ ] ', 1) == []
+
+def test_number_split_by_chunk():
+    print("--- JSON stream: numbers cut by the chunk boundary ---")
+    for text in ('[1.5, 2]', '[-1.5e10, 3]', '[12345,-0.25E-3 ,7]', '[true, null, 10]', '[1e5]', '[0]'):
+        expected = json.loads(text)
+        for chunk_size in range(1, len(text) + 1):
+            assert read_all(text, chunk_size) == expected, (text, chunk_size)
+
+def test_malformed():
+    for text in ('[1, 2', '{"a": 1}', '[1 2]', '[{"a": 1'):
+        try:
+            read_all(text, 3)
+        except ValueError:
+            continue
+        raise AssertionError(f"no error for {text!r}")
+
+def test_with_next():
+    assert list(with_next([])) == []
+    assert list(with_next([1, 2, 3])) == [(1, 2), (2, 3), (3, None)]
+
+if __name__ == "__main__":
+    test_matches_json_load()
+    test_number_split_by_chunk()
+    test_malformed()
+    test_with_next()
@@ -0,0 +1,114 @@
+import sys
+import os
+import time
+import numpy as np
+import librosa
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.audio_processor import AudioProcessor
+
+def generate_tone(freq, duration, sr=22050):
+    t = np.linspace(0, duration, int(sr * duration), endpoint=False)
+    return 0.5 * np.sin(2 * np.pi * freq * t)
+
+def legacy_key_cost(user_chroma, db_chroma):
+    """Original 12 x (cdist + DTW) loop from AudioProcessor.compare_audio."""
+    min_cost = float('inf')
+    for shift in range(12):
+        user_shifted = np.roll(user_chroma, shift, axis=0)
+        D, wp = librosa.sequence.dtw(X=user_shifted, Y=db_chroma, metric='cosine', subseq=True)
+        min_cost = min(min_cost, D[-1, -1] / wp.shape[0])
+    return min_cost
+
+def brute_force_subsequence_cost(user_chroma, db_chroma):
+    """Best subsequence cost per hum frame over all keys, without any pruning."""
+    best = float('inf')
+    for shift in range(12):
+        user_shifted = np.roll(user_chroma, shift, axis=0)
+        D = librosa.sequence.dtw(X=user_shifted, Y=db_chroma, metric='cosine', subseq=True, backtrack=False)
+        # Keep the hum on the rows (librosa swaps them when the hum is longer)
+        if user_chroma.shape[1] > db_chroma.shape[1]:
+            continue
+        best = min(best, np.min(D[-1]) / user_chroma.shape[1])
+    return best
+
+def test_batched_key_search():
+    print("--- Key Search: Batched vs Original ---")
+    sr = 22050
+    ap = AudioProcessor()
+    fast = AudioProcessor(key_search='approximate')
+
+    melody = [261, 293, 329, 349, 392, 440, 493, 523]
+    song = np.concatenate([generate_tone(melody[i % 8], 0.4, sr) for i in range(40)])
+    song = song + np.random.normal(0, 0.02, song.shape)
+
+    # Hum a transposed (+3 semitones) excerpt of the song
+    hum = np.concatenate([generate_tone(f * 2 ** (3 / 12), 0.45, sr) for f in melody[2:7]])
+    hum = hum + np.random.normal(0, 0.02, hum.shape)
+
+    user_chroma = ap.extract_chroma_features(hum)
+    db_chroma = ap.extract_chroma_features(song)
+
+    start = time.time()
+    legacy = legacy_key_cost(user_chroma, db_chroma)
+    t_legacy = time.time() - start
+
+    start = time.time()
+    batched = ap._exhaustive_key_cost(user_chroma, db_chroma)
+    t_batched = time.time() - start
+
+    # Force tiny batches to exercise the memory-bounded path
+    small_batches = AudioProcessor(max_cost_cells=1)._exhaustive_key_cost(user_chroma, db_chroma)
+
+    fast._early_abandon_key_cost(user_chroma, db_chroma) # numba warm-up
+    start = time.time()
+    abandoned = fast._early_abandon_key_cost(user_chroma, db_chroma)
+    t_abandon = time.time() - start
+
+    print(f"Original:      cost {legacy:.6f} in {t_legacy:.4f}s")
+    print(f"Batched:       cost {batched:.6f} in {t_batched:.4f}s")
+    print(f"Early abandon: cost {abandoned:.6f} in {t_abandon:.4f}s")
+
+    assert np.isclose(legacy, batched)
+    assert np.isclose(legacy, small_batches)
+    assert np.isclose(abandoned, brute_force_subsequence_cost(user_chroma, db_chroma))
+
+    # Scores through the public API agree as well
+    assert ap.compare_audio(hum, song) == round(float(100 * np.exp(-(legacy / 0.30) ** 2)), 2)
+    # On a clean transposed hum the approximate search picks the same key
+    assert fast.compare_audio(hum, song) == ap.compare_audio(hum, song)
+
+def random_chroma(rng, length):
+    chroma = rng.random((12, length)) ** 4
+    return chroma / np.linalg.norm(chroma, axis=0, keepdims=True)
+
+def test_approximate_key_drift():
+    print("--- Key Search: approximate vs exhaustive similarity ---")
+    rng = np.random.default_rng(0)
+    ap = AudioProcessor()
+    fast = AudioProcessor(key_search='approximate')
+
+    for kind in ('excerpt', 'unrelated'):
+        drift = []
+        for _ in range(40):
+            song = random_chroma(rng, int(rng.integers(300, 800)))
+            if kind == 'excerpt':
+                # Noisy excerpt in a random key
+                start = int(rng.integers(0, song.shape[1] - 100))
+                hum = np.roll(song[:, start:start + 100], int(rng.integers(12)), axis=0) + 0.3 * rng.random((12, 100))
+            else:
+                hum = random_chroma(rng, 100)
+            drift.append(ap.score_features(hum, song) - fast.score_features(hum, song))
+        drift = np.array(drift)
+        print(f"{kind}: same score in {np.sum(drift == 0)}/40, drift mean {drift.mean():.2f}, max {drift.max():.2f}")
+
+        # The key is picked on another cost, so the score can only be lower, and not by much
+        assert np.all(drift >= 0)
+        assert drift.max() < 10
+
+if __name__ == "__main__":
+    test_batched_key_search()
+    test_approximate_key_drift()
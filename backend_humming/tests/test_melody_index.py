@@ -0,0 +1,62 @@
+import sys
+import os
+import time
+import numpy as np
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.melody_index import MelodyIndex
+
+def zscore(x):
+    return (x - np.mean(x)) / np.std(x)
+
+def make_catalogue(n_songs, length, rng):
+    """Note sequences (random steps and durations), z-normalized like the V3 features."""
+    songs = {}
+    for i in range(n_songs):
+        notes = np.cumsum(rng.integers(-4, 5, size=length // 8)).astype(float)
+        durations = rng.integers(8, 30, size=len(notes))
+        songs[f'song_{i}'] = zscore(np.repeat(notes, durations)[:length])
+    return songs
+
+def hum_excerpt(song, start, length, stretch, rng):
+    """Excerpt of a song sung `stretch` times slower, with pitch noise and its own normalization."""
+    excerpt = song[start:start + length]
+    n_frames = int(length * stretch)
+    hum = np.interp(np.linspace(0, length - 1, n_frames), np.arange(length), excerpt)
+    return zscore(hum + rng.normal(0, 0.05, n_frames))
+
+def test_melody_index_retrieval():
+    print("--- Testing Melody Hash Index ---")
+    rng = np.random.default_rng(0)
+    songs = make_catalogue(500, 1500, rng)
+
+    index = MelodyIndex()
+    start = time.time()
+    for name, contour in songs.items():
+        index.add(name, contour, token=name)
+    print(f"Indexed {len(songs)} songs in {time.time() - start:.2f}s")
+
+    for target, offset, stretch in [('song_123', 400, 1.0), ('song_7', 900, 1.2), ('song_321', 100, 0.85)]:
+        hum = hum_excerpt(songs[target], offset, 200, stretch, rng)
+        start = time.time()
+        candidates = index.query(hum, max_candidates=20)
+        elapsed = time.time() - start
+        names = [c[0] for c in candidates]
+        print(f"{target} @ {offset} x{stretch}: rank {names.index(target) if target in names else None}, "
+              f"{len(candidates)} candidates in {elapsed * 1000:.1f}ms")
+
+        assert target in names[:5]
+        estimated = candidates[names.index(target)][1]
+        assert abs(estimated - offset) <= 2 * index.window
+
+    # Removed songs are never returned
+    index.remove('song_123')
+    hum = hum_excerpt(songs['song_123'], 400, 200, 1.0, rng)
+    assert 'song_123' not in [c[0] for c in index.query(hum)]
+    assert index.token('song_123') is None and index.token('song_7') == 'song_7'
+
+if __name__ == "__main__":
+    test_melody_index_retrieval()
@@ -0,0 +1,109 @@
+import sys
+import os
+import time
+import numpy as np
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.multires_search import MultiResolutionSearch, paa
+from api.services.song_search import SongSearchEngine
+from api.services.feature_index import FeatureIndex
+from api.services.pcm_cache import PCMCache
+from api.services.audio_processor import AudioProcessor
+from api.services.audio_processor_v1 import AudioProcessorV1
+from api.services.audio_processor_v2 import AudioProcessorV2
+from api.services.audio_processor_v3 import AudioProcessorV3
+
+DATA_DIR = os.path.join(current_dir, 'data')
+
+def zscore(x):
+    return (x - np.mean(x)) / np.std(x)
+
+def stretched_excerpt(features, start, length, stretch, rng, noise=0.05):
+    """Excerpt (last axis is time) sung `stretch` times slower, with noise."""
+    excerpt = np.atleast_2d(features[..., start:start + length])
+    frames = np.linspace(0, length - 1, int(length * stretch))
+    hum = np.stack([np.interp(frames, np.arange(length), row) for row in excerpt])
+    hum = hum + rng.normal(0, noise, hum.shape)
+    return np.abs(hum) if features.ndim == 2 else hum[0]
+
+def compare(processor, references, hums, **params):
+    """Top-1 agreement and time of the coarse-to-fine search vs the exhaustive one."""
+    exhaustive = SongSearchEngine(processor, top_k=3)
+    multires = MultiResolutionSearch(processor, top_k=3, **params)
+    agree, t_full, t_multires, refined = 0, 0.0, 0.0, 0.0
+    for hum in hums:
+        start = time.time()
+        expected = exhaustive.search(hum, references, exhaustive=True)
+        t_full += time.time() - start
+        start = time.time()
+        ranked = multires.search(hum, references)
+        t_multires += time.time() - start
+        agree += ranked[0][0] == expected[0][0]
+        # Every result comes with the window its cost was found in
+        assert list(multires.last_windows) == [key for key, _ in ranked]
+        refined += multires.last_stats['refined_frames'] / multires.last_stats['frames']
+    return agree, t_full, t_multires, refined / len(hums)
+
+def test_paa():
+    x = np.arange(10, dtype=float)
+    assert np.allclose(paa(x, 4), [1.5, 5.5, 8.5])
+    chroma = np.tile(x, (12, 1))
+    assert paa(chroma, 4).shape == (12, 3)
+
+def test_coarse_to_fine_finds_excerpts():
+    print("--- Coarse-to-fine DTW: long synthetic songs ---")
+    rng = np.random.default_rng(0)
+    songs = []
+    for i in range(20):
+        notes = np.cumsum(rng.integers(-4, 5, size=1200)).astype(float)
+        songs.append((f'song_{i}', zscore(np.repeat(notes, rng.integers(4, 12, size=len(notes)))[:8000])))
+    hums = [stretched_excerpt(songs[i][1], int(rng.integers(0, 7500)), 300, stretch, rng)
+            for i, stretch in zip(range(0, 20, 4), (0.8, 0.9, 1.0, 1.1, 1.25))]
+
+    agree, t_full, t_multires, refined = compare(AudioProcessorV2(), songs, hums)
+    print(f"top-1 agreement {agree}/{len(hums)}, exhaustive {t_full:.2f}s, "
+          f"coarse-to-fine {t_multires:.2f}s ({refined:.1%} of the song frames refined)")
+    assert agree == len(hums)
+    assert refined < 0.2
+
+def benchmark_data_songs(versions=('v0', 'v1', 'v2', 'v3'), trials=3, **params):
+    """Coarse-to-fine vs exhaustive ranking on excerpts of the songs in data/songs."""
+    songs_dir = os.path.join(DATA_DIR, 'songs')
+    song_files = sorted(f for f in os.listdir(songs_dir) if f.rsplit('.', 1)[-1].lower() in ('wav', 'mp3', 'ogg', 'webm'))
+    if not song_files:
+        print("No songs in data/songs, skipping")
+        return
+    index_dir = os.path.join(DATA_DIR, 'index')
+    index = FeatureIndex(songs_dir, index_dir, pcm_cache=PCMCache(songs_dir, os.path.join(index_dir, 'pcm')))
+    processors = {'v0': AudioProcessor(), 'v1': AudioProcessorV1(), 'v2': AudioProcessorV2(), 'v3': AudioProcessorV3()}
+
+    rng = np.random.default_rng(0)
+    for version in versions:
+        processor = processors[version]
+        revision = getattr(processor, 'feature_revision', None)
+        index_version = f'{version}.{revision}' if revision else version
+        references = [(song_file, index.get_features(index_version, processor, song_file)) for song_file in song_files]
+        hums = []
+        for _, features in references:
+            n_frames = features.shape[-1]
+            length = min(300, n_frames // 3)
+            for _ in range(trials):
+                hums.append(stretched_excerpt(features, int(rng.integers(0, n_frames - length)), length,
+                                              rng.choice([0.8, 1.0, 1.25]), rng))
+        agree, t_full, t_multires, refined = compare(processor, references, hums, **params)
+        print(f"{version}: top-1 agreement {agree}/{len(hums)}, exhaustive {t_full:.2f}s, "
+              f"coarse-to-fine {t_multires:.2f}s ({refined:.1%} of the song frames refined)")
+        assert agree >= 0.9 * len(hums)
+
+def test_benchmark_data_songs():
+    print("--- Coarse-to-fine DTW: data/songs ---")
+    # V1 (pYIN) is left to the script run, its cold feature extraction takes minutes
+    benchmark_data_songs(versions=('v0', 'v2', 'v3'))
+
+if __name__ == "__main__":
+    test_paa()
+    test_coarse_to_fine_finds_excerpts()
+    benchmark_data_songs()
@@ -0,0 +1,374 @@
+import sys
+import os
+import time
+import pickle
+import tempfile
+import threading
+import numpy as np
+from scipy.spatial.distance import cdist
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.pattern_matcher_v3 import FingerprintDatabaseV3, PassLevel
+from api.services.pass_table import TABLE_COLUMNS, chains_to_table, save_table
+
+def make_level(n_entries, length, rng, n_games=20):
+    """Synthetic fingerprints_{length}pass level (same layout as data_processor_v3)."""
+    entries = []
+    for i in range(n_entries):
+        entries.append({
+            'game_id': str(rng.integers(n_games)),
+            'event_id': i,
+            'timestamp': float(rng.uniform(0, 5400)),
+            'length': length,
+            'start_x': float(rng.uniform(-50, 50)),
+            'start_y': float(rng.uniform(-30, 30)),
+            'vectors': [tuple(rng.normal(0, 15, 2)) for _ in range(length)],
+            'teammates': [tuple(rng.normal(0, 20, 2)) for _ in range(rng.integers(0, 11))],
+            'opponents': [tuple(rng.normal(0, 20, 2)) for _ in range(rng.integers(0, 11))],
+        })
+    return entries
+
+def legacy_vector_distance(vecs_a, vecs_b):
+    """Original FingerprintDatabaseV3._vector_distance: mean per-vector Euclidean distance."""
+    return np.mean(np.linalg.norm(np.array(vecs_a) - np.array(vecs_b), axis=1))
+
+def legacy_chamfer_distance(set_a, set_b):
+    """Original FingerprintDatabaseV3._chamfer_distance."""
+    if len(set_a) == 0 or len(set_b) == 0: return float('inf')
+    dists = cdist(set_a, set_b, metric='euclidean')
+    return np.mean(np.min(dists, axis=1)) + np.mean(np.min(dists, axis=0))
+
+def legacy_find_nearest_neighbors(db, query, top_k=5, w_vec=1.0, w_player=0.2):
+    """Original per-entry loop of FingerprintDatabaseV3.find_nearest_neighbors."""
+    q_tm = np.array(query['teammates'])
+    q_op = np.array(query['opponents'])
+    results = []
+    for entry in db.database:
+        if entry['game_id'] == query['game_id'] and entry['timestamp'] == query['timestamp']:
+            continue
+        d_vec = legacy_vector_distance(query['vectors'], entry['vectors'])
+        d_tm = legacy_chamfer_distance(q_tm, np.array(entry['teammates']))
+        d_op = legacy_chamfer_distance(q_op, np.array(entry['opponents']))
+        results.append({'event_id': entry['event_id'], 'distance': (w_vec * d_vec) + (w_player * (d_tm + d_op))})
+    results.sort(key=lambda x: x['distance'])
+    return results[:top_k]
+
+def test_vectorized_neighbors_match_loop():
+    print("--- Pattern Matcher V3: vectorized vs loop ---")
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for length, n_entries in [(1, 20000), (3, 3000)]:
+            with open(os.path.join(tmp, f'fingerprints_{length}pass.pkl'), 'wb') as f:
+                pickle.dump(make_level(n_entries, length, rng), f)
+
+        db = FingerprintDatabaseV3(base_data_dir=tmp)
+        for length in (1, 3):
+            db.load_level(length)
+            for q in range(5):
+                query = db.database[int(rng.integers(len(db.database)))]
+
+                start = time.time()
+                expected = legacy_find_nearest_neighbors(db, query, top_k=10)
+                t_loop = time.time() - start
+
+                start = time.time()
+                results = db.find_nearest_neighbors(query, top_k=10)
+                t_fast = time.time() - start
+
+                assert [r['event_id'] for r in results] == [r['event_id'] for r in expected]
+                assert np.allclose([r['distance'] for r in results], [r['distance'] for r in expected])
+                # The query itself is never returned
+                assert query['event_id'] not in [r['event_id'] for r in results]
+            print(f"L{length} ({len(db.database)} entries): loop {t_loop:.3f}s, vectorized {t_fast * 1000:.1f}ms")
+
+        # Queries without players: every distance is inf, database order is kept
+        query = dict(db.database[0], teammates=[], opponents=[], game_id='none')
+        results = db.find_nearest_neighbors(query, top_k=3)
+        assert [r['event_id'] for r in results] == [e['event_id'] for e in db.database[:3]]
+
+class CountingDatabase(FingerprintDatabaseV3):
+    """Counts how often a level file is actually read."""
+    def __init__(self, *args, **kwargs):
+        self.reads = []
+        super().__init__(*args, **kwargs)
+
+    def _read_level(self, length):
+        self.reads.append(length)
+        return super()._read_level(length)
+
+def test_levels_stay_resident():
+    print("--- Pattern Matcher V3: resident levels ---")
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        for length in (1, 3, 5):
+            with open(os.path.join(tmp, f'fingerprints_{length}pass.pkl'), 'wb') as f:
+                pickle.dump(make_level(2000, length, rng), f)
+
+        db = CountingDatabase(base_data_dir=tmp)
+        assert sorted(db.reads) == list(range(1, 6)) # Every level up to the longest on disk read once at startup
+
+        # Interleaved 1/3/5-pass traffic from several threads: no reloads, same answers
+        queries = {length: db.get_level(length).database[:5] for length in (1, 3, 5)}
+        expected = {(length, i): db.find_nearest_neighbors(q, top_k=5, length=length)
+                    for length, qs in queries.items() for i, q in enumerate(qs)}
+        errors = []
+
+        def worker():
+            for (length, i), want in expected.items():
+                got = db.find_nearest_neighbors(queries[length][i], top_k=5, length=length)
+                if [r['event_id'] for r in got] != [r['event_id'] for r in want]:
+                    errors.append((length, i))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert not errors
+        assert sorted(db.reads) == list(range(1, 6))
+
+        # With a budget for ~one level, the least recently used level is dropped
+        level_bytes = db.get_level(1).nbytes
+        small = CountingDatabase(base_data_dir=tmp, memory_budget=level_bytes, preload=False)
+        small.get_level(1)
+        small.get_level(3)
+        small.get_level(3)
+        assert small.reads == [1, 3]
+        small.get_level(1)
+        assert small.reads == [1, 3, 1]
+
+def test_match_index_matches_scan():
+    print("--- Pattern Matcher V3: per-match index ---")
+    rng = np.random.default_rng(2)
+    database = make_level(5000, 2, rng)
+    # Duplicate timestamps inside a match keep database order, like the stable sort did
+    database[10]['timestamp'] = database[20]['timestamp']
+    database[10]['game_id'] = database[20]['game_id']
+    level = PassLevel.from_entries(2, database)
+
+    for match_id in [str(g) for g in range(20)] + [7, 'missing']:
+        # What /detect and /count used to do on every request
+        plays = [p for p in database if str(p['game_id']) == str(match_id)]
+        plays.sort(key=lambda x: x['timestamp'])
+
+        assert level.match_count(match_id) == len(plays)
+        for i in (0, len(plays) // 2, len(plays) - 1):
+            if plays:
+                assert level.match_play(match_id, i) == plays[i]
+        assert level.match_play(match_id, len(plays)) is None
+        assert level.match_play(match_id, -1) is None
+
+def test_columnar_levels():
+    print("--- Pattern Matcher V3: columnar levels ---")
+    rng = np.random.default_rng(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        entries = {length: make_level(3000, length, rng) for length in (1, 4)}
+        for length, level_entries in entries.items():
+            with open(os.path.join(tmp, f'fingerprints_{length}pass.pkl'), 'wb') as f:
+                pickle.dump(level_entries, f)
+
+        # First start converts the pickles, next starts only map the columns
+        start = time.time()
+        converted = FingerprintDatabaseV3(base_data_dir=tmp)
+        t_convert = time.time() - start
+        for length in entries:
+            os.remove(os.path.join(tmp, f'fingerprints_{length}pass.pkl'))
+            assert sorted(os.listdir(os.path.join(tmp, f'fingerprints_{length}pass'))) == sorted(f'{c}.npy' for c in TABLE_COLUMNS)
+
+        start = time.time()
+        db = FingerprintDatabaseV3(base_data_dir=tmp)
+        t_map = time.time() - start
+        print(f"pickle conversion {t_convert:.3f}s, columnar start {t_map * 1000:.1f}ms")
+
+        for length, level_entries in entries.items():
+            level = db.get_level(length)
+            assert isinstance(level.table['vectors'], np.memmap)
+            assert level.size == len(level_entries)
+            for i in (0, 1234, len(level_entries) - 1):
+                assert level.database[i] == level_entries[i]
+            query = level_entries[42]
+            got = db.find_nearest_neighbors(query, top_k=10, length=length)
+            want = converted.find_nearest_neighbors(query, top_k=10, length=length)
+            db.load_level(length)
+            expected = legacy_find_nearest_neighbors(db, query, top_k=10)
+            assert [r['event_id'] for r in got] == [r['event_id'] for r in want] == [r['event_id'] for r in expected]
+            assert got[0]['data'] == level_entries[got[0]['event_id']]
+
+def make_chains(n_games, rng, max_chain=14):
+    """Synthetic pass chains (same layout as data_processor_v3's pass_list entries)."""
+    chains = []
+    event_id = 0
+    for game in range(n_games):
+        timestamp = 0.0
+        for _ in range(rng.integers(50, 150)):
+            chain = []
+            for _ in range(rng.integers(1, max_chain + 1)):
+                timestamp += float(rng.uniform(1, 10))
+                chain.append({
+                    'game_id': str(1000 + game), 'event_id': event_id, 'timestamp': timestamp,
+                    'start_x': float(rng.uniform(-50, 50)), 'start_y': float(rng.uniform(-30, 30)),
+                    'vector': tuple(rng.normal(0, 15, 2)),
+                    'teammates': [tuple(rng.normal(0, 20, 2)) for _ in range(rng.integers(0, 11))],
+                    'opponents': [tuple(rng.normal(0, 20, 2)) for _ in range(rng.integers(0, 11))],
+                })
+                event_id += 1
+            chains.append(chain)
+    return chains
+
+def legacy_levels(chains, lengths):
+    """Original save_chain_to_dbs: every sliding window copied into its own dict."""
+    dbs = {length: [] for length in lengths}
+    for chain in chains:
+        for length in lengths:
+            for i in range(len(chain) - length + 1):
+                seq = chain[i:i + length]
+                first = seq[0]
+                dbs[length].append({
+                    'game_id': first['game_id'], 'event_id': first['event_id'], 'timestamp': first['timestamp'],
+                    'length': length, 'start_x': first['start_x'], 'start_y': first['start_y'],
+                    'vectors': [s['vector'] for s in seq],
+                    'teammates': first['teammates'], 'opponents': first['opponents'],
+                })
+    return dbs
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def test_shared_pass_table():
+    print("--- Pattern Matcher V3: shared pass table ---")
+    rng = np.random.default_rng(4)
+    chains = make_chains(6, rng)
+    lengths = list(range(1, 13))
+    expected = legacy_levels(chains, lengths)
+    with tempfile.TemporaryDirectory() as tmp:
+        save_table(os.path.join(tmp, 'passes'), chains_to_table(chains))
+        pickle_bytes = sum(len(pickle.dumps(expected[length])) for length in range(1, 11))
+        print(f"ten level pickles {pickle_bytes / 1e6:.1f}MB, pass table {directory_size(os.path.join(tmp, 'passes')) / 1e6:.1f}MB")
+
+        db = FingerprintDatabaseV3(base_data_dir=tmp)
+        # Lengths beyond the ten preloaded levels come from the same table
+        for length in lengths:
+            level = db.get_level(length)
+            assert level.table is db.get_level(1).table
+            assert len(level.database) == len(expected[length])
+            assert list(level.database) == expected[length]
+
+        # Same neighbours as the loop over copied entries
+        for length in (1, 4, 11):
+            db.load_level(length)
+            for q in rng.integers(len(expected[length]), size=3):
+                query = expected[length][q]
+                got = db.find_nearest_neighbors(query, top_k=10)
+                want = legacy_find_nearest_neighbors(db, query, top_k=10)
+                assert [r['event_id'] for r in got] == [r['event_id'] for r in want]
+                assert np.allclose([r['distance'] for r in got], [r['distance'] for r in want])
+
+        # Per-match index over the shared table
+        level = db.get_level(3)
+        for game_id in {e['game_id'] for e in expected[3]}:
+            plays = sorted((e for e in expected[3] if e['game_id'] == game_id), key=lambda e: e['timestamp'])
+            assert level.match_count(game_id) == len(plays)
+            assert level.match_play(game_id, len(plays) - 1) == plays[-1]
+
+def test_served_lengths():
+    print("--- Pattern Matcher V3: served lengths and resident levels ---")
+    rng = np.random.default_rng(7)
+    chains = make_chains(2, rng, max_chain=14)
+    longest = max(len(chain) for chain in chains)
+    with tempfile.TemporaryDirectory() as tmp:
+        assert FingerprintDatabaseV3(base_data_dir=tmp).max_length == 0
+        save_table(os.path.join(tmp, 'passes'), chains_to_table(chains))
+        db = FingerprintDatabaseV3(base_data_dir=tmp, max_levels=4)
+        assert db.max_length == longest
+        for length in (0, -1, longest + 1):
+            try:
+                db.get_level(length)
+            except ValueError:
+                continue
+            raise AssertionError(f"level {length} served")
+
+        # At most max_levels levels resident, least recently used dropped first
+        for length in range(1, longest + 1):
+            assert db.get_level(length).size > 0
+            assert len(db._levels) <= 4
+        assert list(db._levels) == list(range(longest - 3, longest + 1))
+
+def test_two_stage_search():
+    print("--- Pattern Matcher V3: two-stage search ---")
+    rng = np.random.default_rng(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        save_table(os.path.join(tmp, 'passes'), chains_to_table(make_chains(10, rng)))
+        db = FingerprintDatabaseV3(base_data_dir=tmp)
+        db.load_level(2)
+        entries = list(db.database)
+
+        for q in rng.integers(len(entries), size=5):
+            query = entries[q]
+            # Exact whatever the weights: the vector bound never drops a top_k entry
+            for w_player in (0.2, 2.0):
+                got = db.find_nearest_neighbors(query, top_k=10, w_player=w_player, batch_size=64)
+                want = legacy_find_nearest_neighbors(db, query, top_k=10, w_player=w_player)
+                assert [r['event_id'] for r in got] == [r['event_id'] for r in want]
+
+            # Candidate budget: the top_k among the best vector matches only
+            d_vec = db.get_level(2).vector_distance(np.array(query['vectors']))
+            others = [i for i in np.argsort(d_vec, kind='stable') if entries[i] != query]
+            budget = {entries[i]['event_id'] for i in others[:200]}
+            got = db.find_nearest_neighbors(query, top_k=10, max_candidates=200)
+            want = [r for r in legacy_find_nearest_neighbors(db, query, top_k=len(entries)) if r['event_id'] in budget]
+            assert [r['event_id'] for r in got] == [r['event_id'] for r in want[:10]]
+            exact = {r['event_id'] for r in db.find_nearest_neighbors(query, top_k=10)}
+            print(f"budget 200 of {len(entries)}: recall {len(exact & {r['event_id'] for r in got}) / 10:.1f}")
+
+            # Start zone
+            inside = {e['event_id'] for e in entries
+                      if (e['start_x'] - query['start_x']) ** 2 + (e['start_y'] - query['start_y']) ** 2 <= 15 ** 2}
+            got = db.find_nearest_neighbors(query, top_k=10, zone_radius=15)
+            want = [r for r in legacy_find_nearest_neighbors(db, query, top_k=len(entries)) if r['event_id'] in inside]
+            assert [r['event_id'] for r in got] == [r['event_id'] for r in want[:10]]
+
+def test_vector_index():
+    print("--- Pattern Matcher V3: KD-tree candidates ---")
+    rng = np.random.default_rng(6)
+    with tempfile.TemporaryDirectory() as tmp:
+        save_table(os.path.join(tmp, 'passes'), chains_to_table(make_chains(20, rng)))
+        db = FingerprintDatabaseV3(base_data_dir=tmp)
+        # Trees are only built for indexed queries, and then count in nbytes
+        assert all(db.get_level(length)._tree is None for length in range(1, db.max_length + 1))
+        for length in (1, 3, 6):
+            level = db.get_level(length)
+            base_bytes = level.nbytes
+            recall = []
+            for q in rng.integers(level.size, size=10):
+                query = level.database[q]
+                budget = db.find_nearest_neighbors(query, top_k=10, length=length, max_candidates=300)
+                start = time.time()
+                indexed = db.find_nearest_neighbors(query, top_k=10, length=length, max_candidates=300, use_index=True)
+                elapsed = time.time() - start
+                assert query['event_id'] not in [r['event_id'] for r in indexed]
+                assert len(indexed) == 10
+                if length == 1:
+                    # One pass: the flattened distance is the vector distance itself
+                    assert [r['event_id'] for r in indexed] == [r['event_id'] for r in budget]
+                exact = {r['event_id'] for r in db.find_nearest_neighbors(query, top_k=10, length=length)}
+                recall.append(len(exact & {r['event_id'] for r in indexed}) / 10)
+            print(f"L{length} ({level.size} entries): indexed search {elapsed * 1000:.1f}ms, recall {np.mean(recall):.2f}")
+            assert level._tree is not None and level.nbytes >= base_bytes + level.tree.data.nbytes
+
+        # Building a tree can push the resident levels over the budget: the least recently used goes
+        small = FingerprintDatabaseV3(base_data_dir=tmp, preload=False)
+        small.memory_budget = small.get_level(1).nbytes + small.get_level(2).nbytes
+        assert list(small._levels) == [1, 2]
+        small.find_nearest_neighbors(small.get_level(2).database[0], length=2, max_candidates=50, use_index=True)
+        assert list(small._levels) == [2]
+
+if __name__ == "__main__":
+    test_vectorized_neighbors_match_loop()
+    test_levels_stay_resident()
+    test_match_index_matches_scan()
+    test_columnar_levels()
+    test_shared_pass_table()
+    test_served_lengths()
+    test_two_stage_search()
+    test_vector_index()
@@ -0,0 +1,67 @@
+import sys
+import os
+import tempfile
+import numpy as np
+import soundfile as sf
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.audio_processor import AudioProcessor
+from api.services.audio_processor_v2 import AudioProcessorV2
+from api.services.feature_index import FeatureIndex
+from api.services.pcm_cache import PCMCache
+
+class CountingPCMCache(PCMCache):
+    """PCM cache that counts how often songs are actually decoded."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.decodes = 0
+
+    def store(self, *args, **kwargs):
+        self.decodes += 1
+        return super().store(*args, **kwargs)
+
+def generate_tone(freq, duration, sr=44100):
+    t = np.linspace(0, duration, int(sr * duration), endpoint=False)
+    return 0.5 * np.sin(2 * np.pi * freq * t)
+
+def test_pcm_cache_shared_between_versions():
+    print("--- Testing PCM Cache ---")
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_dir = os.path.join(tmp, 'songs')
+        os.makedirs(songs_dir)
+        song_path = os.path.join(songs_dir, 'melody.wav')
+        song = np.concatenate([generate_tone(f, 0.5) for f in [261, 329, 392, 523]])
+        sf.write(song_path, song, 44100)
+
+        pcm = CountingPCMCache(songs_dir, os.path.join(tmp, 'pcm'))
+        index = FeatureIndex(songs_dir, os.path.join(tmp, 'index'), pcm_cache=pcm)
+
+        # Two versions, one decode; features identical to decoding directly
+        v0, v2 = AudioProcessor(), AudioProcessorV2()
+        chroma = index.get_features('v0', v0, 'melody.wav')
+        pitch = index.get_features('v2', v2, 'melody.wav')
+        assert pcm.decodes == 1
+        assert np.allclose(chroma, v0.extract_features(v0.load_audio(song_path)))
+        assert np.allclose(pitch, v2.extract_features(v2.load_audio(song_path)))
+
+        # Memory-mapped, resampled to 22050 Hz
+        signal = pcm.load('melody.wav')
+        assert isinstance(signal, np.memmap) and signal.dtype == np.float32
+        assert abs(len(signal) - 2.0 * 22050) <= 1
+
+        # A new process reuses the cache
+        reopened = CountingPCMCache(songs_dir, os.path.join(tmp, 'pcm'))
+        reopened.load('melody.wav')
+        assert reopened.decodes == 0
+
+        # Changing the song invalidates it
+        sf.write(song_path, song[::-1], 44100)
+        reopened.load('melody.wav')
+        assert reopened.decodes == 1
+        print("PCM cache OK")
+
+if __name__ == "__main__":
+    test_pcm_cache_shared_between_versions()
@@ -0,0 +1,105 @@
+import sys
+import os
+import time
+import tempfile
+import numpy as np
+import soundfile as sf
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.audio_processor import AudioProcessor
+from api.services.audio_processor_v1 import AudioProcessorV1
+from api.services.audio_processor_v2 import AudioProcessorV2
+from api.services.audio_processor_v3 import AudioProcessorV3
+from api.services.feature_index import FeatureIndex
+from api.services import scoring_pool
+from api.services.scoring_pool import ScoringPool
+
+def generate_tone(freq, duration, sr=22050):
+    t = np.linspace(0, duration, int(sr * duration), endpoint=False)
+    return 0.5 * np.sin(2 * np.pi * freq * t)
+
+def test_pool_matches_sequential():
+    print("--- Testing Parallel Scoring Pool ---")
+    sr = 22050
+    ap = AudioProcessorV2()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_dir = os.path.join(tmp, 'songs')
+        os.makedirs(songs_dir)
+        song_files = []
+        for i in range(4):
+            notes = rng.choice([261, 293, 329, 349, 392, 440, 493, 523], size=12)
+            song = np.concatenate([generate_tone(f, 0.3, sr) for f in notes])
+            song_files.append(f'song_{i}.wav')
+            sf.write(os.path.join(songs_dir, song_files[-1]), song, sr)
+        hum = np.concatenate([generate_tone(f, 0.35, sr) for f in [329, 392, 440, 392]])
+
+        # Sequential reference
+        sequential_index = FeatureIndex(songs_dir, os.path.join(tmp, 'index_seq'))
+        expected = {s: ap.compare_with_reference(hum, sequential_index.get_features('v2', ap, s))
+                    for s in song_files}
+
+        index = FeatureIndex(songs_dir, os.path.join(tmp, 'index_pool'))
+        pool = ScoringPool(2)
+        try:
+            # Cold: workers extract, the index stores
+            snapshots = {s: index.snapshot(s) for s in song_files}
+            for song_file, features, _ in pool.extract(ap, songs_dir, song_files):
+                index.store('v2', song_file, features, snapshots[song_file])
+            locations = [(s,) + index.locate('v2', s) for s in song_files]
+
+            for attempt in ('cold', 'warm'):
+                start = time.time()
+                scored = {s: (sim, sec) for s, sim, sec in pool.score(ap, ap.extract_features(hum), locations)}
+                print(f"{attempt}: {time.time() - start:.3f}s, per song {[round(v[1], 3) for v in scored.values()]}")
+                assert {s: v[0] for s, v in scored.items()} == expected
+        finally:
+            pool.shutdown()
+
+def test_query_features_extracted_once():
+    print("--- Testing score_features on precomputed hum features ---")
+    sr = 22050
+    hum = np.concatenate([generate_tone(f, 0.35, sr) for f in [329, 392, 440, 392]])
+    song = np.concatenate([generate_tone(f, 0.3, sr) for f in [261, 329, 392, 440, 392, 329]])
+    for ap in (AudioProcessor(), AudioProcessorV1(), AudioProcessorV2(), AudioProcessorV3()):
+        reference = ap.extract_features(song)
+        expected = ap.compare_with_reference(hum, reference)
+        similarity = ap.score_features(ap.extract_features(hum), reference)
+        print(f"{type(ap).__name__}: {similarity}")
+        assert similarity == expected
+
+def test_worker_cache_is_bounded():
+    print("--- Testing the worker feature cache bound ---")
+    budget = scoring_pool.WORKER_CACHE_BYTES
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(5):
+            paths.append(os.path.join(tmp, f'song_{i}.npy'))
+            np.save(paths[-1], np.full(1000, float(i))) # 8000 bytes each
+        scoring_pool.WORKER_CACHE_BYTES = 3 * 8000
+        try:
+            for path in paths[:3]:
+                scoring_pool._load_reference(path, 'sha')
+            scoring_pool._load_reference(paths[0], 'sha') # Used again: most recent
+            for path in paths[3:]:
+                scoring_pool._load_reference(path, 'sha')
+            assert list(scoring_pool._worker_features) == [paths[0], paths[3], paths[4]]
+            assert scoring_pool._worker_bytes == 3 * 8000
+
+            # A changed song replaces its entry, the size is not counted twice
+            np.save(paths[0], np.full(500, 9.0))
+            assert scoring_pool._load_reference(paths[0], 'new sha')[0] == 9.0
+            assert scoring_pool._worker_bytes == 2 * 8000 + 4000
+        finally:
+            scoring_pool.WORKER_CACHE_BYTES = budget
+            scoring_pool._worker_features.clear()
+            scoring_pool._worker_bytes = 0
+
+if __name__ == "__main__":
+    test_pool_matches_sequential()
+    test_query_features_extracted_once()
+    test_worker_cache_is_bounded()
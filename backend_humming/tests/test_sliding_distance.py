@@ -0,0 +1,77 @@
+import sys
+import os
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.sliding_distance import distance_profiles, rank_references, z_normalize
+
+def zscore(x):
+    return (x - np.mean(x)) / np.std(x)
+
+def make_catalogue(n_songs, length, rng):
+    """Note sequences (random steps and durations), z-normalized like the V3 features."""
+    songs = {}
+    for i in range(n_songs):
+        notes = np.cumsum(rng.integers(-4, 5, size=length // 8)).astype(float)
+        durations = rng.integers(8, 30, size=len(notes))
+        songs[f'song_{i}'] = zscore(np.repeat(notes, durations)[:length])
+    return songs
+
+def hum_excerpt(song, start, length, stretch, rng):
+    """Excerpt of a song sung `stretch` times slower, with pitch noise and its own normalization."""
+    excerpt = song[start:start + length]
+    n_frames = int(length * stretch)
+    hum = np.interp(np.linspace(0, length - 1, n_frames), np.arange(length), excerpt)
+    return zscore(hum + rng.normal(0, 0.05, n_frames))
+
+def test_profile_matches_brute_force():
+    print("--- Sliding distance: FFT profile vs brute force ---")
+    rng = np.random.default_rng(0)
+    reference = np.cumsum(rng.normal(0, 1, 2000))
+    reference[300:400] = 1.5 # held note: constant windows
+    for m in (10, 64, 150):
+        query = z_normalize(rng.normal(0, 1, m))
+        profile = distance_profiles([query], reference)[0]
+
+        windows = sliding_window_view(reference, m)
+        std = windows.std(axis=1)
+        flat = std < 1e-4 * np.std(reference)
+        z = (windows - windows.mean(axis=1, keepdims=True)) / np.where(flat, 1.0, std)[:, None]
+        expected = np.linalg.norm(z - query, axis=1) / np.sqrt(m)
+        expected[flat] = np.sqrt(2)
+        assert profile.shape == expected.shape
+        assert np.allclose(profile, expected, atol=1e-9)
+
+def test_tempo_bank_retrieval():
+    print("--- Sliding distance: tempo-aware pre-ranking ---")
+    rng = np.random.default_rng(1)
+    songs = make_catalogue(300, 1500, rng)
+    references = list(songs.items())
+
+    hits = 0
+    trials = [(f'song_{i}', int(rng.integers(0, 1200)), stretch)
+              for i, stretch in zip(range(0, 300, 30), (0.7, 0.8, 0.9, 1.0, 1.1, 1.25, 1.4, 1.6, 0.65, 1.5))]
+    start = time.time()
+    for name, offset, stretch in trials:
+        hum = hum_excerpt(songs[name], offset, 120, stretch, rng)
+        ranked = rank_references(hum, references, max_candidates=10)
+        assert len(ranked) == 10
+        top = [key for key, _, _, _ in ranked]
+        if name in top:
+            hits += 1
+            _, _, match_start, match_length = ranked[top.index(name)]
+            # The closest window lies on the excerpt, at roughly its tempo
+            assert abs(match_start - offset) <= 20
+            assert abs(match_length - 120) <= 30
+    print(f"{hits}/{len(trials)} hums found in the top 10, "
+          f"{(time.time() - start) / len(trials):.3f}s per query over {len(songs)} songs")
+    assert hits >= len(trials) - 1
+
+if __name__ == "__main__":
+    test_profile_matches_brute_force()
+    test_tempo_bank_retrieval()
@@ -0,0 +1,138 @@
+import sys
+import os
+import io
+import time
+import tempfile
+import numpy as np
+import soundfile as sf
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.audio_processor import AudioProcessor
+from api.services.audio_processor_v2 import AudioProcessorV2
+from api.services.audio_processor_v3 import AudioProcessorV3
+from api.services.song_search import SongSearchEngine
+from api.services.feature_index import FeatureIndex
+from api.services.pcm_cache import PCMCache
+from api.services.upload_decoder import decode_upload
+
+def random_contour(rng, length):
+    """Piecewise-constant 'melody' in semitones, like a pitch contour."""
+    notes = np.cumsum(rng.integers(-3, 4, size=length // 20 + 1))
+    return np.repeat(notes, 20)[:length].astype(np.float64)
+
+def random_chroma(rng, length):
+    chroma = rng.random((12, length)) ** 4
+    return chroma / np.linalg.norm(chroma, axis=0, keepdims=True)
+
+def make_catalogue(rng, kind, n_songs=25):
+    if kind == 'chroma':
+        songs = [random_chroma(rng, int(rng.integers(600, 1200))) for _ in range(n_songs)]
+        # Hum an excerpt of song 7, stretched by 1.2x and transposed by 5 keys
+        excerpt = songs[7][:, 300:420]
+        hum = np.roll(np.repeat(excerpt, [1, 1, 1, 1, 2] * 24, axis=1), 5, axis=0)
+        return hum, songs
+    songs = [random_contour(rng, int(rng.integers(600, 1200))) for _ in range(n_songs)]
+    if kind == 'zscore':
+        songs = [(s - s.mean()) / s.std() for s in songs]
+    else:
+        songs = [s - s.mean() for s in songs]
+    excerpt = songs[7][300:420]
+    hum = np.repeat(excerpt, [1, 1, 1, 1, 2] * 24) + rng.normal(0, 0.05, 144)
+    return hum, songs
+
+def test_cascade_matches_exhaustive():
+    print("--- Lower-bound Cascade vs Exhaustive Search ---")
+    rng = np.random.default_rng(0)
+
+    for name, processor, kind in [
+        ("V0 (chroma)", AudioProcessor(), 'chroma'),
+        ("V2 (contour)", AudioProcessorV2(), 'contour'),
+        ("V3 (z-score)", AudioProcessorV3(), 'zscore'),
+    ]:
+        hum, songs = make_catalogue(rng, kind)
+        references = [(f"song_{i}", s) for i, s in enumerate(songs)]
+
+        for top_k in [1, 5, 10]:
+            engine = SongSearchEngine(processor, top_k=top_k)
+
+            start = time.time()
+            exhaustive = engine.search(hum, references, exhaustive=True)
+            t_exhaustive = time.time() - start
+
+            start = time.time()
+            cascade = engine.search(hum, references)
+            t_cascade = time.time() - start
+
+            assert [k for k, _ in cascade] == [k for k, _ in exhaustive]
+            assert np.allclose([c for _, c in cascade], [c for _, c in exhaustive])
+            print(f"{name} top-{top_k}: exhaustive {t_exhaustive:.3f}s, cascade {t_cascade:.3f}s, "
+                  f"stats {engine.last_stats}")
+
+        # The hummed song comes out on top
+        assert exhaustive[0][0] == "song_7"
+
+def tone_melody(rng, n_notes, sr=22050):
+    """Random melody of 0.25 s sine notes."""
+    freqs = 220.0 * 2 ** (rng.integers(0, 24, size=n_notes) / 12)
+    t = np.arange(int(0.25 * sr)) / sr
+    return np.concatenate([0.5 * np.sin(2 * np.pi * f * t) for f in freqs])
+
+def detect(client, wav, search):
+    response = client.post('/api/v1/songs/detect', content_type='multipart/form-data',
+                           data={'audio_data': (io.BytesIO(wav), 'hum.wav'), 'version': 'v2', 'search': search})
+    assert response.status_code == 200
+    return [(r['song_name'], r['similarity_index']) for r in response.get_json()['results']]
+
+def test_route_cascade_against_exhaustive():
+    print("--- search=cascade vs search=exhaustive through the route ---")
+    from api import create_app
+    import api.routes.songs as songs_route
+
+    sr = 22050
+    rng = np.random.default_rng(1)
+    saved = (songs_route.SONGS_DB_FOLDER, songs_route.feature_index, songs_route.pcm_cache)
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_dir = os.path.join(tmp, 'songs')
+        os.makedirs(songs_dir)
+        songs = [tone_melody(rng, int(rng.integers(40, 80))) for _ in range(30)]
+        for i, song in enumerate(songs):
+            sf.write(os.path.join(songs_dir, f'song_{i:02d}.wav'), song, sr)
+        buf = io.BytesIO()
+        sf.write(buf, songs[7][2 * sr:6 * sr], sr, format='WAV')
+
+        pcm_cache = PCMCache(songs_dir, os.path.join(tmp, 'pcm'))
+        index = FeatureIndex(songs_dir, os.path.join(tmp, 'index'), pcm_cache=pcm_cache)
+        songs_route.SONGS_DB_FOLDER = songs_dir
+        songs_route.pcm_cache = pcm_cache
+        songs_route.feature_index = index
+        try:
+            client = create_app().test_client()
+            exhaustive = detect(client, buf.getvalue(), 'exhaustive')
+            cascade = detect(client, buf.getvalue(), 'cascade')
+        finally:
+            songs_route.SONGS_DB_FOLDER, songs_route.feature_index, songs_route.pcm_cache = saved
+
+        # score_features on every song, what search=exhaustive ranks by
+        ap = AudioProcessorV2()
+        query = ap.extract_features(decode_upload(io.BytesIO(buf.getvalue()), 'wav', ap, tmp))
+        scored = sorted(((-ap.score_features(query, index.get_features('v2', ap, f'song_{i:02d}.wav')), f'song_{i:02d}.wav')
+                         for i in range(len(songs))))
+        expected = [(song, -neg_similarity) for neg_similarity, song in scored]
+
+    assert exhaustive == expected[:10]
+    # The cascade shortlist is approximate (best-end cost, see RESCORE_CANDIDATES):
+    # it may miss songs of the exhaustive top-10, but every similarity it returns is
+    # the exhaustive one, in the exhaustive order
+    shortlisted = dict(cascade)
+    assert len(cascade) == 10
+    assert cascade == [entry for entry in expected if entry[0] in shortlisted]
+
+    found = len(set(dict(exhaustive)) & set(shortlisted))
+    print(f"cascade returned {found} of the exhaustive top-10")
+
+if __name__ == "__main__":
+    test_cascade_matches_exhaustive()
+    test_route_cascade_against_exhaustive()
@@ -0,0 +1,84 @@
+import sys
+import os
+import io
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.audio_processor import AudioProcessor
+from api.services.upload_decoder import decode_upload, UploadTooLarge, UploadDecodeError
+
+def generate_tone(freq, duration, sr=44100):
+    t = np.linspace(0, duration, int(sr * duration), endpoint=False)
+    return 0.5 * np.sin(2 * np.pi * freq * t)
+
+def test_upload_decoding_paths():
+    print("--- Testing Upload Decoding ---")
+    ap = AudioProcessor()
+    with tempfile.TemporaryDirectory() as tmp:
+        # 44.1 kHz upload, so the decode path has to resample as well
+        path = os.path.join(tmp, 'hum.wav')
+        sf.write(path, generate_tone(440, 1.0), 44100)
+        with open(path, 'rb') as f:
+            data = f.read()
+        expected = ap.load_audio(path)
+
+        spill_dir = os.path.join(tmp, 'spill')
+        os.makedirs(spill_dir)
+
+        # Small upload: decoded from memory, nothing touches the spill folder
+        in_memory = decode_upload(io.BytesIO(data), 'wav', ap, spill_dir)
+        assert np.allclose(in_memory, expected)
+
+        # Large upload: spilled to a unique file that is removed afterwards
+        spilled = decode_upload(io.BytesIO(data), 'wav', ap, spill_dir, memory_limit=1024)
+        assert np.allclose(spilled, expected)
+        assert os.listdir(spill_dir) == []
+
+        # Over the hard limit
+        for memory_limit in (1024, len(data)):
+            try:
+                decode_upload(io.BytesIO(data), 'wav', ap, spill_dir, memory_limit=memory_limit, max_bytes=2048)
+                assert False, "expected UploadTooLarge"
+            except UploadTooLarge:
+                pass
+        assert os.listdir(spill_dir) == []
+
+        # Undecodable bytes surface as the processor's ValueError
+        try:
+            decode_upload(io.BytesIO(b'not audio' * 100), 'wav', ap, spill_dir)
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+        assert os.listdir(spill_dir) == []
+        print("Upload decoding OK")
+
+def test_ffmpeg_timeout():
+    print("--- Testing Upload Decoding: ffmpeg timeout ---")
+    if os.name == 'nt':
+        return
+    ap = AudioProcessor()
+    with tempfile.TemporaryDirectory() as tmp:
+        # An 'ffmpeg' that hangs, first on the PATH
+        with open(os.path.join(tmp, 'ffmpeg'), 'w') as f:
+            f.write('#!/bin/sh\nsleep 10\n')
+        os.chmod(os.path.join(tmp, 'ffmpeg'), 0o755)
+        path = os.environ['PATH']
+        os.environ['PATH'] = tmp + os.pathsep + path
+        try:
+            start = time.time()
+            decode_upload(io.BytesIO(b'webm bytes'), 'webm', ap, tmp, ffmpeg_timeout=0.5)
+            assert False, "expected UploadDecodeError"
+        except UploadDecodeError:
+            assert time.time() - start < 5
+        finally:
+            os.environ['PATH'] = path
+
+if __name__ == "__main__":
+    test_upload_decoding_paths()
+    test_ffmpeg_timeout()
@@ -11,6 +11,7 @@ sys.path.append(current_dir)
 from api.services.audio_processor import AudioProcessor
 from api.services.audio_processor_v1 import AudioProcessorV1
 from api.services.audio_processor_v2 import AudioProcessorV2
+from api.services.audio_processor_v3 import AudioProcessorV3
 
 def generate_tone(freq, duration, sr=22050):
     t = np.linspace(0, duration, int(sr * duration), endpoint=False)
@@ -62,5 +63,59 @@ def test_speed():
     print(f"V1 Self-Score: {score_v1}%")
     print(f"V2 Self-Score: {score_v2}%")
 
+def legacy_dominant_pitch_v2(pitches, magnitudes):
+    """Original per-frame loop from AudioProcessorV2 (kept as the benchmark baseline)."""
+    pitch_contour = []
+    for t in range(magnitudes.shape[1]):
+        index = magnitudes[:, t].argmax()
+        pitch = pitches[index, t]
+        if pitch > 0:
+             pitch_contour.append(pitch)
+    return np.array(pitch_contour)
+
+def legacy_dominant_pitch_v3(pitches, magnitudes):
+    """Original per-frame loop from AudioProcessorV3 (kept as the benchmark baseline)."""
+    pitch_contour = []
+    mag_threshold = np.max(magnitudes) * 0.10
+    for t in range(magnitudes.shape[1]):
+        index = magnitudes[:, t].argmax()
+        pitch = pitches[index, t]
+        mag = magnitudes[index, t]
+        if pitch > 0 and mag > mag_threshold:
+             pitch_contour.append(pitch)
+        else:
+             pitch_contour.append(0)
+    return np.array(pitch_contour)
+
+def test_dominant_pitch_vectorized():
+    print("--- Dominant Pitch: Loop vs Vectorized ---")
+    sr = 22050
+    melody = [261, 329, 392, 523, 659]
+    
+    for duration in [5, 60, 300]:
+        # Repeat the 5 note melody (1s per note) and add a little noise
+        audio = np.concatenate([generate_tone(melody[i % 5], 1.0, sr) for i in range(duration)])
+        audio = audio + np.random.normal(0, 0.01, audio.shape)
+        
+        for name, kwargs, legacy, fast in [
+            ("V2", {}, legacy_dominant_pitch_v2,
+             lambda p, m: (lambda c: c[c > 0])(AudioProcessorV2.dominant_pitch(p, m))),
+            ("V3", {'fmin': 80, 'fmax': 1000}, legacy_dominant_pitch_v3, AudioProcessorV3.dominant_pitch),
+        ]:
+            pitches, magnitudes = librosa.piptrack(y=audio, sr=sr, **kwargs)
+            
+            start = time.time()
+            old = legacy(pitches, magnitudes)
+            t_old = time.time() - start
+            
+            start = time.time()
+            new = fast(pitches, magnitudes)
+            t_new = time.time() - start
+            
+            assert np.array_equal(old, new)
+            print(f"{name} {duration:>3}s ({magnitudes.shape[1]} frames): "
+                  f"loop {t_old:.4f}s, vectorized {t_new:.4f}s ({t_old / max(t_new, 1e-9):.0f}x)")
+
 if __name__ == "__main__":
     test_speed()
+    test_dominant_pitch_vectorized()
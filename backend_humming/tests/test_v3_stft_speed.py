@@ -0,0 +1,78 @@
+import sys
+import os
+import time
+import numpy as np
+import librosa
+from scipy.ndimage import median_filter
+from scipy.signal import medfilt
+
+# Adjust path to find src/backend
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+from api.services.audio_processor_v3 import AudioProcessorV3
+from api.services.harmonic_pitch import median_filter_axis, harmonic_magnitude
+
+SONGS_DIR = os.path.join(current_dir, 'data', 'songs')
+
+def legacy_pitch_contour_v3(ap, signal):
+    """Original AudioProcessorV3 pipeline: hpss back to audio, then a second STFT in piptrack."""
+    y_harmonic, _ = librosa.effects.hpss(signal)
+    pitches, magnitudes = librosa.piptrack(y=y_harmonic, sr=ap.sample_rate, fmin=80, fmax=1000)
+    pitch_contour = ap.dominant_pitch(pitches, magnitudes)
+    pitch_contour = np.trim_zeros(medfilt(pitch_contour, kernel_size=5))
+    pitch_contour = pitch_contour[pitch_contour > 0]
+    if len(pitch_contour) < 10:
+        return np.array([])
+    std_val = np.std(pitch_contour)
+    return (pitch_contour - np.mean(pitch_contour)) / (std_val if std_val > 0 else 1.0)
+
+def test_median_filter_matches_scipy():
+    print("--- Sliding median vs scipy.ndimage.median_filter ---")
+    rng = np.random.default_rng(0)
+    S = rng.random((300, 200)).astype(np.float32)
+    S[S < 0.4] = 0.0 # repeated values
+    assert np.array_equal(median_filter_axis(S, 31, axis=1), median_filter(S, size=(1, 31), mode='reflect'))
+    assert np.array_equal(median_filter_axis(S, 31, axis=0), median_filter(S, size=(31, 1), mode='reflect'))
+
+def test_harmonic_magnitude_matches_hpss():
+    print("--- Spectral HPSS mask vs librosa.decompose.hpss ---")
+    sr = 22050
+    t = np.linspace(0, 3, 3 * sr, endpoint=False)
+    signal = 0.5 * np.sin(2 * np.pi * 220 * t) + 0.1 * np.random.default_rng(1).normal(size=len(t))
+    D = librosa.stft(signal)
+    harmonic, _ = librosa.decompose.hpss(D)
+    assert np.allclose(harmonic_magnitude(np.abs(D)), np.abs(harmonic), rtol=1e-5, atol=1e-6)
+
+def test_single_stft_speed():
+    print("--- V3 pitch contour: single STFT vs hpss round trip ---")
+    ap = AudioProcessorV3()
+    songs = sorted(os.listdir(SONGS_DIR)) if os.path.isdir(SONGS_DIR) else []
+    if songs:
+        signal = ap.load_audio(os.path.join(SONGS_DIR, songs[0])) # full-length song
+    else:
+        sr = ap.sample_rate
+        t = np.linspace(0, 60, 60 * sr, endpoint=False)
+        signal = 0.5 * np.sin(2 * np.pi * (220 + 40 * np.sin(t)) * t)
+    ap.extract_pitch_contour(signal[:ap.sample_rate]) # numba warm-up
+
+    start = time.time()
+    expected = legacy_pitch_contour_v3(ap, signal)
+    t_legacy = time.time() - start
+
+    start = time.time()
+    contour = ap.extract_pitch_contour(signal)
+    t_new = time.time() - start
+
+    n = min(len(contour), len(expected))
+    corr = np.corrcoef(contour[:n], expected[:n])[0, 1]
+    print(f"{len(signal) / ap.sample_rate:.0f}s of audio: hpss + piptrack {t_legacy:.2f}s, "
+          f"single STFT {t_new:.2f}s ({t_legacy / t_new:.1f}x), {len(contour)} vs {len(expected)} frames, corr {corr:.3f}")
+    assert t_new < t_legacy
+    assert abs(len(contour) - len(expected)) <= 0.05 * len(expected)
+    assert corr > 0.9
+
+if __name__ == "__main__":
+    test_median_filter_matches_scipy()
+    test_harmonic_magnitude_matches_hpss()
+    test_single_stft_speed()